@@ -0,0 +1,113 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+from downloads import MAX_FILE_SIZE
+from scheduler import OPERATION_COSTS, DEFAULT_COST
+
+# Decides, from what Telegram tells us about a file, whether a job is worth
+# starting at all, and how: rejected, cut down to its first pages, or sent
+# to the low-priority queue when it would tie up the workers for a while.
+
+# Admission configuration
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", 2000))
+PDF2TEXT_MAX_PAGES = int(os.getenv("PDF2TEXT_MAX_PAGES", 1000))
+OCRPDF_MAX_PAGES = int(os.getenv("OCRPDF_MAX_PAGES", 100))
+MAX_IMAGE_SIZE = int(float(os.getenv("MAX_IMAGE_SIZE_MB", 10)) * 1024 * 1024)
+HEAVY_JOB_COST = float(os.getenv("HEAVY_JOB_COST", 30))
+
+# Estimated cost of a job, in the scheduler's units, per MB of input on top of
+# the operation's fixed cost
+COST_PER_MB = {
+    "pdf2text": 0.5,
+    "ocrpdf": 6,
+    "pdf2img": 3,
+    "compress": 2,
+    "ocr": 2,
+    "img2pdf": 0.5,
+    "docx2pdf": 1,
+    "text2pdf": 1,
+}
+
+# What each operation accepts: a description for replies and MIME type prefixes.
+# Telegram passes on what the sender's client claims, so missing and generic
+# types are let through.
+PDF_FILE = ("a PDF", ("application/pdf", "application/x-pdf"))
+IMAGE_FILE = ("an image", ("image/",))
+OPERATION_MIME_TYPES = {
+    "pdf2text": PDF_FILE,
+    "ocrpdf": PDF_FILE,
+    "pdf2img": PDF_FILE,
+    "compress": PDF_FILE,
+    "upload": PDF_FILE,
+    # DOCX files are zip archives, and some clients say so
+    "docx2pdf": ("a DOCX file", ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "application/zip")),
+    "text2pdf": ("a text file", ("text/",)),
+    "ocr": IMAGE_FILE,
+    "img2pdf": IMAGE_FILE,
+}
+GENERIC_MIME_TYPES = ("application/octet-stream", "binary/octet-stream")
+
+# Operations that can be cut down to the first pages of a long PDF
+PAGE_LIMITS = {
+    "pdf2text": PDF2TEXT_MAX_PAGES,
+    "ocrpdf": OCRPDF_MAX_PAGES,
+}
+
+# The size and MIME type of a file a job will download, as Telegram reports them
+IncomingFile = Tuple[Optional[int], Optional[str]]
+
+class AdmissionError(Exception):
+    """A job was turned away before any work was done on it."""
+
+@dataclass
+class Admission:
+    operation: str
+    cost: float
+    low_priority: bool = False
+    # How the job was let in, for metrics; handlers update it when they cut a job down
+    decision: str = "accepted"
+
+def estimate_cost(operation: str, file_size: Optional[int]) -> float:
+    """Expected cost of a job on a file of file_size bytes, in scheduler units."""
+    cost = OPERATION_COSTS.get(operation, DEFAULT_COST)
+    if file_size:
+        cost += COST_PER_MB.get(operation, 0) * file_size / 1024 / 1024
+    return cost
+
+def admit(operation: str, files: Sequence[IncomingFile] = ()) -> Admission:
+    """Check each of a job's files against the size and type limits before anything is downloaded.
+
+    Raises AdmissionError if the job should not run.
+    """
+    if operation == "unsupported":
+        raise AdmissionError("Unsupported file format. Please send a PDF, DOCX, TXT, or image file.")
+    kind, accepted = OPERATION_MIME_TYPES.get(operation, ("a file", None))
+    image = (kind, accepted) == IMAGE_FILE
+    limit = MAX_IMAGE_SIZE if image else MAX_FILE_SIZE
+    for file_size, mime_type in files:
+        if accepted and mime_type and mime_type.lower() not in GENERIC_MIME_TYPES:
+            if not mime_type.lower().startswith(accepted):
+                raise AdmissionError(f"Expected {kind}, but this file is {mime_type}.")
+        if file_size is not None and file_size > limit:
+            raise AdmissionError(
+                f"This file is {file_size / 1024 / 1024:.1f} MB; "
+                f"{'images' if image else 'files'} up to {limit / 1024 / 1024:.0f} MB are supported."
+            )
+
+    cost = estimate_cost(operation, sum(file_size or 0 for file_size, _ in files))
+    low_priority = cost > HEAVY_JOB_COST
+    return Admission(operation, cost, low_priority, "low_priority" if low_priority else "accepted")
+
+def admit_pages(operation: str, pages: int) -> Optional[int]:
+    """Check the number of PDF pages a job would process, once it is known.
+
+    Returns the number of pages the job should be cut down to, or None to
+    process them all. Raises AdmissionError for jobs too long to handle at all.
+    """
+    if pages > MAX_PDF_PAGES:
+        raise AdmissionError(f"That is {pages} pages; up to {MAX_PDF_PAGES} pages can be processed at a time.")
+    limit = PAGE_LIMITS.get(operation)
+    if limit is not None and pages > limit:
+        return limit
+    return None
@@ -0,0 +1,69 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait after the last image of an album before handling it
+ALBUM_DEBOUNCE = float(os.getenv("ALBUM_DEBOUNCE", 2.0))
+
+AlbumHandler = Callable[[List[Update], ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+
+class _Batch:
+    def __init__(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        self.context = context
+        self.updates: List[Update] = []
+        self.timer: asyncio.Task = None
+
+class AlbumCollector:
+    """Collects the images of albums (media groups) sent to a chat into one batch.
+
+    Telegram delivers every album item as its own update and splits more than
+    ten images into several albums, so items from the same chat and user are
+    batched until no new one has arrived for `debounce` seconds. The batch is
+    then passed to `on_complete` in message order.
+    """
+
+    def __init__(self, on_complete: AlbumHandler, debounce: float = ALBUM_DEBOUNCE) -> None:
+        self._on_complete = on_complete
+        self.debounce = debounce
+        self._batches: Dict[Tuple[int, int], _Batch] = {}
+        self._running = set()
+
+    def add(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        key = (update.effective_chat.id, update.effective_user.id)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(context)
+        else:
+            batch.timer.cancel()
+        batch.updates.append(update)
+        batch.timer = asyncio.create_task(self._flush_later(key, batch))
+
+    async def _flush_later(self, key: Tuple[int, int], batch: _Batch) -> None:
+        await asyncio.sleep(self.debounce)
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        # From here on the batch is no longer cancellable by add()
+        task = asyncio.create_task(self._complete(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _complete(self, batch: _Batch) -> None:
+        updates = sorted(batch.updates, key=lambda u: u.effective_message.message_id)
+        try:
+            await self._on_complete(updates, batch.context)
+        except Exception as e:
+            logger.error(f"Error handling album of {len(updates)} items: {e}")
+
+    async def stop(self) -> None:
+        """Drop albums still being collected and wait for those being handled."""
+        for batch in self._batches.values():
+            batch.timer.cancel()
+        self._batches.clear()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
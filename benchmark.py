@@ -0,0 +1,392 @@
+"""Offline benchmarks for the bot's conversion paths.
+
+Each case feeds a synthetic fixture through the real handler with a stubbed
+Update and Bot, so downloads, worker pool round trips and uploads are all
+included but nothing talks to Telegram.
+
+    python benchmark.py                       # all cases, table output
+    python benchmark.py --case pdf2text -n 5  # only matching cases
+    python benchmark.py --json > before.json  # machine-readable results
+
+Peak RSS is the high-water mark of the bot process and of its (finished)
+workers so far; run a single --case to measure one path in isolation.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import statistics
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+import img2pdf
+
+import metrics
+
+WORDS = (
+    "invoice total amount quarterly report summary customer account balance "
+    "payment schedule delivery order reference number agreement section clause"
+).split()
+
+# Fixtures
+
+def make_text_pdf(path: str, pages: int) -> None:
+    rng = random.Random(pages)
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for _ in range(pages):
+        c.setFont("Helvetica", 11)
+        y = height - 50
+        while y > 50:
+            c.drawString(50, y, " ".join(rng.choice(WORDS) for _ in range(12)))
+            y -= 14
+        c.showPage()
+    c.save()
+
+def make_page_image(seed: int, size=(1700, 2200)) -> Image.Image:
+    """A grayscale page with lines of text and some noise, like a 200 DPI scan."""
+    rng = random.Random(seed)
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(100, size[1] - 100, 40):
+        draw.text((100, y), " ".join(rng.choice(WORDS) for _ in range(14)), fill=0)
+    for _ in range(2000):
+        image.putpixel((rng.randrange(size[0]), rng.randrange(size[1])), rng.randrange(128, 255))
+    return image
+
+def make_scanned_pdf(path: str, pages: int) -> None:
+    jpegs = []
+    for page in range(pages):
+        buffer = io.BytesIO()
+        make_page_image(page).save(buffer, "JPEG", quality=90)
+        jpegs.append(buffer.getvalue())
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(img2pdf.convert(jpegs))
+
+def make_photo(path: str, size=(4000, 3000)) -> None:
+    page = make_page_image(0, size).convert("RGB")
+    page.save(path, "JPEG", quality=92)
+
+def make_long_text(pages: int) -> str:
+    rng = random.Random(pages)
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(pages * 50))
+
+# Telegram stubs
+
+class Recorder:
+    def __init__(self) -> None:
+        self.texts: List[str] = []
+        self.bytes_out = 0
+
+    def consume(self, payload) -> None:
+        # Uploads are InputFiles whose content is bytes or, when streamed, an open file
+        content = getattr(payload, "input_file_content", payload)
+        if hasattr(content, "read"):
+            self.bytes_out += len(content.read())
+        elif isinstance(content, bytes):
+            self.bytes_out += len(content)
+
+    @property
+    def error(self) -> Optional[str]:
+        for text in self.texts:
+            if text.startswith(("⚠️", "❗", "❌", "⏳")):
+                return text
+        return None
+
+class FakeFile:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.file_size = len(data)
+
+    async def download_to_memory(self, out) -> None:
+        out.write(self.data)
+
+    async def download_to_drive(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.data)
+
+class FakeBot:
+    def __init__(self, recorder: Recorder) -> None:
+        self.recorder = recorder
+        self.files: Dict[str, bytes] = {}
+
+    def add_file(self, data: bytes) -> str:
+        file_id = f"file-{len(self.files)}-{time.time_ns()}"
+        self.files[file_id] = data
+        return file_id
+
+    async def get_file(self, file_id: str) -> FakeFile:
+        return FakeFile(self.files[file_id])
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.recorder.consume(document)
+        return SimpleNamespace(document=SimpleNamespace(file_id="sent"))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.recorder.texts.append(text)
+
+class FakeMessage:
+    def __init__(self, recorder: Recorder, text=None, caption=None, document=None, photo=None) -> None:
+        self.recorder = recorder
+        self.text = text
+        self.caption = caption
+        self.document = document
+        self.photo = photo or []
+
+    async def reply_text(self, text, **kwargs):
+        self.recorder.texts.append(text)
+        return FakeMessage(self.recorder, text=text)
+
+    async def edit_text(self, text, **kwargs):
+        self.recorder.texts.append(text)
+        return self
+
+    async def delete(self):
+        return True
+
+    async def reply_document(self, document, **kwargs):
+        self.recorder.consume(document)
+        return SimpleNamespace(document=SimpleNamespace(file_id="sent"))
+
+    async def reply_photo(self, photo, **kwargs):
+        self.recorder.consume(photo)
+
+    async def reply_media_group(self, media, **kwargs):
+        for item in media:
+            self.recorder.consume(item.media)
+
+_next_user = iter(range(1, sys.maxsize))
+
+def fake_update(recorder: Recorder, **message_fields):
+    # A fresh user per request keeps the per-user rate limits out of the numbers
+    user = SimpleNamespace(id=next(_next_user))
+    message = FakeMessage(recorder, **message_fields)
+    return SimpleNamespace(
+        update_id=user.id,
+        message=message,
+        effective_message=message,
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=user.id),
+        callback_query=None,
+    )
+
+def fake_document(bot: FakeBot, data: bytes, file_name: str, mime_type: str):
+    file_id = bot.add_file(data)
+    return SimpleNamespace(
+        file_id=file_id, file_unique_id=file_id, file_name=file_name, file_size=len(data), mime_type=mime_type
+    )
+
+# Cases
+
+class Case:
+    def __init__(self, name: str, units: float, unit: str, run: Callable[[FakeBot, Recorder], Awaitable[None]]) -> None:
+        self.name = name
+        self.units = units
+        self.unit = unit
+        self.run = run
+
+def document_case(name, data, file_name, mime_type, caption, units, unit):
+    async def run(bot, recorder):
+        document = fake_document(bot, data, file_name, mime_type)
+        update = fake_update(recorder, document=document, caption=caption)
+        await bot_module.handle_document(update, SimpleNamespace(bot=bot))
+    return Case(name, units, unit, run)
+
+def build_cases(fixtures_dir: str, page_counts: List[int]) -> List[Case]:
+    cases = []
+
+    def fixture(name: str, make) -> bytes:
+        path = os.path.join(fixtures_dir, name)
+        if not os.path.exists(path):
+            make(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+    for pages in page_counts:
+        pdf = fixture(f"text_{pages}p.pdf", lambda path: make_text_pdf(path, pages))
+        cases.append(document_case(f"pdf2text/{pages}p", pdf, "doc.pdf", "application/pdf", None, pages, "pages"))
+        cases.append(document_case(f"info/{pages}p", pdf, "doc.pdf", "application/pdf", "/info", pages, "pages"))
+        render = min(pages, 10)
+        cases.append(document_case(
+            f"pdf2img/{pages}p", pdf, "doc.pdf", "application/pdf", f"/pdf2img 1-{render}", render, "pages"
+        ))
+
+    for pages in (1, 5):
+        scan = fixture(f"scan_{pages}p.pdf", lambda path: make_scanned_pdf(path, pages))
+        cases.append(document_case(f"ocrpdf/scan{pages}p", scan, "scan.pdf", "application/pdf", "/ocrpdf", pages, "pages"))
+        cases.append(document_case(
+            f"compress/scan{pages}p", scan, "scan.pdf", "application/pdf", "/compress", len(scan) / 1e6, "MB"
+        ))
+
+    photo = fixture("photo.jpg", make_photo)
+
+    async def ocr_photo(bot, recorder):
+        file_id = bot.add_file(photo)
+        size = SimpleNamespace(file_id=file_id, file_unique_id=file_id, file_size=len(photo))
+        await bot_module.handle_photo(fake_update(recorder, photo=[size]), SimpleNamespace(bot=bot))
+    cases.append(Case("ocr/photo", len(photo) / 1e6, "MB", ocr_photo))
+
+    async def img2pdf_photo(bot, recorder):
+        file_id = bot.add_file(photo)
+        size = SimpleNamespace(file_id=file_id, file_unique_id=file_id, file_size=len(photo))
+        update = fake_update(recorder, photo=[size], caption="/img2pdf")
+        await bot_module.handle_image_to_pdf(update, SimpleNamespace(bot=bot))
+    cases.append(Case("img2pdf/photo", len(photo) / 1e6, "MB", img2pdf_photo))
+
+    for pages in (1, 50):
+        text = make_long_text(pages)
+
+        async def text2pdf(bot, recorder, text=text):
+            await bot_module.text_to_pdf_process(fake_update(recorder, text=text), SimpleNamespace(bot=bot))
+        cases.append(Case(f"text2pdf/{len(text) // 1024}KB", len(text) / 1e6, "MB", text2pdf))
+
+    async def page_numbers(bot, recorder):
+        for _ in range(1000):
+            bot_module.parse_page_numbers("1-200,250,300-350,7,9,11,900-1000", 1000)
+    cases.append(Case("parse_page_numbers/x1000", 1000, "calls", page_numbers))
+
+    return cases
+
+# Measurement
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+def job_memory_totals() -> Tuple[float, int]:
+    """Sum and count of the per-job peak worker memory recorded so far."""
+    total, count = 0.0, 0
+    for child in list(metrics.JOB_PEAK_MEMORY._children.values()):
+        total += child.sum
+        count += sum(child.counts)
+    return total, count
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_case(case: Case, iterations: int, warmup: int) -> dict:
+    latencies = []
+    error = None
+    bytes_out = 0
+    memory_before = None
+    for i in range(warmup + iterations):
+        if i == warmup:
+            memory_before = job_memory_totals()
+        recorder = Recorder()
+        bot = FakeBot(recorder)
+        start = time.perf_counter()
+        try:
+            await case.run(bot, recorder)
+        except Exception as e:
+            recorder.texts.append(f"⚠️ {type(e).__name__}: {e}")
+        elapsed = time.perf_counter() - start
+        if recorder.error:
+            error = recorder.error
+            break
+        if i >= warmup:
+            latencies.append(elapsed)
+            bytes_out += recorder.bytes_out
+
+    result = {"case": case.name, "iterations": len(latencies), "error": error}
+    if latencies:
+        total = sum(latencies)
+        result.update({
+            "unit": case.unit,
+            "throughput": case.units * len(latencies) / total,
+            "mean_s": statistics.mean(latencies),
+            "p50_s": percentile(latencies, 0.5),
+            "p99_s": percentile(latencies, 0.99),
+            "bytes_out": bytes_out,
+        })
+    result["peak_rss_mb"] = peak_rss_mb()
+    if memory_before is not None:
+        total, count = job_memory_totals()
+        jobs = count - memory_before[1]
+        result["job_memory_mb"] = (total - memory_before[0]) / jobs / 1024 / 1024 if jobs else None
+    return result
+
+def print_table(results: List[dict]) -> None:
+    print(
+        f"{'case':<28} {'n':>3} {'throughput':>18} {'p50':>9} {'p99':>9} {'rss MB':>8} {'workers':>8} {'job MB':>8}"
+    )
+    for r in results:
+        rss = r["peak_rss_mb"]
+        if r["error"] and not r["iterations"]:
+            print(f"{r['case']:<28} {'-':>3} failed: {r['error'][:60]}")
+            continue
+        throughput = f"{r['throughput']:.2f} {r['unit']}/s"
+        job_memory = f"{r['job_memory_mb']:.0f}" if r.get("job_memory_mb") else "-"
+        print(
+            f"{r['case']:<28} {r['iterations']:>3} {throughput:>18} "
+            f"{r['p50_s'] * 1000:>7.0f}ms {r['p99_s'] * 1000:>7.0f}ms "
+            f"{rss['self']:>8.0f} {rss['workers']:>8.0f} {job_memory:>8}"
+        )
+
+async def main(args) -> List[dict]:
+    cases = build_cases(args.fixtures, args.pages)
+    if args.case:
+        cases = [case for case in cases if any(pattern in case.name for pattern in args.case)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return []
+
+    results = []
+    try:
+        for case in cases:
+            print(f"running {case.name}...", file=sys.stderr)
+            results.append(await run_case(case, args.iterations, args.warmup))
+    finally:
+        await bot_module.conversion_executor.shutdown()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bot's conversion paths offline.")
+    parser.add_argument("--case", action="append", help="only run cases whose name contains this (repeatable)")
+    parser.add_argument("-n", "--iterations", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument(
+        "--pages", type=lambda s: [int(p) for p in s.split(",")], default=[1, 10, 100, 1000],
+        help="page counts of the text PDF fixtures (default 1,10,100,1000)",
+    )
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "any2any-bench-fixtures"))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+    args.fixtures = os.path.abspath(args.fixtures)
+    os.makedirs(args.fixtures, exist_ok=True)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    # Keep the bot's working files, cache and sessions out of the repository,
+    # in a directory removed when the run ends
+    with tempfile.TemporaryDirectory(prefix="any2any-bench-") as workdir:
+        os.environ.setdefault("CACHE_DIR", os.path.join(workdir, "cache"))
+        os.environ.setdefault("SESSION_BACKEND", "memory")
+        previous_dir = os.getcwd()
+        os.chdir(workdir)
+        try:
+            import bot as bot_module
+
+            results = asyncio.run(main(args))
+        finally:
+            os.chdir(previous_dir)
+    if args.json:
+        json.dump({"python": sys.version.split()[0], "cpus": os.cpu_count(), "results": results}, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    elif results:
+        print_table(results)
@@ -1,11 +1,19 @@
 import os
 import uuid
+import time
+import asyncio
 import logging
 import io
 import re
-from typing import List, Optional, Tuple
+import zipfile
+import functools
+import inspect
+import shutil
+import weakref
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -15,20 +23,35 @@ from telegram.ext import (
     ConversationHandler,
     CallbackQueryHandler,
 )
-import PyPDF2
-from docx2pdf import convert
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_path
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import img2pdf
 from aiohttp import web
 
+import conversions
+from admission import Admission, AdmissionError, IncomingFile, admit, admit_pages
+from executor import ConversionExecutor, TooManyJobsError
+from ingest import UpdateQueue
+from cache import ResultCache, file_digest
+from conversions import FileSource, source_size
+from downloads import FileTooLargeError, download_file, download_source
+from compression import DEFAULT_PRESET, PRESETS as COMPRESSION_PRESETS
+import ocrengine
+from ocrengine import OcrOptions, check_options as check_ocr_options
+from ocrprep import OcrReport
+from sessions import Session, create_conversation_persistence, create_session_store, remove_files, run_sweeper
+from albums import AlbumCollector
+import readers
+from workspace import DiskBudgetExceededError, Workspace
+from scheduler import JobScheduler, RateLimitedError
+from outbound import OutboundRateLimiter, StatusMessage, StreamedInputFile, open_upload
+import metrics
+import probe
+
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # e.g., https://your-app.onrender.com/webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # optional, checked against Telegram's secret token header
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queue")  # "queue" acks immediately, "inline" waits for handlers
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # optional, e.g. a local Bot API server or loadtest.py
 
 # Directories
 UPLOAD_DIR = "uploads"
@@ -41,11 +64,204 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Pages extracted per job when converting PDF to text; the status message is updated after each batch
+PDF_TEXT_PROGRESS_PAGES = int(os.getenv("PDF_TEXT_PROGRESS_PAGES", 25))
+# Pages rasterized and OCR'd per job by /ocrpdf
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", 2))
+# Minimum seconds between edits of a progress message
+PROGRESS_EDIT_INTERVAL = 2.0
+
+# PDF to images settings
+MEDIA_GROUP_SIZE = 10  # Telegram's album limit
+MAX_IMAGE_PAGES = int(os.getenv("PDF2IMG_MAX_PAGES", 30))
+MAX_ZIP_PAGES = int(os.getenv("PDF2IMG_MAX_ZIP_PAGES", 500))
+PDF2IMG_BATCH_PAGES = int(os.getenv("PDF2IMG_BATCH_PAGES", 2))
+PDF2IMG_DEFAULT_DPI = int(os.getenv("PDF2IMG_DPI", 200))
+PDF2IMG_MIN_DPI, PDF2IMG_MAX_DPI = 50, 300
+
+# Image to PDF settings
+IMG2PDF_MAX_IMAGES = int(os.getenv("IMG2PDF_MAX_IMAGES", 100))
+IMG2PDF_MAX_SIDE = int(os.getenv("IMG2PDF_MAX_SIDE", 3508))  # A4 at 300 DPI
+IMG2PDF_COMPACT_SIDE = int(os.getenv("IMG2PDF_COMPACT_SIDE", 1754))  # A4 at 150 DPI
+IMG2PDF_COMPACT_QUALITY = int(os.getenv("IMG2PDF_COMPACT_QUALITY", 70))
+ALBUM_DOWNLOAD_CONCURRENCY = int(os.getenv("ALBUM_DOWNLOAD_CONCURRENCY", 4))
+
+# PDF merge settings
+MERGE_MAX_FILES = int(os.getenv("MERGE_MAX_FILES", 20))
+
 # Conversation states
 AWAITING_SECOND_PDF, AWAITING_TEXT, AWAITING_PAGE_NUMBERS = range(3)
 
-# Store temporary data
-user_data_store = {}
+# Merge/extract sessions; with the SQLite backend they survive restarts
+session_store = create_session_store()
+
+# Worker pool for CPU-bound conversions
+conversion_executor = ConversionExecutor()
+
+# Rate limits and fair sharing of the worker pool between users
+job_scheduler = JobScheduler()
+
+# Previously produced results, keyed on source file, operation and parameters
+result_cache = ResultCache()
+
+# Background downloads of merge inputs, per user and file path
+merge_prefetch: Dict[int, Dict[str, asyncio.Task]] = {}
+
+# Serializes the read-modify-write of a user's merge session between the
+# handlers and the background downloads; unused locks are dropped
+merge_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def merge_lock(user_id: int) -> asyncio.Lock:
+    lock = merge_locks.get(user_id)
+    if lock is None:
+        lock = merge_locks[user_id] = asyncio.Lock()
+    return lock
+
+# Per-job scratch directories and the disk budget they share
+workspace = Workspace([UPLOAD_DIR, CONVERTED_DIR, TEMP_DIR])
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
+
+def with_job_slot(operation, files=None, rate_limited=True):
+    """Rate-limit and schedule a handler as a conversion job.
+
+    `operation` names the job for cost accounting, or is a function of the
+    update returning the name. `files` returns the files the job will
+    download from the handler's arguments, directly or as a coroutine; by
+    default, the update's own attachment. Steps of a conversation that only collect its files pass
+    `rate_limited=False`; the conversation is charged once when it runs.
+    The handler also takes one of the user's concurrent job slots.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            user_id = update.effective_user.id
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            name = operation(update) if callable(operation) else operation
+            low_priority = False
+            
+            async def on_queued(position: int) -> None:
+                if low_priority:
+                    text = f"🕒 This is a large job, so quicker ones go first. Your request is number {position} in the queue."
+                else:
+                    text = f"🕒 The bot is busy. Your request is number {position} in the queue."
+                await get_status(update, context).update(text)
+            
+            async def on_disk_wait() -> None:
+                await get_status(update, context).update("💾 Waiting for disk space to free up...")
+            
+            operation_token = metrics.current_operation.set(name)
+            try:
+                # Turn away files that are too large or of the wrong type before anything is downloaded
+                incoming = files(update, *args, **kwargs) if files else incoming_files(update)
+                if inspect.isawaitable(incoming):
+                    incoming = await incoming
+                context.admission = admit(name, incoming)
+                low_priority = context.admission.low_priority
+                
+                # End-to-end time includes any wait in the scheduler queue
+                with metrics.REQUEST_SECONDS.labels(name).time():
+                    async with conversion_executor.user_slot(user_id):
+                        # Rate limits are checked first; disk space is reserved once the job may
+                        # start, so jobs waiting in the queue hold none
+                        async with job_scheduler.slot(user_id, chat_id, name, on_queued, low_priority, rate_limited):
+                            size = workspace.estimate(sum(file_size or 0 for file_size, _ in incoming))
+                            async with workspace.job(size, on_disk_wait) as job:
+                                in_flight = metrics.JOBS_IN_FLIGHT.labels(name)
+                                in_flight.inc()
+                                context.workspace_job = job
+                                try:
+                                    return await handler(update, context, *args, **kwargs)
+                                finally:
+                                    in_flight.dec()
+            except (TooManyJobsError, RateLimitedError) as e:
+                metrics.ERRORS.labels(name, "rejected").inc()
+                await update.effective_message.reply_text(f"⏳ {rejected_file(update)}{e}")
+            except DiskBudgetExceededError as e:
+                metrics.ERRORS.labels(name, "rejected").inc()
+                await update.effective_message.reply_text(f"💾 {rejected_file(update)}{e}")
+            except FileTooLargeError as e:
+                metrics.ERRORS.labels(name, "rejected").inc()
+                await update.effective_message.reply_text(f"❗ {rejected_file(update)}{e}")
+            except AdmissionError as e:
+                metrics.ERRORS.labels(name, "rejected").inc()
+                context.admission = Admission(name, 0, decision="rejected")
+                await update.effective_message.reply_text(f"❗ {rejected_file(update)}{e}")
+            finally:
+                # One admission decision per job, however far it got
+                admission = getattr(context, "admission", None)
+                if admission:
+                    metrics.ADMISSIONS.labels(name, admission.decision).inc()
+                context.admission = None
+                status = getattr(context, "status_message", None)
+                if status:
+                    await status.close()
+                # Album items share one context; whatever runs next starts afresh
+                context.status_message = None
+                context.workspace_job = None
+                metrics.current_operation.reset(operation_token)
+        return wrapper
+    return decorator
+
+def rejected_file(update: Update) -> str:
+    """Names the turned-away document at the start of a reply, so users sending several know which one it was."""
+    message = update.effective_message
+    if message is not None and message.document and message.document.file_name:
+        return f"{message.document.file_name} was not processed. "
+    return ""
+
+def incoming_files(update: Update) -> List[IncomingFile]:
+    """Size and MIME type, as the sender's client gave them, of the file attached to the update's message."""
+    message = update.effective_message
+    if message is None:
+        return []
+    if message.document:
+        return [(message.document.file_size, message.document.mime_type)]
+    if message.photo:
+        return [(message.photo[-1].file_size, "image/jpeg")]
+    return []
+
+def album_files(update: Update, updates: List[Update], *args) -> List[IncomingFile]:
+    """Files of every image in an album job."""
+    return [file for item in updates for file in incoming_files(item)]
+
+def job_dir(context: ContextTypes.DEFAULT_TYPE, root: str) -> str:
+    """The current job's scratch directory under root (one of uploads/, converted/ or temp/).
+
+    Outside a job, files go straight into root and are left to the workspace sweeper.
+    """
+    job = getattr(context, "workspace_job", None)
+    if job is None:
+        os.makedirs(root, exist_ok=True)
+        return root
+    return job.dir(root)
+
+def job_path(context: ContextTypes.DEFAULT_TYPE, root: str, name: str) -> str:
+    return os.path.join(job_dir(context, root), name)
+
+def get_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> StatusMessage:
+    """The status message of the current request, shared by everything that reports progress."""
+    status = getattr(context, "status_message", None)
+    if status is None:
+        status = context.status_message = StatusMessage(update.effective_message)
+    return status
+
+def document_operation(update: Update) -> str:
+    """Name of the job a document message will run, from its caption and extension."""
+    document = update.message.document
+    command = (update.message.caption or "").partition(" ")[0].lower()
+    if command in ("/pdf2img", "/info", "/compress", "/ocrpdf"):
+        return command[1:]
+    extension = os.path.splitext(document.file_name or "")[1].lower() if document else ""
+    if extension == ".docx":
+        return "docx2pdf"
+    if extension == ".txt":
+        return "text2pdf"
+    if extension in IMAGE_EXTENSIONS:
+        return "ocr"
+    if extension == ".pdf":
+        return "pdf2text"
+    return "unsupported"
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
@@ -67,19 +283,26 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "📚 How to use Any2Any Bot:\n\n"
-        "📄 PDF to Text: Send a PDF file\n"
+        "📄 PDF to Text: Send a PDF file (caption /pdf2text 1-10 for selected pages)\n"
+        "🔎 Scanned PDF to Text: Send a PDF with caption /ocrpdf\n"
         "📝 DOCX to PDF: Send a DOCX file\n"
-        "🖼️ Image to Text (OCR): Send an image file\n"
-        "📄 PDF to Images: Send a PDF with caption /pdf2img\n"
-        "📝 Text to PDF: Use /text2pdf and follow instructions\n"
+        "🖼️ Image to Text (OCR): Send an image file (caption e.g. /ocr lang=eng+deu psm=6 to pick languages and layout)\n"
+        "📑 Images to PDF: Send images (or an album) with caption /img2pdf, add compact for a smaller file\n"
+        "📄 PDF to Images: Send a PDF with caption /pdf2img (e.g. /pdf2img 1-5 dpi=150, add zip for an archive)\n"
+        "📝 Text to PDF: Use /text2pdf and follow instructions, or send a .txt file\n"
         "🔄 PDF Merge: Use /merge and follow instructions\n"
         "✂️ PDF Extract Pages: Use /extract and follow instructions\n"
         "🔍 File Info: Send any file with caption /info\n"
-        "🗜️ PDF Compression: Send a PDF with caption /compress\n\n"
+        "🗜️ PDF Compression: Send a PDF with caption /compress (optionally screen, ebook or print)\n\n"
         "I'll process your request and send back the result! 🚀"
     )
 
+@with_job_slot(document_operation)
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await process_document(update, context)
+
+async def process_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Convert a document according to its caption command or extension."""
     document = update.message.document
     if not document:
         await update.message.reply_text("❗ Please send a valid document.")
@@ -87,10 +310,21 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # Check if there's a caption command
     caption = update.message.caption or ""
+    page_input = None
+    ocr = False
+    ocr_options = OcrOptions()
     if caption.startswith("/"):
-        command = caption.split()[0].lower()
+        command, _, arguments = caption.partition(" ")
+        command = command.lower()
         
-        if command == "/pdf2img":
+        if command in ("/pdf2text", "/ocrpdf", "/ocr"):
+            try:
+                page_input, ocr_options = parse_ocr_arguments(arguments)
+            except ValueError as e:
+                await update.message.reply_text(f"❗ {e} Example: {command} lang=eng+deu psm=6")
+                return
+            ocr = command == "/ocrpdf"
+        elif command == "/pdf2img":
             await process_pdf_to_images(update, context)
             return
         elif command == "/info":
@@ -104,75 +338,317 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     unique_id = str(uuid.uuid4())
     file_extension = os.path.splitext(document.file_name)[1].lower()
 
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+    if file_extension == ".pdf":
+        operation = "ocrpdf" if ocr else "pdf2text"
+    elif file_extension == ".docx":
+        operation = "docx2pdf"
+    elif file_extension == ".txt":
+        operation = "text2pdf"
+    elif file_extension in IMAGE_EXTENSIONS:
+        operation = "ocr"
+    else:
+        await update.message.reply_text("❌ Unsupported file format. Please send a PDF, DOCX, TXT, or image file.")
+        return
+    
+    # Requests with the default OCR options keep the cache keys they always had
+    cache_params = page_input if ocr_options == OcrOptions() else (page_input, ocr_options.lang, ocr_options.psm)
+    cache_key = None
+    if document.file_unique_id:
+        cache_key = result_cache.make_key(document.file_unique_id, operation, cache_params)
+        if await send_cached_result(update, context, cache_key):
+            return
 
-    upload_path = os.path.join(UPLOAD_DIR, f"{unique_id}_{document.file_name}")
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
+    upload_path = job_path(context, UPLOAD_DIR, f"{unique_id}_{document.file_name}")
+    source = await download_source(context.bot, document.file_id, upload_path, document.file_size)
 
     try:
+        if cache_key is None:
+            digest = await asyncio.to_thread(file_digest, source)
+            cache_key = result_cache.make_key(digest, operation, cache_params)
+            if await send_cached_result(update, context, cache_key):
+                return
+        
         if file_extension == ".pdf":
-            converted_path = convert_pdf_to_text(upload_path, unique_id)
-            await send_converted_file(update, context, converted_path, "text/plain")
+            await process_pdf_to_text(update, context, source, unique_id, page_input, cache_key, ocr, ocr_options)
         elif file_extension == ".docx":
-            converted_path = convert_docx_to_pdf(upload_path, unique_id)
-            await send_converted_file(update, context, converted_path, "application/pdf")
-        elif file_extension in [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]:
-            await process_image_to_text(update, context, upload_path)
-        else:
-            await update.message.reply_text("❌ Unsupported file format. Please send a PDF, DOCX, or image file.")
+            converted_path = job_path(context, CONVERTED_DIR, f"{unique_id}_converted.pdf")
+            await conversion_executor.run(conversions.docx_to_pdf, source, converted_path)
+            await send_converted_file(update, context, converted_path, "application/pdf", cache_key)
+        elif file_extension == ".txt":
+            await get_status(update, context).update("🔄 Converting text to PDF...")
+            converted_path = job_path(context, CONVERTED_DIR, f"{unique_id}_text_to_pdf.pdf")
+            await conversion_executor.run(conversions.text_file_to_pdf, source, converted_path)
+            await send_converted_file(update, context, converted_path, "application/pdf", cache_key)
+        elif file_extension in IMAGE_EXTENSIONS:
+            await process_image_to_text(update, context, source, cache_key, ocr_options)
+    except AdmissionError:
+        # Reported by with_job_slot
+        raise
     except Exception as e:
         logger.error(f"Error processing file: {e}")
-        await update.message.reply_text(f"⚠️ An error occurred while processing your file: {str(e)}")
+        await get_status(update, context).update(
+            f"⚠️ An error occurred while processing your file: {str(e)}", final=True
+        )
     finally:
         # Cleanup uploaded file
         if os.path.exists(upload_path):
             os.remove(upload_path)
 
-def convert_pdf_to_text(pdf_path: str, unique_id: str) -> str:
-    """Convert PDF to text."""
-    output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_converted.txt")
-    with open(pdf_path, "rb") as pdf_file:
-        reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-    with open(output_path, "w", encoding="utf-8") as text_file:
-        text_file.write(text)
-    return output_path
-
-def convert_docx_to_pdf(docx_path: str, unique_id: str) -> str:
-    """Convert DOCX to PDF (works only on Windows/macOS with Word installed)."""
-    output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_converted.pdf")
-    convert(docx_path, output_path)
-    return output_path
-
-async def process_image_to_text(update: Update, context: ContextTypes.DEFAULT_TYPE, image_path: str) -> None:
+async def process_pdf_to_text(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    source: FileSource,
+    unique_id: str,
+    page_input: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    ocr: bool = False,
+    ocr_options: Optional[OcrOptions] = None,
+) -> None:
+    """Extract PDF text in parallel page batches, reporting progress in a single status message.
+
+    With ocr=True every page is rasterized and run through OCR; otherwise OCR is
+    only used for pages that have no text layer, within the /ocrpdf limits.
+    """
+    operation = "ocrpdf" if ocr else "pdf2text"
+    page_count = await count_pdf_pages(source)
+    if page_input:
+        page_numbers = parse_page_numbers(page_input, page_count)
+        if not page_numbers:
+            await update.message.reply_text(
+                f"❗ Invalid page numbers. This PDF has {page_count} pages, e.g. /{operation} 1-5,8"
+            )
+            return
+    else:
+        page_numbers = list(range(1, page_count + 1))
+    
+    # Long selections are cut down to their first pages rather than turned away
+    max_pages = admit_pages(operation, len(page_numbers))
+    remaining = []
+    if max_pages is not None:
+        page_numbers, remaining = page_numbers[:max_pages], page_numbers[max_pages:]
+        admission = getattr(context, "admission", None)
+        if admission:
+            admission.decision = "downgraded"
+    
+    total = len(page_numbers)
+    action = "Running OCR" if ocr else "Extracting text"
+    status = get_status(update, context)
+    await status.update(f"📄 {action}... 0/{total} pages")
+    
+    if ocr:
+        func, batch_size = functools.partial(conversions.ocr_pdf_pages, options=ocr_options), OCR_BATCH_PAGES
+    else:
+        func, batch_size = conversions.pdf_pages_text, PDF_TEXT_PROGRESS_PAGES
+    batches = [page_numbers[i:i + batch_size] for i in range(0, total, batch_size)]
+    if len(batches) > 1:
+        # Each batch would otherwise send the whole file to its worker; a path is cheap to pass around
+        spill_path = job_path(context, UPLOAD_DIR, f"{unique_id}_source.pdf")
+        source = await asyncio.to_thread(conversions.spill_source, source, spill_path)
+    jobs = [(source, batch) for batch in batches]
+    
+    output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_converted.txt")
+    # Pages without a text layer, and where in the output their text belongs
+    missing: Dict[int, int] = {}
+    done = 0
+    last_edit = time.monotonic()
+    with open(output_path, "wb") as text_file:
+        # Batches run in parallel but come back in page order, so they can be written as they arrive
+        async for texts in conversion_executor.map_ordered(func, jobs):
+            for text in texts:
+                if not ocr and not text.strip():
+                    missing[page_numbers[done]] = text_file.tell()
+                text_file.write(text.encode("utf-8"))
+                text_file.write(b"\n")
+                done += 1
+            if done < total and time.monotonic() - last_edit >= PROGRESS_EDIT_INTERVAL:
+                await status.update(f"📄 {action}... {done}/{total} pages")
+                last_edit = time.monotonic()
+    
+    unread = []
+    if missing:
+        recognized = await ocr_missing_pages(update, context, source, list(missing), ocr_options)
+        if recognized:
+            offsets = {missing[page]: text for page, text in recognized.items()}
+            await asyncio.to_thread(insert_text, output_path, offsets)
+        unread = [page for page in missing if page not in recognized]
+    
+    summary = f"✅ Extracted text from {total} pages."
+    if unread:
+        summary += (
+            f"\n⚠️ {len(unread)} pages have no text layer and were not read with OCR. "
+            f"Send the PDF again with caption /ocrpdf {unread[0]}-{unread[-1]} to read them."
+        )
+    if remaining:
+        next_pages = remaining[:max_pages]
+        summary += (
+            f"\n⚠️ Only {max_pages} pages are converted at a time. "
+            f"Send the PDF again with caption /{operation} {next_pages[0]}-{next_pages[-1]} for more."
+        )
+    await status.update(summary, final=True)
+    await send_converted_file(update, context, output_path, "text/plain", cache_key)
+
+async def ocr_missing_pages(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    source: FileSource,
+    pages: List[int],
+    options: Optional[OcrOptions] = None,
+) -> Dict[int, str]:
+    """OCR pages that turned out to have no text layer, as much as /ocrpdf would allow.
+
+    The pages are admitted as an /ocrpdf job: cut down to its page limit and
+    charged its cost. The job already holds a share of the scheduler budget, so
+    the extra share is only taken if it is free; otherwise the pages are left.
+    """
+    max_pages = admit_pages("ocrpdf", len(pages))
+    if max_pages is not None:
+        pages = pages[:max_pages]
+    admission = admit("ocrpdf", [(source_size(source), None)])
+    # Top the pdf2text share the job holds up to what an /ocrpdf job would hold
+    limit = job_scheduler.low_priority_budget if admission.low_priority else job_scheduler.budget
+    extra = max(0, min(job_scheduler.cost("ocrpdf"), limit) - job_scheduler.cost("pdf2text"))
+    cost = job_scheduler.try_acquire(extra, admission.low_priority)
+    if cost is None:
+        logger.info(f"Skipping OCR of {len(pages)} pages without text, the bot is busy")
+        return {}
+    
+    texts: Dict[int, str] = {}
+    try:
+        await get_status(update, context).update(f"🔍 Running OCR on {len(pages)} pages without text...")
+        batches = [pages[i:i + OCR_BATCH_PAGES] for i in range(0, len(pages), OCR_BATCH_PAGES)]
+        func = functools.partial(conversions.ocr_pdf_pages, options=options)
+        jobs = [(source, batch) for batch in batches]
+        index = 0
+        async for batch_texts in conversion_executor.map_ordered(func, jobs):
+            texts.update(zip(batches[index], batch_texts))
+            index += 1
+    except Exception as e:
+        # OCR is best effort here; pages read so far are kept
+        logger.warning(f"OCR of pages without text failed: {e}")
+    finally:
+        job_scheduler.release(cost, admission.low_priority)
+    return texts
+
+def insert_text(path: str, insertions: Dict[int, str]) -> None:
+    """Rewrite a UTF-8 file with text inserted at the given byte offsets."""
+    temp_path = path + ".tmp"
+    with open(path, "rb") as original, open(temp_path, "wb") as output:
+        position = 0
+        for offset in sorted(insertions):
+            while position < offset:
+                chunk = original.read(min(offset - position, 1024 * 1024))
+                if not chunk:
+                    break
+                output.write(chunk)
+                position += len(chunk)
+            output.write(insertions[offset].encode("utf-8"))
+        shutil.copyfileobj(original, output)
+    os.replace(temp_path, path)
+
+async def count_pdf_pages(source: FileSource) -> int:
+    """Page count of a downloaded PDF, read from its page tree; damaged files are parsed in full."""
+    try:
+        return await asyncio.to_thread(probe.probe_page_count, source)
+    except probe.ProbeError as e:
+        logger.info(f"PDF probe failed, parsing fully: {e}")
+        return await conversion_executor.run(conversions.count_pdf_pages, source)
+
+def record_ocr_report(report: OcrReport) -> None:
+    """Export and log where an image OCR job spent its time."""
+    for stage, seconds in report.stage_seconds.items():
+        metrics.OCR_STAGE_SECONDS.labels(stage).observe(seconds)
+    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report.stage_seconds.items())
+    logger.info(
+        f"OCR {report.original_size[0]}x{report.original_size[1]} -> "
+        f"{report.processed_size[0]}x{report.processed_size[1]}, skew {report.skew_angle:.1f}°: {stages}"
+    )
+
+async def process_image_to_text(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    source: FileSource,
+    cache_key: Optional[str] = None,
+    ocr_options: Optional[OcrOptions] = None,
+) -> None:
     """Process image to extract text using OCR."""
-    await update.message.reply_text("🔍 Processing image with OCR...")
+    await get_status(update, context).update("🔍 Processing image with OCR...")
     try:
         # Extract text from image
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image)
+        report = await conversion_executor.run(conversions.image_to_text, source, ocr_options)
+        record_ocr_report(report)
+        text = report.text
         
         if not text.strip():
-            await update.message.reply_text("⚠️ No text could be extracted from this image.")
+            await get_status(update, context).update("⚠️ No text could be extracted from this image.", final=True)
             return
         
         # Save text to file
         unique_id = str(uuid.uuid4())
-        output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_ocr_text.txt")
+        output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_ocr_text.txt")
         with open(output_path, "w", encoding="utf-8") as text_file:
             text_file.write(text)
         
         # Send the extracted text
-        await send_converted_file(update, context, output_path, "text/plain")
+        await send_converted_file(update, context, output_path, "text/plain", cache_key)
     except Exception as e:
         logger.error(f"OCR error: {e}")
-        await update.message.reply_text(f"⚠️ Error extracting text from image: {str(e)}")
+        await get_status(update, context).update(f"⚠️ Error extracting text from image: {str(e)}", final=True)
+
+def parse_ocr_arguments(arguments: str) -> Tuple[Optional[str], OcrOptions]:
+    """Split OCR caption arguments into a page selection and the lang=/psm= options."""
+    lang, psm = OcrOptions.lang, OcrOptions.psm
+    page_parts = []
+    for token in arguments.split():
+        if token.lower().startswith("lang="):
+            lang = token[5:]
+        elif token.lower().startswith("psm="):
+            if not token[4:].isdigit():
+                raise ValueError("Page segmentation mode must be a number.")
+            psm = int(token[4:])
+        else:
+            page_parts.append(token)
+    options = OcrOptions(lang=lang, psm=psm)
+    check_ocr_options(options)
+    return "".join(page_parts) or None, options
+
+def parse_pdf2img_arguments(arguments: str) -> Tuple[Optional[str], int, bool]:
+    """Split /pdf2img caption arguments into a page selection, a DPI and the zip flag."""
+    dpi = PDF2IMG_DEFAULT_DPI
+    as_zip = False
+    page_parts = []
+    for token in arguments.split():
+        if token.lower() == "zip":
+            as_zip = True
+        elif token.lower().startswith("dpi="):
+            if not token[4:].isdigit():
+                raise ValueError("DPI must be a number.")
+            dpi = int(token[4:])
+            if not PDF2IMG_MIN_DPI <= dpi <= PDF2IMG_MAX_DPI:
+                raise ValueError(f"DPI must be between {PDF2IMG_MIN_DPI} and {PDF2IMG_MAX_DPI}.")
+        else:
+            page_parts.append(token)
+    return "".join(page_parts) or None, dpi, as_zip
+
+async def send_page_album(update: Update, pages: List[Tuple[int, str]]) -> None:
+    """Send rendered pages as one album (or a single photo) and delete the files."""
+    files = [open(image_path, "rb") for _, image_path in pages]
+    try:
+        with metrics.track_upload(*(image_path for _, image_path in pages)):
+            if len(files) == 1:
+                await update.message.reply_photo(photo=StreamedInputFile(files[0]), caption=f"Page {pages[0][0]}")
+            else:
+                await update.message.reply_media_group(
+                    media=[
+                        InputMediaPhoto(media=StreamedInputFile(img_file, attach=True), caption=f"Page {page_num}")
+                        for (page_num, _), img_file in zip(pages, files)
+                    ]
+                )
+    finally:
+        for img_file in files:
+            img_file.close()
+        for _, image_path in pages:
+            if os.path.exists(image_path):
+                os.remove(image_path)
 
 async def process_pdf_to_images(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Convert PDF to images."""
@@ -181,58 +657,90 @@ async def process_pdf_to_images(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("❗ Please send a PDF file with /pdf2img caption.")
         return
     
-    await update.message.reply_text("🔄 Converting PDF to images...")
+    try:
+        page_input, dpi, as_zip = parse_pdf2img_arguments((update.message.caption or "").partition(" ")[2])
+    except ValueError as e:
+        await update.message.reply_text(f"❗ {e} Example: /pdf2img 1-5 dpi=150 zip")
+        return
     
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    
-    upload_path = os.path.join(UPLOAD_DIR, f"{unique_id}_{document.file_name}")
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
+    upload_path = job_path(context, UPLOAD_DIR, f"{unique_id}_{document.file_name}")
+    source = await download_source(context.bot, document.file_id, upload_path, document.file_size)
     
+    image_paths = []
     try:
-        # Convert PDF to images
-        images = convert_from_path(upload_path)
+        page_count = await count_pdf_pages(source)
+        if page_input:
+            page_numbers = parse_page_numbers(page_input, page_count)
+            if not page_numbers:
+                await update.message.reply_text(
+                    f"❗ Invalid page numbers. This PDF has {page_count} pages, e.g. /pdf2img 1-5"
+                )
+                return
+        else:
+            page_numbers = list(range(1, page_count + 1))
         
-        if not images:
+        if not page_numbers:
             await update.message.reply_text("⚠️ Could not extract images from this PDF.")
             return
         
-        # Save images
-        image_paths = []
-        for i, image in enumerate(images):
-            image_path = os.path.join(CONVERTED_DIR, f"{unique_id}_page_{i+1}.jpg")
-            image.save(image_path, "JPEG")
-            image_paths.append(image_path)
-        
-        # Send the images (up to 10 to avoid spam)
-        await update.message.reply_text(f"✅ Converted PDF to {len(images)} images.")
-        
-        for i, image_path in enumerate(image_paths[:10]):
-            with open(image_path, "rb") as img_file:
-                await update.message.reply_photo(
-                    photo=img_file,
-                    caption=f"Page {i+1}"
-                )
-            
-        if len(image_paths) > 10:
-            await update.message.reply_text("⚠️ Only showing first 10 pages to avoid spam.")
+        # Only render the pages that will actually be sent
+        limit = MAX_ZIP_PAGES if as_zip else MAX_IMAGE_PAGES
+        selected = page_numbers[:limit]
+        admit_pages("pdf2img", len(selected))
+        await get_status(update, context).update(
+            f"🔄 Converting {len(selected)} of {page_count} pages to images at {dpi} DPI..."
+        )
         
-        # Clean up
-        for image_path in image_paths:
-            if os.path.exists(image_path):
-                os.remove(image_path)
+        jobs = [
+            (source, selected[i:i + PDF2IMG_BATCH_PAGES], job_dir(context, CONVERTED_DIR), unique_id, dpi)
+            for i in range(0, len(selected), PDF2IMG_BATCH_PAGES)
+        ]
+        rendered_batches = conversion_executor.map_ordered(conversions.render_pages_to_files, jobs)
+        
+        if as_zip:
+            zip_path = job_path(context, CONVERTED_DIR, f"{unique_id}_pages.zip")
+            image_paths.append(zip_path)
+            # JPEGs are already compressed, so store them as-is
+            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+                async for rendered in rendered_batches:
+                    image_paths.extend(path for _, path in rendered)
+                    for page_num, image_path in rendered:
+                        await asyncio.to_thread(archive.write, image_path, f"page_{page_num:04d}.jpg")
+                        os.remove(image_path)
+            await send_converted_file(update, context, zip_path, "application/zip")
+        else:
+            # Send full albums while later pages are still rendering
+            album = []
+            async for rendered in rendered_batches:
+                image_paths.extend(path for _, path in rendered)
+                album.extend(rendered)
+                while len(album) >= MEDIA_GROUP_SIZE:
+                    await send_page_album(update, album[:MEDIA_GROUP_SIZE])
+                    album = album[MEDIA_GROUP_SIZE:]
+            if album:
+                await send_page_album(update, album)
+            
+        if len(page_numbers) > limit:
+            next_page = page_numbers[limit]
+            hint = "" if as_zip else " Add 'zip' to the caption to get all pages in one archive."
+            await update.message.reply_text(
+                f"⚠️ Only sent {limit} pages. "
+                f"Send the PDF again with caption /pdf2img {next_page}-{page_numbers[-1]} for more.{hint}"
+            )
                 
+    except AdmissionError:
+        raise
     except Exception as e:
         logger.error(f"PDF to images error: {e}")
-        await update.message.reply_text(f"⚠️ Error converting PDF to images: {str(e)}")
+        await get_status(update, context).update(f"⚠️ Error converting PDF to images: {str(e)}", final=True)
     finally:
-        # Cleanup uploaded file
+        # Cleanup uploaded file and any images left unsent
+        for image_path in image_paths:
+            if os.path.exists(image_path):
+                os.remove(image_path)
         if os.path.exists(upload_path):
             os.remove(upload_path)
 
@@ -246,16 +754,12 @@ async def process_file_info(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    
-    upload_path = os.path.join(UPLOAD_DIR, f"{unique_id}_{document.file_name}")
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
+    upload_path = job_path(context, UPLOAD_DIR, f"{unique_id}_{document.file_name}")
+    source = await download_source(context.bot, document.file_id, upload_path, document.file_size)
     
     try:
         file_extension = os.path.splitext(document.file_name)[1].lower()
-        file_size = os.path.getsize(upload_path)
+        file_size = source_size(source)
         file_size_kb = file_size / 1024
         file_size_mb = file_size_kb / 1024
         
@@ -267,17 +771,31 @@ async def process_file_info(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Additional info for PDF
         if file_extension == ".pdf":
-            with open(pdf_path, "rb") as pdf_file:
-                reader = PyPDF2.PdfReader(pdf_file)
-                info_text += f"Pages: {len(reader.pages)}\n"
-                
-                # Get metadata if available
-                metadata = reader.metadata
-                if metadata:
-                    info_text += "\nMetadata:\n"
-                    for key, value in metadata.items():
-                        if key and value and key.startswith("/"):
-                            info_text += f"- {key[1:]}: {value}\n"
+            try:
+                pdf = await asyncio.to_thread(probe.probe_pdf, source)
+                info_text += f"PDF version: {pdf.version}\n"
+                info_text += f"Encrypted: {'yes' if pdf.encrypted else 'no'}\n"
+                info_text += f"Images: {pdf.image_count}\n"
+                page_count, metadata = pdf.page_count, pdf.metadata
+            except probe.ProbeError as e:
+                # Damaged or unusual file; let PyPDF2 repair and parse it
+                logger.info(f"PDF probe failed, parsing fully: {e}")
+                page_count, metadata = await conversion_executor.run(
+                    readers.with_reader, document.file_unique_id, source, conversions.pdf_info,
+                    affinity=document.file_unique_id,
+                )
+            info_text += f"Pages: {page_count}\n"
+            
+            # Get metadata if available
+            if metadata:
+                info_text += "\nMetadata:\n"
+                for key, value in metadata.items():
+                    info_text += f"- {key}: {value}\n"
+        elif file_extension in IMAGE_EXTENSIONS:
+            image = await asyncio.to_thread(probe.probe_image, source)
+            info_text += f"Format: {image.format}\n"
+            info_text += f"Dimensions: {image.width}x{image.height} px\n"
+            info_text += f"Color mode: {image.mode}\n"
         
         await update.message.reply_text(info_text)
     except Exception as e:
@@ -295,74 +813,112 @@ async def process_pdf_compression(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("❗ Please send a PDF file with /compress caption.")
         return
     
-    await update.message.reply_text("🗜️ Compressing PDF...")
+    preset = (update.message.caption or "").partition(" ")[2].strip().lower() or DEFAULT_PRESET
+    if preset not in COMPRESSION_PRESETS:
+        await update.message.reply_text(
+            f"❗ Unknown preset '{preset}'. Use one of: {', '.join(COMPRESSION_PRESETS)} (e.g. /compress screen)"
+        )
+        return
+    
+    cache_key = result_cache.make_key(document.file_unique_id, "compress", preset)
+    if await send_cached_result(update, context, cache_key):
+        return
+    
+    status = get_status(update, context)
+    await status.update(f"🗜️ Compressing PDF ({preset} preset)...")
     
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
+    upload_path = job_path(context, UPLOAD_DIR, f"{unique_id}_{document.file_name}")
+    output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_compressed.pdf")
     
-    upload_path = os.path.join(UPLOAD_DIR, f"{unique_id}_{document.file_name}")
-    output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_compressed.pdf")
-    
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
+    source = await download_source(context.bot, document.file_id, upload_path, document.file_size)
     
     try:
-        # Basic compression by creating a new PDF with reduced quality
-        with open(upload_path, "rb") as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            writer = PyPDF2.PdfWriter()
-            
-            # Copy all pages to new PDF
-            for page in reader.pages:
-                writer.add_page(page)
-            
-            # Save with compression
-            with open(output_path, "wb") as output_file:
-                writer.write(output_file)
-        
-        # Check compression ratio
-        original_size = os.path.getsize(upload_path)
-        compressed_size = os.path.getsize(output_path)
-        compression_ratio = (1 - compressed_size / original_size) * 100
+        admit_pages("compress", await count_pdf_pages(source))
+        report = await conversion_executor.run(conversions.compress_pdf, source, output_path, preset)
         
-        await update.message.reply_text(
-            f"✅ PDF compressed: {compression_ratio:.1f}% reduction.\n"
-            f"Original: {original_size/1024/1024:.2f} MB\n"
-            f"Compressed: {compressed_size/1024/1024:.2f} MB"
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report.stage_seconds.items())
+        logger.info(f"Compressed PDF ({preset}): {report.ratio:.1%} saved, {stages}")
+        await status.update(
+            f"✅ PDF compressed: {report.ratio * 100:.1f}% reduction.\n"
+            f"Original: {report.original_size/1024/1024:.2f} MB\n"
+            f"Compressed: {report.compressed_size/1024/1024:.2f} MB\n"
+            f"Images recompressed: {report.images_recompressed}, "
+            f"duplicates removed: {report.duplicates_removed}, "
+            f"unused resources removed: {report.resources_removed}\n"
+            f"Time: {stages}",
+            final=True,
         )
         
         # Send the compressed file
-        await send_converted_file(update, context, output_path, "application/pdf")
+        await send_converted_file(update, context, output_path, "application/pdf", cache_key)
+    except AdmissionError:
+        raise
     except Exception as e:
         logger.error(f"PDF compression error: {e}")
-        await update.message.reply_text(f"⚠️ Error compressing PDF: {str(e)}")
+        await status.update(f"⚠️ Error compressing PDF: {str(e)}", final=True)
     finally:
         # Cleanup uploaded file
         if os.path.exists(upload_path):
             os.remove(upload_path)
 
-async def send_converted_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str, mime_type: str) -> None:
+async def send_converted_file(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    file_path: str,
+    mime_type: str,
+    cache_key: Optional[str] = None,
+) -> None:
     """Send the converted file to user."""
-    with open(file_path, "rb") as f:
-        await update.message.reply_document(
+    try:
+        with open_upload(file_path) as f, metrics.track_upload(file_path):
+            message = await update.message.reply_document(
+                document=f,
+                caption="✅ Here's your converted file!"
+            )
+        if cache_key:
+            await asyncio.to_thread(result_cache.put, cache_key, file_path, file_id=message.document.file_id)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+async def send_cached_result(update: Update, context: ContextTypes.DEFAULT_TYPE, cache_key: str) -> bool:
+    """Send a previously converted result if one is cached. Returns True on a hit."""
+    entry = await asyncio.to_thread(result_cache.get, cache_key)
+    if not entry:
+        return False
+    
+    if entry.file_id:
+        try:
+            # Re-use the already uploaded file instead of sending the bytes again
+            with metrics.track_upload():
+                await update.message.reply_document(
+                    document=entry.file_id,
+                    caption="✅ Here's your converted file!"
+                )
+            return True
+        except TelegramError as e:
+            logger.warning(f"Cached file_id rejected, re-uploading: {e}")
+            await asyncio.to_thread(result_cache.set_file_id, cache_key, None)
+    
+    with open_upload(entry.path, entry.filename) as f, metrics.track_upload(entry.path):
+        message = await update.message.reply_document(
             document=f,
-            filename=os.path.basename(file_path),
             caption="✅ Here's your converted file!"
         )
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    await asyncio.to_thread(result_cache.set_file_id, cache_key, message.document.file_id)
+    return True
 
 # Text to PDF conversion
 async def text_to_pdf_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text(
-        "📝 Send me the text you want to convert to PDF."
+        "📝 Send me the text you want to convert to PDF, or a .txt file for longer texts."
     )
     return AWAITING_TEXT
 
+@with_job_slot("text2pdf")
 async def text_to_pdf_process(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
     
@@ -370,39 +926,15 @@ async def text_to_pdf_process(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❗ Please send valid text.")
         return AWAITING_TEXT
     
-    await update.message.reply_text("🔄 Converting text to PDF...")
+    await get_status(update, context).update("🔄 Converting text to PDF...")
     
     try:
         # Generate unique ID
         unique_id = str(uuid.uuid4())
-        output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_text_to_pdf.pdf")
-        
-        # Create directories if not exist
-        os.makedirs(CONVERTED_DIR, exist_ok=True)
+        output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_text_to_pdf.pdf")
         
         # Create PDF
-        c = canvas.Canvas(output_path, pagesize=letter)
-        width, height = letter
-        
-        # Set font
-        c.setFont("Helvetica", 12)
-        
-        # Split text into lines
-        lines = text.split('\n')
-        y_position = height - 50
-        
-        for line in lines:
-            # Check if we need a new page
-            if y_position < 50:
-                c.showPage()
-                yposition = height - 50
-                c.setFont("Helvetica", 12)
-                
-            # Add text to PDF
-            c.drawString(50, y_position, line)
-            y_position -= 15
-            
-        c.save()
+        await conversion_executor.run(conversions.text_to_pdf, text, output_path)
         
         # Send the file
         await send_converted_file(update, context, output_path, "application/pdf")
@@ -411,24 +943,100 @@ async def text_to_pdf_process(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
     except Exception as e:
         logger.error(f"Text to PDF error: {e}")
-        await update.message.reply_text(f"⚠️ Error converting text to PDF: {str(e)}")
+        await get_status(update, context).update(f"⚠️ Error converting text to PDF: {str(e)}", final=True)
         return ConversationHandler.END
 
+async def text_to_pdf_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Convert a .txt file sent during /text2pdf, like any other .txt upload."""
+    await handle_document(update, context)
+    return ConversationHandler.END
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel the current conversation."""
+    await discard_session(update.effective_user.id)
     await update.message.reply_text("❌ Operation cancelled.")
     return ConversationHandler.END
 
+async def discard_session(user_id: int) -> None:
+    """End a user's merge/extract session and delete its files."""
+    for task in merge_prefetch.pop(user_id, {}).values():
+        task.cancel()
+    session = await asyncio.to_thread(session_store.delete, user_id)
+    if session:
+        remove_files(session.files)
+        reader_key = session.data.get("reader_key")
+        if reader_key:
+            conversion_executor.post(readers.evict, reader_key, affinity=reader_key)
+
 # PDF Merge functionality
 async def merge_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    user_data_store[user_id] = {"pdfs": []}
+    await discard_session(user_id)
+    await asyncio.to_thread(session_store.save, Session(user_id, "merge"))
     
     await update.message.reply_text(
         "🔄 PDF Merge started. Send me the first PDF file."
     )
     return AWAITING_SECOND_PDF
 
+def format_merge_inputs(inputs: List[dict]) -> str:
+    """Numbered list of merge inputs with their page counts and selected pages."""
+    lines = []
+    for number, item in enumerate(inputs, start=1):
+        if item["pages"] is None:
+            details = "reading..."
+        else:
+            details = f"{item['pages']} pages"
+            if item["range"]:
+                details += f", pages {item['range']}"
+        lines.append(f"{number}. {item['name']} ({details})")
+    return "\n".join(lines)
+
+def merge_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("Merge Now", callback_data="merge_now"),
+            InlineKeyboardButton("Cancel", callback_data="cancel_merge")
+        ]
+    ])
+
+async def prefetch_merge_input(bot, chat_id: int, user_id: int, file_id: str, path: str, name: str) -> None:
+    """Download a merge input and read its page count while the user keeps sending files."""
+    try:
+        await download_file(bot, file_id, path)
+        page_count = await count_pdf_pages(path)
+    except asyncio.CancelledError:
+        remove_files([path])
+        raise
+    except Exception as e:
+        logger.error(f"PDF merge input error: {e}")
+        async with merge_lock(user_id):
+            session = await asyncio.to_thread(session_store.get, user_id)
+            if session and session.kind == "merge":
+                session.data["inputs"] = [item for item in session.data.get("inputs", []) if item["path"] != path]
+                session.files = [file for file in session.files if file != path]
+                await asyncio.to_thread(session_store.save, session)
+        remove_files([path])
+        await bot.send_message(chat_id=chat_id, text=f"⚠️ {name} could not be read and was left out: {str(e)}")
+        return
+    finally:
+        merge_prefetch.get(user_id, {}).pop(path, None)
+
+    async with merge_lock(user_id):
+        session = await asyncio.to_thread(session_store.get, user_id)
+        if session and session.kind == "merge":
+            for item in session.data.get("inputs", []):
+                if item["path"] == path:
+                    item["pages"] = page_count
+            await asyncio.to_thread(session_store.save, session)
+
+async def wait_for_merge_inputs(user_id: int) -> None:
+    """Wait until the user's merge inputs have been downloaded and read."""
+    tasks = list(merge_prefetch.get(user_id, {}).values())
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+@with_job_slot("upload", rate_limited=False)
 async def merge_first_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     document = update.message.document
@@ -437,6 +1045,19 @@ async def merge_first_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("❗ Please send a PDF file.")
         return AWAITING_SECOND_PDF
     
+    session = await asyncio.to_thread(session_store.get, user_id)
+    if not session or session.kind != "merge":
+        await update.message.reply_text("❗ Please start over with /merge command.")
+        return ConversationHandler.END
+    
+    inputs = session.data.setdefault("inputs", [])
+    if len(inputs) >= MERGE_MAX_FILES:
+        await update.message.reply_text(
+            f"❗ A merge can combine at most {MERGE_MAX_FILES} PDFs. Click 'Merge Now' to complete.",
+            reply_markup=merge_keyboard()
+        )
+        return AWAITING_SECOND_PDF
+    
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
@@ -444,139 +1065,249 @@ async def merge_first_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     os.makedirs(TEMP_DIR, exist_ok=True)
     
     upload_path = os.path.join(TEMP_DIR, f"{unique_id}_{document.file_name}")
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
-    
-    # Save path to user data
-    user_data_store[user_id]["pdfs"].append(upload_path)
     
-    # Ask for second PDF
-    keyboard = [
-        [
-            InlineKeyboardButton("Merge Now", callback_data="merge_now"),
-            InlineKeyboardButton("Cancel", callback_data="cancel_merge")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # The download outlives this handler, so it holds its own share of the disk
+    # budget until the file is on disk
+    async def on_disk_wait() -> None:
+        await get_status(update, context).update("💾 Waiting for disk space to free up...")
+    reserved = document.file_size or workspace.estimate(None)
+    await workspace.acquire(reserved, on_disk_wait)
+    
+    # Save the input to the session before it has been downloaded, so it is
+    # cleaned up with the session whatever happens to the download. Earlier
+    # downloads may have updated the session while waiting for disk space.
+    async with merge_lock(user_id):
+        session = await asyncio.to_thread(session_store.get, user_id)
+        if not session or session.kind != "merge":
+            await workspace.release(reserved)
+            await update.message.reply_text("❗ Please start over with /merge command.")
+            return ConversationHandler.END
+        inputs = session.data.setdefault("inputs", [])
+        inputs.append({
+            "path": upload_path, "name": document.file_name, "size": document.file_size, "pages": None, "range": None
+        })
+        session.files.append(upload_path)
+        await asyncio.to_thread(session_store.save, session)
+    
+    # Download and validate in the background while the user sends more files
+    task = asyncio.create_task(prefetch_merge_input(
+        context.bot, update.effective_chat.id, user_id, document.file_id, upload_path, document.file_name
+    ))
+    task.add_done_callback(lambda _: workspace.release_soon(reserved))
+    merge_prefetch.setdefault(user_id, {})[upload_path] = task
     
     await update.message.reply_text(
         f"✅ Received PDF: {document.file_name}\n\n"
-        f"Send another PDF to add to the merge, or click 'Merge Now' to complete.",
-        reply_markup=reply_markup
+        f"{format_merge_inputs(inputs)}\n\n"
+        f"Send another PDF to add to the merge, or click 'Merge Now' to complete.\n"
+        f"To change the merge, send:\n"
+        f"• order 2 1 3 (reorder the files)\n"
+        f"• pages 2 1-5,8 (only use pages 1-5 and 8 of file 2)\n"
+        f"• pages 2 all (use every page of file 2 again)\n"
+        f"• remove 2 (leave file 2 out)",
+        reply_markup=merge_keyboard()
     )
     
     return AWAITING_SECOND_PDF
 
+async def merge_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Reorder merge inputs, choose their pages or remove them."""
+    user_id = update.effective_user.id
+    
+    if update.message.text.strip().lower().startswith("pages"):
+        # Page ranges are checked against the page counts, so let the files be read first
+        await wait_for_merge_inputs(user_id)
+    
+    async with merge_lock(user_id):
+        return await edit_merge_inputs(update, user_id)
+
+async def edit_merge_inputs(update: Update, user_id: int) -> int:
+    """merge_edit with the user's merge lock held."""
+    session = await asyncio.to_thread(session_store.get, user_id)
+    if not session or session.kind != "merge":
+        await update.message.reply_text("❗ Please start over with /merge command.")
+        return ConversationHandler.END
+    
+    inputs = session.data.get("inputs", [])
+    if not inputs:
+        await update.message.reply_text("❗ Send me a PDF file first.")
+        return AWAITING_SECOND_PDF
+    
+    command, _, argument = update.message.text.strip().partition(" ")
+    command = command.lower()
+    argument = argument.strip()
+    
+    if command == "order":
+        try:
+            order = [int(number) for number in argument.replace(",", " ").split()]
+        except ValueError:
+            order = []
+        if sorted(order) != list(range(1, len(inputs) + 1)):
+            await update.message.reply_text(
+                f"❗ Please list every file number once, e.g. order {' '.join(map(str, range(len(inputs), 0, -1)))}"
+            )
+            return AWAITING_SECOND_PDF
+        inputs = [inputs[number - 1] for number in order]
+    elif command in ("pages", "remove"):
+        number, _, page_input = argument.partition(" ")
+        if not number.isdigit() or not 1 <= int(number) <= len(inputs):
+            await update.message.reply_text(f"❗ Please give a file number from 1 to {len(inputs)}.")
+            return AWAITING_SECOND_PDF
+        index = int(number) - 1
+        if command == "remove":
+            item = inputs.pop(index)
+            task = merge_prefetch.get(user_id, {}).pop(item["path"], None)
+            if task:
+                task.cancel()
+            session.files = [file for file in session.files if file != item["path"]]
+            remove_files([item["path"]])
+        else:
+            page_input = page_input.replace(" ", "")
+            if page_input.lower() in ("", "all"):
+                inputs[index]["range"] = None
+            else:
+                page_count = inputs[index]["pages"]
+                if page_count is None or not parse_page_numbers(page_input, page_count):
+                    await update.message.reply_text(
+                        "❗ Invalid page numbers. Please try again with correct page numbers."
+                    )
+                    return AWAITING_SECOND_PDF
+                inputs[index]["range"] = page_input
+    elif command != "list":
+        await update.message.reply_text(
+            "❗ Send another PDF, or one of: order 2 1 3, pages 2 1-5, pages 2 all, remove 2, list."
+        )
+        return AWAITING_SECOND_PDF
+    
+    session.data["inputs"] = inputs
+    await asyncio.to_thread(session_store.save, session)
+    
+    if not inputs:
+        await update.message.reply_text("📄 No PDFs left in the merge. Send me a PDF file.")
+        return AWAITING_SECOND_PDF
+    
+    await update.message.reply_text(
+        f"📄 Files to merge:\n{format_merge_inputs(inputs)}",
+        reply_markup=merge_keyboard()
+    )
+    return AWAITING_SECOND_PDF
+
+async def merge_files(update: Update) -> List[IncomingFile]:
+    """The inputs of the user's merge session, which size the merge job."""
+    session = await asyncio.to_thread(session_store.get, update.effective_user.id)
+    if not session or session.kind != "merge":
+        return []
+    return [(item.get("size"), "application/pdf") for item in session.data.get("inputs", [])]
+
+async def cancel_merge_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Cancel a merge; this takes no job slot, so it works while the bot is busy."""
+    query = update.callback_query
+    await query.answer()
+    
+    # Clean up temporary files
+    await discard_session(query.from_user.id)
+    
+    await query.edit_message_text("❌ PDF merge cancelled.")
+    return ConversationHandler.END
+
+@with_job_slot("merge", files=merge_files)
 async def merge_pdfs_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     
     user_id = query.from_user.id
     
-    if query.data == "cancel_merge":
-        # Clean up temporary files
-        if user_id in user_data_store and "pdfs" in user_data_store[user_id]:
-            for pdf_path in user_data_store[user_id]["pdfs"]:
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
-            del user_data_store[user_id]
+    # Most inputs have been downloaded and read while the user was sending
+    # the others; only the last few can still be in progress
+    await wait_for_merge_inputs(user_id)
+    session = await asyncio.to_thread(session_store.get, user_id)
+    inputs = session.data.get("inputs", []) if session and session.kind == "merge" else []
+    
+    # Check if we have at least one PDF
+    if not inputs:
+        await query.edit_message_text("❗ No PDFs to merge.")
+        await discard_session(user_id)
+        return ConversationHandler.END
+    
+    # If we only have one PDF, just return it
+    if len(inputs) == 1 and not inputs[0]["range"]:
+        await query.edit_message_text("⚠️ Only one PDF received. No merge needed.")
+        pdf_path = inputs[0]["path"]
+        
+        # Send the file
+        with open_upload(pdf_path, inputs[0]["name"]) as f, metrics.track_upload(pdf_path):
+            await context.bot.send_document(
+                chat_id=query.message.chat_id,
+                document=f,
+                caption="✅ Here's your PDF!"
+            )
         
-        await query.edit_message_text("❌ PDF merge cancelled.")
+        # Clean up
+        await discard_session(user_id)
         return ConversationHandler.END
     
-    elif query.data == "merge_now":
-        # Check if we have at least one PDF
-        if user_id not in user_data_store or "pdfs" not in user_data_store[user_id] or len(user_data_store[user_id]["pdfs"]) < 1:
-            await query.edit_message_text("❗ No PDFs to merge.")
-            return ConversationHandler.END
+    # Merge PDFs
+    await query.edit_message_text("🔄 Merging PDFs...")
+    
+    output_path = None
+    try:
+        # Inputs of a session restored from before a restart were never read
+        for item in inputs:
+            if item["pages"] is None:
+                item["pages"] = await conversion_executor.run(conversions.count_pdf_pages, item["path"])
         
-        # If we only have one PDF, just return it
-        if len(user_data_store[user_id]["pdfs"]) == 1:
-            await query.edit_message_text("⚠️ Only one PDF received. No merge needed.")
-            pdf_path = user_data_store[user_id]["pdfs"][0]
-            
-            # Send the file
-            with open(pdf_path, "rb") as f:
-                await context.bot.send_document(
-                    chat_id=query.message.chat_id,
-                    document=f,
-                    filename=os.path.basename(pdf_path),
-                    caption="✅ Here's your PDF!"
-                )
-            
-            # Clean up
-            os.remove(pdf_path)
-            del user_data_store[user_id]
-            return ConversationHandler.END
+        page_numbers = [
+            parse_page_numbers(item["range"], item["pages"]) if item["range"] else None
+            for item in inputs
+        ]
+        page_total = sum(
+            len(pages) if pages is not None else item["pages"] for item, pages in zip(inputs, page_numbers)
+        )
+        
+        # Generate unique ID for output
+        unique_id = str(uuid.uuid4())
+        output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_merged.pdf")
         
         # Merge PDFs
-        await query.edit_message_text("🔄 Merging PDFs...")
+        await conversion_executor.run(
+            conversions.merge_pdfs, [item["path"] for item in inputs], output_path, page_numbers
+        )
         
-        try:
-            # Generate unique ID for output
-            unique_id = str(uuid.uuid4())
-            output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_merged.pdf")
-            
-            # Create directories if not exist
-            os.makedirs(CONVERTED_DIR, exist_ok=True)
-            
-            # Merge PDFs
-            pdf_merger = PyPDF2.PdfMerger()
-            for pdf_path in user_data_store[user_id]["pdfs"]:
-                pdf_merger.append(pdf_path)
-            
-            # Save merged PDF
-            with open(output_path, "wb") as output_file:
-                pdf_merger.write(output_file)
-            
-            # Send the merged file
-            with open(output_path, "rb") as f:
-                await context.bot.send_document(
-                    chat_id=query.message.chat_id,
-                    document=f,
-                    filename=f"merged_pdf_{unique_id}.pdf",
-                    caption=f"✅ Here's your merged PDF! ({len(user_data_store[user_id]['pdfs'])} files combined)"
-                )
-            
-            # Clean up
-            for pdf_path in user_data_store[user_id]["pdfs"]:
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
-            
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            
-            del user_data_store[user_id]
-            
-            return ConversationHandler.END
-        except Exception as e:
-            logger.error(f"PDF merge error: {e}")
-            await context.bot.send_message(
+        # Send the merged file
+        with open_upload(output_path, f"merged_pdf_{unique_id}.pdf") as f, metrics.track_upload(output_path):
+            await context.bot.send_document(
                 chat_id=query.message.chat_id,
-                text=f"⚠️ Error merging PDFs: {str(e)}"
+                document=f,
+                caption=f"✅ Here's your merged PDF! ({len(inputs)} files, {page_total} pages combined)"
             )
-            
-            # Clean up
-            if user_id in user_data_store and "pdfs" in user_data_store[user_id]:
-                for pdf_path in user_data_store[user_id]["pdfs"]:
-                    if os.path.exists(pdf_path):
-                        os.remove(pdf_path)
-                del user_data_store[user_id]
-            
-            return ConversationHandler.END
-    
-    return AWAITING_SECOND_PDF
+        
+        return ConversationHandler.END
+    except Exception as e:
+        logger.error(f"PDF merge error: {e}")
+        await context.bot.send_message(
+            chat_id=query.message.chat_id,
+            text=f"⚠️ Error merging PDFs: {str(e)}"
+        )
+        
+        return ConversationHandler.END
+    finally:
+        # Clean up
+        await discard_session(user_id)
+        if output_path and os.path.exists(output_path):
+            os.remove(output_path)
 
 # PDF Extract Pages functionality
 async def extract_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    user_data_store[user_id] = {}
+    await discard_session(user_id)
+    await asyncio.to_thread(session_store.save, Session(user_id, "extract"))
     
     await update.message.reply_text(
         "✂️ PDF Extract Pages started. Send me the PDF file."
     )
     return AWAITING_PAGE_NUMBERS
 
+@with_job_slot("upload", rate_limited=False)
 async def extract_receive_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     document = update.message.document
@@ -585,6 +1316,11 @@ async def extract_receive_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❗ Please send a PDF file.")
         return AWAITING_PAGE_NUMBERS
     
+    session = await asyncio.to_thread(session_store.get, user_id)
+    if not session or session.kind != "extract":
+        await update.message.reply_text("❗ Please start over with /extract command.")
+        return ConversationHandler.END
+    
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
@@ -592,119 +1328,113 @@ async def extract_receive_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE
     os.makedirs(TEMP_DIR, exist_ok=True)
     
     upload_path = os.path.join(TEMP_DIR, f"{unique_id}_{document.file_name}")
-    file = await context.bot.get_file(document.file_id)
-    await file.download_to_drive(upload_path)
     
-    # Save path to user data
-    user_data_store[user_id]["pdf_path"] = upload_path
+    # The PDF stays in temp/ for the rest of the conversation, outside the
+    # job's workspace, so its download holds its own share of the disk budget
+    async def on_disk_wait() -> None:
+        await get_status(update, context).update("💾 Waiting for disk space to free up...")
+    reserved = document.file_size or workspace.estimate(None)
+    await workspace.acquire(reserved, on_disk_wait)
+    try:
+        await download_file(context.bot, document.file_id, upload_path)
+    finally:
+        await workspace.release(reserved)
+    
+    # A new PDF replaces any previously sent one
+    remove_files(session.files)
+    session.files = [upload_path]
+    session.data["reader_key"] = document.file_unique_id
+    await asyncio.to_thread(session_store.save, session)
     
-    # Get page count
+    # Get page count; the worker keeps the parsed PDF for extracting the pages
     try:
-        with open(upload_path, "rb") as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            page_count = len(reader.pages)
-            user_data_store[user_id]["page_count"] = page_count
-            
-            await update.message.reply_text(
-                f"✅ Received PDF: {document.file_name} ({page_count} pages)\n\n"
-                f"Now, send me the page numbers you want to extract.\n"
-                f"Examples:\n"
-                f"• 1,3,5 (pages 1, 3, and 5)\n"
-                f"• 1-5 (pages 1 through 5)\n"
-                f"• 1,3-5,7 (pages 1, 3, 4, 5, and 7)"
-            )
-            
-            return AWAITING_PAGE_NUMBERS
+        page_count = await conversion_executor.run(
+            readers.with_reader, document.file_unique_id, upload_path, conversions.pdf_page_count,
+            affinity=document.file_unique_id,
+        )
+        session.page_count = page_count
+        await asyncio.to_thread(session_store.save, session)
+        
+        await update.message.reply_text(
+            f"✅ Received PDF: {document.file_name} ({page_count} pages)\n\n"
+            f"Now, send me the page numbers you want to extract.\n"
+            f"Examples:\n"
+            f"• 1,3,5 (pages 1, 3, and 5)\n"
+            f"• 1-5 (pages 1 through 5)\n"
+            f"• 1,3-5,7 (pages 1, 3, 4, 5, and 7)"
+        )
+        
+        return AWAITING_PAGE_NUMBERS
     except Exception as e:
         logger.error(f"PDF extract error: {e}")
         await update.message.reply_text(f"⚠️ Error processing PDF: {str(e)}")
         
         # Clean up
-        if os.path.exists(upload_path):
-            os.remove(upload_path)
-        
-        if user_id in user_data_store:
-            del user_data_store[user_id]
+        await discard_session(user_id)
         
         return ConversationHandler.END
 
+@with_job_slot("extract")
 async def extract_process_pages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     
-    if user_id not in user_data_store or "pdf_path" not in user_data_store[user_id]:
+    session = await asyncio.to_thread(session_store.get, user_id)
+    if not session or session.kind != "extract" or not session.files or session.page_count is None:
         await update.message.reply_text("❗ Please start over with /extract command.")
         return ConversationHandler.END
     
     page_input = update.message.text.strip()
     
+    output_path = None
     try:
         # Parse page numbers
-        page_numbers = parse_page_numbers(page_input, user_data_store[user_id]["page_count"])
+        page_numbers = parse_page_numbers(page_input, session.page_count)
         
         if not page_numbers:
             await update.message.reply_text(
                 "❗ Invalid page numbers. Please try again with correct page numbers."
             )
+            await asyncio.to_thread(session_store.save, session)
             return AWAITING_PAGE_NUMBERS
         
         # Extract pages
-        await update.message.reply_text(f"🔄 Extracting pages {', '.join(map(str, page_numbers))}...")
+        await get_status(update, context).update(f"🔄 Extracting pages {', '.join(map(str, page_numbers))}...")
         
         # Generate unique ID for output
         unique_id = str(uuid.uuid4())
-        output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_extracted.pdf")
-        
-        # Create directories if not exist
-        os.makedirs(CONVERTED_DIR, exist_ok=True)
+        output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_extracted.pdf")
         
         # Extract pages
-        pdf_path = user_data_store[user_id]["pdf_path"]
+        pdf_path = session.files[0]
         
-        with open(pdf_path, "rb") as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            writer = PyPDF2.PdfWriter()
-            
-            # Add selected pages
-            for page_num in page_numbers:
-                # Convert to 0-indexed
-                writer.add_page(reader.pages[page_num - 1])
-            
-            # Save extracted PDF
-            with open(output_path, "wb") as output_file:
-                writer.write(output_file)
+        reader_key = session.data.get("reader_key")
+        await conversion_executor.run(
+            readers.with_reader, reader_key, pdf_path, conversions.write_pdf_pages, page_numbers, output_path,
+            affinity=reader_key,
+        )
         
         # Send the extracted file
-        with open(output_path, "rb") as f:
+        with open_upload(output_path, f"extracted_pages.pdf") as f, metrics.track_upload(output_path):
             await update.message.reply_document(
                 document=f,
-                filename=f"extracted_pages.pdf",
                 caption=f"✅ Here are the extracted pages! ({len(page_numbers)} pages)"
             )
         
         # Clean up
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
-        
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        
-        if user_id in user_data_store:
-            del user_data_store[user_id]
+        await discard_session(user_id)
         
         return ConversationHandler.END
     except Exception as e:
         logger.error(f"PDF extract error: {e}")
-        await update.message.reply_text(f"⚠️ Error extracting pages: {str(e)}")
+        await get_status(update, context).update(f"⚠️ Error extracting pages: {str(e)}", final=True)
         
         # Clean up
-        if user_id in user_data_store and "pdf_path" in user_data_store[user_id]:
-            if os.path.exists(user_data_store[user_id]["pdf_path"]):
-                os.remove(user_data_store[user_id]["pdf_path"])
-        
-        if user_id in user_data_store:
-            del user_data_store[user_id]
+        await discard_session(user_id)
         
         return ConversationHandler.END
+    finally:
+        if output_path and os.path.exists(output_path):
+            os.remove(output_path)
 
 def parse_page_numbers(page_input: str, max_pages: int) -> List[int]:
     """Parse page numbers from user input."""
@@ -738,125 +1468,235 @@ def parse_page_numbers(page_input: str, max_pages: int) -> List[int]:
     # Remove duplicates and sort
     return sorted(list(set(page_numbers)))
 
+@with_job_slot("ocr")
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle photos for OCR."""
+    await process_photo(update, context)
+
+async def process_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     photo = update.message.photo[-1]  # Get the largest photo
     
-    await update.message.reply_text("🔍 Processing image with OCR...")
+    # Only the options are used; other caption text is ignored
+    caption = update.message.caption or ""
+    if caption.lower().startswith("/ocr"):
+        caption = caption.partition(" ")[2]
+    try:
+        _, ocr_options = parse_ocr_arguments(caption)
+    except ValueError as e:
+        await update.message.reply_text(f"❗ {e} Example: /ocr lang=eng+deu psm=6")
+        return
+    
+    cache_params = None if ocr_options == OcrOptions() else (None, ocr_options.lang, ocr_options.psm)
+    cache_key = result_cache.make_key(photo.file_unique_id, "ocr", cache_params)
+    if await send_cached_result(update, context, cache_key):
+        return
+    
+    await get_status(update, context).update("🔍 Processing image with OCR...")
     
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
-    
-    image_path = os.path.join(UPLOAD_DIR, f"{unique_id}_photo.jpg")
-    file = await context.bot.get_file(photo.file_id)
-    await file.download_to_drive(image_path)
+    image_path = job_path(context, UPLOAD_DIR, f"{unique_id}_photo.jpg")
+    source = await download_source(context.bot, photo.file_id, image_path, photo.file_size)
     
     try:
         # Extract text from image
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image)
+        report = await conversion_executor.run(conversions.image_to_text, source, ocr_options)
+        record_ocr_report(report)
+        text = report.text
         
         if not text.strip():
-            await update.message.reply_text("⚠️ No text could be extracted from this image.")
+            await get_status(update, context).update("⚠️ No text could be extracted from this image.", final=True)
             return
         
         # Save text to file
-        output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_ocr_text.txt")
+        output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_ocr_text.txt")
         with open(output_path, "w", encoding="utf-8") as text_file:
             text_file.write(text)
         
         # Send the extracted text
-        await send_converted_file(update, context, output_path, "text/plain")
+        await send_converted_file(update, context, output_path, "text/plain", cache_key)
     except Exception as e:
         logger.error(f"OCR error: {e}")
-        await update.message.reply_text(f"⚠️ Error extracting text from image: {str(e)}")
+        await get_status(update, context).update(f"⚠️ Error extracting text from image: {str(e)}", final=True)
     finally:
         # Cleanup uploaded file
         if os.path.exists(image_path):
             os.remove(image_path)
 
+def parse_img2pdf_caption(caption: Optional[str]) -> Optional[bool]:
+    """Return whether "compact" was asked for, or None if the caption is not an /img2pdf command."""
+    command, _, arguments = (caption or "").partition(" ")
+    if command.lower() != "/img2pdf":
+        return None
+    return "compact" in arguments.lower().split()
+
+def message_image(message) -> Optional[Tuple[str, Optional[int]]]:
+    """The (file_id, file_size) of the image in a photo or image document message."""
+    if message.photo:
+        photo = message.photo[-1]  # Get the largest photo
+        return photo.file_id, photo.file_size
+    document = message.document
+    if document and document.mime_type and document.mime_type.startswith("image/"):
+        return document.file_id, document.file_size
+    return None
+
+@with_job_slot("img2pdf")
 async def handle_image_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Convert images to PDF."""
-    # Check if it's from a command
-    command = False
-    if update.message.caption and update.message.caption.startswith("/img2pdf"):
-        command = True
-
-    if command:
-        # From photo with caption
-        if update.message.photo:
-            photo = update.message.photo[-1]  # Get the largest photo
-            await process_single_image_to_pdf(update, context, photo.file_id)
-        # From document with caption
+    compact = parse_img2pdf_caption(update.message.caption)
+
+    if compact is not None:
+        image = message_image(update.message)
+        if image:
+            await process_images_to_pdf(update, context, [image], compact)
         elif update.message.document:
-            document = update.message.document
-            if not document.mime_type or not document.mime_type.startswith("image/"):
-                await update.message.reply_text("❗ Please send an image file with /img2pdf caption.")
-                return
-            await process_single_image_to_pdf(update, context, document.file_id)
+            await update.message.reply_text("❗ Please send an image file with /img2pdf caption.")
         else:
             await update.message.reply_text("❗ Please send an image with /img2pdf caption.")
     else:
         # Direct command
         await update.message.reply_text(
-            "🖼️ Send me an image with caption /img2pdf to convert it to PDF."
+            "🖼️ Send me an image, or several at once as an album, with caption /img2pdf to convert them to PDF.\n"
+            "Add 'compact' to the caption for a smaller file."
+        )
+
+class AlbumImageFilter(filters.MessageFilter):
+    """Images that are part of an album (media group)."""
+
+    def filter(self, message) -> bool:
+        return bool(message.media_group_id) and message_image(message) is not None
+
+async def collect_album_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    album_collector.add(update, context)
+
+async def process_album(updates: List[Update], context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Turn a batch of album images into one PDF if any of them asked for it, else handle each on its own."""
+    captions = [parse_img2pdf_caption(u.effective_message.caption) for u in updates]
+    if any(compact is not None for compact in captions):
+        # Reply to the message that carried the command
+        first = next(u for u, compact in zip(updates, captions) if compact is not None)
+        await convert_album_to_pdf(first, context, updates, any(captions))
+        return
+
+    await handle_album_items(updates[0], context, updates)
+
+@with_job_slot("ocr", files=album_files)
+async def handle_album_items(update: Update, context: ContextTypes.DEFAULT_TYPE, updates: List[Update]) -> None:
+    """OCR each image of an album in turn, as a single job with one rate-limit token and disk reservation."""
+    for item in updates:
+        try:
+            if item.effective_message.photo:
+                await process_photo(item, context)
+            else:
+                await process_document(item, context)
+        except (AdmissionError, FileTooLargeError) as e:
+            await item.effective_message.reply_text(f"❗ {e}")
+        finally:
+            # Each image reports progress in a status message of its own
+            status = getattr(context, "status_message", None)
+            if status:
+                await status.close()
+            context.status_message = None
+
+# Batches album images per chat and user before handing them to process_album
+album_collector = AlbumCollector(process_album)
+
+@with_job_slot("img2pdf", files=album_files)
+async def convert_album_to_pdf(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, updates: List[Update], compact: bool
+) -> None:
+    images = [message_image(u.effective_message) for u in updates]
+    if len(images) > IMG2PDF_MAX_IMAGES:
+        await update.message.reply_text(
+            f"❗ Please send at most {IMG2PDF_MAX_IMAGES} images at a time. Received {len(images)}."
         )
+        return
+    await process_images_to_pdf(update, context, images, compact)
 
-async def process_single_image_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE, file_id: str) -> None:
-    """Process a single image to PDF."""
-    await update.message.reply_text("🔄 Converting image to PDF...")
+async def process_images_to_pdf(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, images: List[Tuple[str, Optional[int]]], compact: bool = False
+) -> None:
+    """Download images concurrently and combine them into a single PDF."""
+    status = get_status(update, context)
+    noun = "image" if len(images) == 1 else f"{len(images)} images"
+    await status.update(f"🔄 Converting {noun} to PDF...")
     
     # Generate unique filenames
     unique_id = str(uuid.uuid4())
     
-    # Create directories if not exist
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(CONVERTED_DIR, exist_ok=True)
+    image_paths = [job_path(context, UPLOAD_DIR, f"{unique_id}_image_{i}") for i in range(len(images))]
+    output_path = job_path(context, CONVERTED_DIR, f"{unique_id}_image_to_pdf.pdf")
     
-    image_path = os.path.join(UPLOAD_DIR, f"{unique_id}_image.jpg")
-    output_path = os.path.join(CONVERTED_DIR, f"{unique_id}_image_to_pdf.pdf")
+    downloads = asyncio.Semaphore(ALBUM_DOWNLOAD_CONCURRENCY)
     
-    file = await context.bot.get_file(file_id)
-    await file.download_to_drive(image_path)
+    async def download(image: Tuple[str, Optional[int]], image_path: str) -> FileSource:
+        async with downloads:
+            return await download_source(context.bot, image[0], image_path, image[1])
     
     try:
-        # Convert image to PDF using img2pdf
-        with open(image_path, "rb") as image_file:
-            pdf_bytes = img2pdf.convert(image_file)
-            
-            with open(output_path, "wb") as pdf_file:
-                pdf_file.write(pdf_bytes)
+        sources = await asyncio.gather(*(download(image, path) for image, path in zip(images, image_paths)))
+        
+        if compact:
+            max_side, quality = IMG2PDF_COMPACT_SIDE, IMG2PDF_COMPACT_QUALITY
+        else:
+            max_side, quality = IMG2PDF_MAX_SIDE, None
+        # Convert all images with a single img2pdf call
+        await conversion_executor.run(conversions.images_to_pdf, sources, output_path, max_side, quality)
         
         # Send the PDF
         await send_converted_file(update, context, output_path, "application/pdf")
     except Exception as e:
         logger.error(f"Image to PDF error: {e}")
-        await update.message.reply_text(f"⚠️ Error converting image to PDF: {str(e)}")
+        await status.update(f"⚠️ Error converting image to PDF: {str(e)}", final=True)
     finally:
-        # Cleanup uploaded file
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        # Cleanup uploaded files
+        remove_files(image_paths)
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle unexpected errors."""
     logger.error(f"Update {update} caused error {context.error}")
+    metrics.ERRORS.labels(metrics.current_operation.get(), "unhandled").inc()
     if isinstance(update, Update) and update.message:
         await update.message.reply_text("⚠️ Unexpected error occurred. Please try again later.")
 
 async def webhook(request: web.Request) -> web.Response:
     """Handle incoming webhook updates from Telegram."""
-    update = Update.de_json(await request.json(), application.bot)
-    if update:
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return web.Response(status=403)
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except ValueError:
+        return web.Response(status=400)
+    if not update:
+        return web.Response(status=200)
+
+    if WEBHOOK_MODE == "inline":
         await application.process_update(update)
+    elif not update_queue.submit(update):
+        # Queue is full; Telegram will redeliver the update later
+        logger.warning(f"Update queue full, rejecting update {update.update_id}")
+        return web.Response(status=503)
     return web.Response(status=200)
 
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Expose bot metrics in the Prometheus text format."""
+    for directory in (UPLOAD_DIR, CONVERTED_DIR, TEMP_DIR):
+        size = await asyncio.to_thread(metrics.directory_size, directory)
+        metrics.DISK_USAGE.labels(directory).set(size)
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
 async def setup_application() -> tuple[Application, web.Application]:
     """Set up the Telegram application and aiohttp server."""
-    application = Application.builder().token(TOKEN).build()
+    builder = Application.builder().token(TOKEN).rate_limiter(OutboundRateLimiter())
+    if TELEGRAM_API_URL:
+        api_url = TELEGRAM_API_URL.rstrip("/")
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    # Conversation states are stored with the sessions, so conversations resume after a restart
+    persistence = create_conversation_persistence()
+    if persistence:
+        builder = builder.persistence(persistence)
+    application = builder.build()
 
     # Basic handlers
     application.add_handler(CommandHandler("start", start))
@@ -864,14 +1704,23 @@ async def setup_application() -> tuple[Application, web.Application]:
     
     # Single-command handlers
     application.add_handler(CommandHandler("img2pdf", handle_image_to_pdf))
+    application.add_handler(MessageHandler(
+        (filters.PHOTO | filters.Document.IMAGE) & ~AlbumImageFilter() & filters.CaptionRegex(r"(?i)^/img2pdf\b"),
+        handle_image_to_pdf,
+    ))
     
     # Text to PDF conversation handler
     text_to_pdf_handler = ConversationHandler(
         entry_points=[CommandHandler("text2pdf", text_to_pdf_start)],
         states={
-            AWAITING_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, text_to_pdf_process)]
+            AWAITING_TEXT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, text_to_pdf_process),
+                MessageHandler(filters.Document.FileExtension("txt"), text_to_pdf_document),
+            ]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="text2pdf",
+        persistent=persistence is not None
     )
     application.add_handler(text_to_pdf_handler)
     
@@ -881,11 +1730,14 @@ async def setup_application() -> tuple[Application, web.Application]:
         states={
             AWAITING_SECOND_PDF: [
                 MessageHandler(filters.Document.ALL & ~filters.COMMAND, merge_first_pdf),
-                CallbackQueryHandler(merge_pdfs_button, pattern=r"^(merge_now|cancel_merge)$")
+                MessageHandler(filters.TEXT & ~filters.COMMAND, merge_edit),
+                CallbackQueryHandler(merge_pdfs_button, pattern=r"^merge_now$"),
+                CallbackQueryHandler(cancel_merge_button, pattern=r"^cancel_merge$")
             ]
         },
         fallbacks=[CommandHandler("cancel", cancel)],
-        per_message=True
+        name="merge",
+        persistent=persistence is not None
     )
     application.add_handler(merge_handler)
     
@@ -899,10 +1751,14 @@ async def setup_application() -> tuple[Application, web.Application]:
             ]
         },
         fallbacks=[CommandHandler("cancel", cancel)],
-        per_message=True
+        name="extract",
+        persistent=persistence is not None
     )
     application.add_handler(extract_handler)
     
+    # Albums are collected first and then converted together or handled item by item
+    application.add_handler(MessageHandler(AlbumImageFilter(), collect_album_image))
+    
     # Document handler for file conversions
     application.add_handler(MessageHandler(filters.Document.ALL & ~filters.COMMAND, handle_document))
     
@@ -915,16 +1771,27 @@ async def setup_application() -> tuple[Application, web.Application]:
     # Set up aiohttp server
     app = web.Application()
     app.router.add_post('/webhook', webhook)
+    app.router.add_get('/metrics', metrics_endpoint)
     
     return application, app
 
 async def main():
     """Start the bot with webhook."""
-    global application
+    global application, update_queue
+    ocrengine.check_engine()
     application, aiohttp_app = await setup_application()
+    update_queue = UpdateQueue(application.process_update)
+    metrics.UPDATES_PENDING.set_function(lambda: update_queue.pending)
+    metrics.JOBS_QUEUED.set_function(lambda: job_scheduler.queued)
+    metrics.WORKSPACE_RESERVED_BYTES.set_function(lambda: workspace.reserved)
+    
+    await application.initialize()
+    await application.start()
+    sweeper = asyncio.create_task(run_sweeper(session_store))
+    workspace_sweeper = asyncio.create_task(workspace.run_sweeper(session_store.referenced_files))
     
     # Set webhook
-    await application.bot.set_webhook(url=WEBHOOK_URL)
+    await application.bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
     
     # Start aiohttp server
     runner = web.AppRunner(aiohttp_app)
@@ -933,7 +1800,20 @@ async def main():
     await site.start()
     
     print(f"🤖 Bot is running with webhook at {WEBHOOK_URL}...")
+    
+    try:
+        # Serve until the process is stopped
+        await asyncio.Event().wait()
+    finally:
+        sweeper.cancel()
+        workspace_sweeper.cancel()
+        await runner.cleanup()
+        await update_queue.stop()
+        await application.stop()
+        await application.shutdown()
+        await album_collector.stop()
+        await conversion_executor.shutdown()
+        session_store.close()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+import metrics
+from conversions import map_source
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", 500)) * 1024 * 1024)
+CACHE_TTL = int(os.getenv("CACHE_TTL", 7 * 24 * 3600))
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: str
+    filename: str
+    size: int
+    file_id: Optional[str]
+
+def file_digest(source: Union[str, bytes]) -> str:
+    """SHA-256 of a file's contents, for sources without a Telegram file_unique_id."""
+    # Hashed straight from the buffer; a mapped file is paged in by the OS, not copied
+    with map_source(source) as data:
+        return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """Disk-backed cache of conversion results with LRU eviction and a TTL.
+
+    Entries are keyed on the source file identity, the operation and its
+    parameters. Alongside the stored file we remember the Telegram file_id
+    of the last upload so a hit can usually be re-sent without uploading.
+
+    Methods block on disk and SQLite, so the bot calls them from worker
+    threads; a lock keeps the shared connection to one caller at a time.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, ttl: int = CACHE_TTL) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL,"
+            " file_id TEXT, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(source_id: str, operation: str, params: Any = None) -> str:
+        raw = json.dumps([source_id, operation, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        row = self._db.execute(
+            "SELECT filename, size, file_id, created FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            metrics.CACHE_REQUESTS.labels("miss").inc()
+            return None
+        filename, size, file_id, created = row
+        path = self._path(key)
+        if time.time() - created > self.ttl or not os.path.exists(path):
+            self._delete(key)
+            metrics.CACHE_REQUESTS.labels("miss").inc()
+            return None
+        metrics.CACHE_REQUESTS.labels("hit").inc()
+        self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return CacheEntry(key, path, filename, size, file_id)
+
+    def put(self, key: str, file_path: str, filename: Optional[str] = None, file_id: Optional[str] = None) -> None:
+        """Store a copy of file_path under key."""
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            shutil.copyfile(file_path, self._path(key))
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, filename, size, file_id, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, filename or os.path.basename(file_path), size, file_id, now, now),
+            )
+            self._db.commit()
+            self._evict()
+
+    def set_file_id(self, key: str, file_id: Optional[str]) -> None:
+        with self._lock:
+            self._db.execute("UPDATE entries SET file_id = ? WHERE key = ?", (file_id, key))
+            self._db.commit()
+
+    def _delete(self, key: str) -> None:
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._db.commit()
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under the size limit."""
+        for (key,) in self._db.execute(
+            "SELECT key FROM entries WHERE created < ?", (time.time() - self.ttl,)
+        ).fetchall():
+            self._delete(key)
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            self._delete(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        logger.info(f"Result cache evicted down to {total / 1024 / 1024:.1f} MB")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
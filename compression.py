@@ -0,0 +1,216 @@
+import io
+import re
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import PyPDF2
+from PyPDF2.generic import IndirectObject, NameObject, NumberObject
+from PIL import Image
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class CompressionPreset:
+    dpi: int
+    jpeg_quality: int
+    strip_metadata: bool
+
+# Named after Ghostscript's PDFSETTINGS, which users tend to know
+PRESETS = {
+    "screen": CompressionPreset(dpi=72, jpeg_quality=50, strip_metadata=True),
+    "ebook": CompressionPreset(dpi=150, jpeg_quality=65, strip_metadata=True),
+    "print": CompressionPreset(dpi=300, jpeg_quality=85, strip_metadata=False),
+}
+DEFAULT_PRESET = "ebook"
+
+# Images smaller than this are not worth re-encoding
+MIN_IMAGE_BYTES = 10 * 1024
+
+# Operators in a content stream that reference named resources
+_XOBJECT_USE = re.compile(rb"/([^\s/\[\]()<>{}%]+)\s+Do\b")
+_FONT_USE = re.compile(rb"/([^\s/\[\]()<>{}%]+)\s+[-+]?[\d.]+\s+Tf\b")
+
+@dataclass
+class CompressionReport:
+    preset: str
+    original_size: int = 0
+    compressed_size: int = 0
+    images_recompressed: int = 0
+    duplicates_removed: int = 0
+    resources_removed: int = 0
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of the original size that was saved."""
+        if not self.original_size:
+            return 0.0
+        return 1 - self.compressed_size / self.original_size
+
+def _decode_image(image_obj) -> Optional[Image.Image]:
+    """Decode an image XObject into a PIL image, or None if it is a kind we leave alone."""
+    if image_obj.get("/ImageMask") or "/Mask" in image_obj or "/Decode" in image_obj:
+        return None
+
+    filters = image_obj.get("/Filter")
+    if isinstance(filters, list):
+        filters = filters[0] if len(filters) == 1 else None
+
+    if filters == "/DCTDecode":
+        image = Image.open(io.BytesIO(image_obj._data))
+        image.load()
+        return image if image.mode in ("RGB", "L") else None
+
+    if filters not in (None, "/FlateDecode") or image_obj.get("/BitsPerComponent") != 8:
+        return None
+    color_space = image_obj.get("/ColorSpace")
+    mode = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}.get(color_space)
+    if mode is None:
+        return None
+    size = (int(image_obj["/Width"]), int(image_obj["/Height"]))
+    return Image.frombytes(mode, size, image_obj.get_data())
+
+def _recompress_image(image_obj, max_width: int, max_height: int, quality: int) -> bool:
+    """Downsample and JPEG-encode an image XObject in place. Returns True if it got smaller."""
+    original_bytes = len(image_obj._data)
+    if original_bytes < MIN_IMAGE_BYTES:
+        return False
+    try:
+        image = _decode_image(image_obj)
+    except Exception as e:
+        logger.debug(f"Skipping undecodable image: {e}")
+        return False
+    if image is None:
+        return False
+
+    if image.width > max_width or image.height > max_height:
+        image.thumbnail((max_width, max_height), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+    if len(data) >= original_bytes:
+        return False
+
+    image_obj._data = data
+    if hasattr(image_obj, "decoded_self"):
+        image_obj.decoded_self = None
+    image_obj[NameObject("/Filter")] = NameObject("/DCTDecode")
+    image_obj[NameObject("/Width")] = NumberObject(image.width)
+    image_obj[NameObject("/Height")] = NumberObject(image.height)
+    image_obj[NameObject("/BitsPerComponent")] = NumberObject(8)
+    image_obj[NameObject("/ColorSpace")] = NameObject("/DeviceRGB" if image.mode == "RGB" else "/DeviceGray")
+    if "/DecodeParms" in image_obj:
+        del image_obj["/DecodeParms"]
+    return True
+
+def _page_content(page) -> Optional[bytes]:
+    try:
+        contents = page.get_contents()
+        return contents.get_data() if contents is not None else b""
+    except Exception:
+        return None
+
+def _strip_unused(resources, category: str, used: set) -> int:
+    """Remove entries of a resource category that the page content never references."""
+    entries = resources.raw_get(category) if category in resources else None
+    if entries is None or isinstance(entries, IndirectObject):
+        # Missing, or possibly shared with other pages
+        return 0
+    removed = 0
+    for name in list(entries.keys()):
+        if name[1:].encode("latin-1") not in used:
+            del entries[name]
+            removed += 1
+    return removed
+
+def compress_pdf(source_file, output_path: str, preset: str = DEFAULT_PRESET, original_size: int = 0) -> CompressionReport:
+    """Compress a PDF read from a binary file object and write it to output_path."""
+    settings = PRESETS[preset]
+    report = CompressionReport(preset=preset, original_size=original_size)
+    timer = metrics.StageTimer(report.stage_seconds)
+
+    reader = PyPDF2.PdfReader(source_file)
+    pages = list(reader.pages)
+    timer.lap("parse")
+
+    # Work on the reader's objects: PdfWriter.add_page clones the page afterwards,
+    # and objects that are no longer referenced are simply not copied.
+    seen_images: Dict[bytes, IndirectObject] = {}
+    processed = set()
+    for page in pages:
+        resources = page.get("/Resources")
+        if resources is None:
+            continue
+        resources = resources.get_object()
+
+        content = _page_content(page)
+        if content is not None:
+            used_xobjects = set(_XOBJECT_USE.findall(content))
+            used_fonts = set(_FONT_USE.findall(content))
+            # Shared resource dictionaries may serve other pages too
+            if not isinstance(page.raw_get("/Resources"), IndirectObject):
+                report.resources_removed += _strip_unused(resources, "/XObject", used_xobjects)
+                report.resources_removed += _strip_unused(resources, "/Font", used_fonts)
+        timer.lap("resources")
+
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            continue
+        xobjects = xobjects.get_object()
+        page_width = float(page.mediabox.width) / 72
+        page_height = float(page.mediabox.height) / 72
+        for name in list(xobjects.keys()):
+            reference = xobjects.raw_get(name)
+            image_obj = xobjects[name].get_object()
+            if image_obj.get("/Subtype") != "/Image":
+                continue
+
+            # Point identical images at a single object
+            digest = hashlib.sha256(image_obj._data).digest() + repr(sorted(
+                (k, repr(v)) for k, v in image_obj.items() if k != "/Length"
+            )).encode()
+            if digest in seen_images and isinstance(reference, IndirectObject):
+                if seen_images[digest] != reference:
+                    xobjects[NameObject(name)] = seen_images[digest]
+                    report.duplicates_removed += 1
+                continue
+            if isinstance(reference, IndirectObject):
+                seen_images[digest] = reference
+            timer.lap("dedupe")
+
+            key = reference.idnum if isinstance(reference, IndirectObject) else id(image_obj)
+            if key in processed:
+                continue
+            processed.add(key)
+            # Assume the image spans at most the whole page to find its effective DPI
+            max_width = max(1, int(page_width * settings.dpi))
+            max_height = max(1, int(page_height * settings.dpi))
+            if _recompress_image(image_obj, max_width, max_height, settings.jpeg_quality):
+                report.images_recompressed += 1
+            timer.lap("images")
+
+    writer = PyPDF2.PdfWriter()
+    for page in pages:
+        new_page = writer.add_page(page)
+        if settings.strip_metadata:
+            for key in ("/Thumb", "/PieceInfo", "/Metadata"):
+                if key in new_page:
+                    del new_page[key]
+        try:
+            new_page.compress_content_streams()
+        except Exception as e:
+            logger.debug(f"Could not recompress a content stream: {e}")
+    timer.lap("content")
+
+    if not settings.strip_metadata and reader.metadata:
+        writer.add_metadata({k: v for k, v in reader.metadata.items() if isinstance(v, str)})
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+        report.compressed_size = output_file.tell()
+    timer.lap("write")
+    return report
@@ -0,0 +1,271 @@
+import io
+import os
+import mmap
+import time
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+from docx2pdf import convert
+from PIL import Image, ImageOps
+from pdf2image import convert_from_bytes, convert_from_path
+import img2pdf
+
+import compression
+import executor
+import ocrengine
+import ocrprep
+import textlayout
+
+logger = logging.getLogger(__name__)
+
+# Resolution used when rasterizing PDF pages for OCR
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+
+# These functions run inside the conversion worker processes (see executor.py),
+# so they must stay synchronous, picklable and free of any Telegram objects.
+
+# A downloaded input: a path on disk, or the file contents for small files kept in memory
+FileSource = Union[str, bytes]
+
+def open_source(source: FileSource) -> BinaryIO:
+    """Open a FileSource as a binary file object."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+@contextmanager
+def map_source(source: FileSource) -> Iterator[Union[bytes, mmap.mmap]]:
+    """Expose a FileSource as a read-only buffer without copying it: the bytes, or a memory map of the file."""
+    if isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def spill_source(source: FileSource, path: str) -> str:
+    """Write an in-memory source to path and return the path; paths are returned as they are."""
+    if isinstance(source, str):
+        return source
+    with open(path, "wb") as spilled:
+        spilled.write(source)
+    return path
+
+def source_size(source: FileSource) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return os.path.getsize(source)
+
+def iter_pdf_text(source: FileSource, pages: Optional[Iterable[int]] = None) -> Iterator[str]:
+    """Yield the text of each requested 1-indexed page (all pages by default)."""
+    with open_source(source) as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        if pages is None:
+            pages = range(1, len(reader.pages) + 1)
+        for page_num in pages:
+            yield reader.pages[page_num - 1].extract_text() or ""
+
+def render_pdf_pages(source: FileSource, first_page: int, last_page: int, dpi: int = 200) -> List[Image.Image]:
+    """Rasterize only the pages first_page..last_page (1-indexed, inclusive)."""
+    options = {"dpi": dpi, "first_page": first_page, "last_page": last_page, "timeout": executor.time_left()}
+    if isinstance(source, str):
+        return convert_from_path(source, **options)
+    return convert_from_bytes(source, **options)
+
+def page_runs(pages: List[int]) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous (first, last) runs."""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+def ocr_pdf_pages(
+    source: FileSource, pages: List[int], dpi: int = OCR_DPI, options: Optional[ocrengine.OcrOptions] = None
+) -> List[str]:
+    """OCR the given pages, rendering each contiguous run of pages in one pdf2image call."""
+    texts = []
+    for first_page, last_page in page_runs(pages):
+        for image in render_pdf_pages(source, first_page, last_page, dpi):
+            texts.append(ocr_image(image, dpi, options).text)
+            image.close()
+    return texts
+
+def pdf_pages_text(source: FileSource, pages: List[int]) -> List[str]:
+    """Extract the text layer of the given pages; pages without one come back empty."""
+    return list(iter_pdf_text(source, pages))
+
+def docx_to_pdf(source: FileSource, output_path: str) -> str:
+    """Convert DOCX to PDF (works only on Windows/macOS with Word installed)."""
+    if isinstance(source, str):
+        convert(source, output_path)
+        return output_path
+
+    # Word can only open files from disk
+    with tempfile.TemporaryDirectory() as temp_dir:
+        docx_path = os.path.join(temp_dir, "input.docx")
+        with open(docx_path, "wb") as docx_file:
+            docx_file.write(source)
+        convert(docx_path, output_path)
+    return output_path
+
+def ocr_image(
+    image: Image.Image, dpi: Optional[float] = None, options: Optional[ocrengine.OcrOptions] = None
+) -> ocrprep.OcrReport:
+    """OCR an image, cleaning it up first unless OCR_PREPROCESS is off."""
+    report = ocrprep.OcrReport(original_size=image.size, processed_size=image.size)
+    if ocrprep.OCR_PREPROCESS:
+        image = ocrprep.preprocess(image, report, dpi)
+    start = time.perf_counter()
+    report.text = ocrengine.recognize(image, options)
+    report.stage_seconds["ocr"] = time.perf_counter() - start
+    return report
+
+def image_to_text(source: FileSource, options: Optional[ocrengine.OcrOptions] = None) -> ocrprep.OcrReport:
+    """Extract text from an image using OCR."""
+    with open_source(source) as image_file, Image.open(image_file) as image:
+        return ocr_image(image, options=options)
+
+def render_pages_to_files(
+    source: FileSource, pages: List[int], output_dir: str, unique_id: str, dpi: int = 200
+) -> List[Tuple[int, str]]:
+    """Render the given pages straight to JPEG files and return (page number, path) pairs.
+
+    pdftoppm writes the files itself, so no page is ever held as a PIL image.
+    """
+    rendered = []
+    for first_page, last_page in page_runs(pages):
+        options = {
+            "dpi": dpi,
+            "first_page": first_page,
+            "last_page": last_page,
+            "output_folder": output_dir,
+            "output_file": f"{unique_id}_page_{first_page}",
+            "fmt": "jpeg",
+            "paths_only": True,
+            "timeout": executor.time_left(),
+        }
+        if isinstance(source, str):
+            paths = convert_from_path(source, **options)
+        else:
+            paths = convert_from_bytes(source, **options)
+        rendered.extend(zip(range(first_page, last_page + 1), sorted(paths)))
+    return rendered
+
+def count_pdf_pages(source: FileSource) -> int:
+    """Return the number of pages in a PDF."""
+    with open_source(source) as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+def compress_pdf(source: FileSource, output_path: str, preset: str = compression.DEFAULT_PRESET) -> compression.CompressionReport:
+    """Compress a PDF with the given preset, never returning a file larger than the input."""
+    original_size = source_size(source)
+    with open_source(source) as pdf_file:
+        report = compression.compress_pdf(pdf_file, output_path, preset, original_size)
+
+    if report.compressed_size >= original_size:
+        # Nothing to gain; hand back the original bytes unchanged
+        with open_source(source) as pdf_file, open(output_path, "wb") as output_file:
+            shutil.copyfileobj(pdf_file, output_file)
+        report.compressed_size = original_size
+    return report
+
+def merge_pdfs(
+    sources: List[FileSource], output_path: str, page_numbers: Optional[List[Optional[List[int]]]] = None
+) -> str:
+    """Merge several PDFs into one, optionally keeping only the given 1-indexed pages of each.
+
+    Inputs are opened one at a time: their pages are copied into the writer
+    and the file is closed before the next one is read.
+    """
+    writer = PyPDF2.PdfWriter()
+    page_numbers = page_numbers or [None] * len(sources)
+    for source, pages in zip(sources, page_numbers):
+        with open_source(source) as pdf_file:
+            selected = None if pages is None else [page - 1 for page in pages]
+            writer.append(pdf_file, pages=selected, import_outline=pages is None)
+
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+    return output_path
+
+# The functions below take an already parsed PdfReader (see readers.py)
+
+def pdf_page_count(reader: PyPDF2.PdfReader) -> int:
+    return len(reader.pages)
+
+def pdf_metadata(reader: PyPDF2.PdfReader) -> Dict[str, str]:
+    """Document information entries with their leading slash removed."""
+    metadata = reader.metadata or {}
+    return {key[1:]: str(value) for key, value in metadata.items() if key and value and key.startswith("/")}
+
+def pdf_info(reader: PyPDF2.PdfReader) -> Tuple[int, Dict[str, str]]:
+    """Page count and metadata, for /info of PDFs the probe cannot read."""
+    return pdf_page_count(reader), pdf_metadata(reader)
+
+def write_pdf_pages(reader: PyPDF2.PdfReader, page_numbers: List[int], output_path: str) -> str:
+    """Copy the given 1-indexed pages of a parsed PDF into a new PDF."""
+    writer = PyPDF2.PdfWriter()
+
+    # Add selected pages
+    for page_num in page_numbers:
+        # Convert to 0-indexed
+        writer.add_page(reader.pages[page_num - 1])
+
+    # Save extracted PDF
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+    return output_path
+
+def prepare_pdf_image(source: FileSource, max_side: Optional[int] = None, quality: Optional[int] = None) -> FileSource:
+    """Return an image img2pdf can embed, downscaled to max_side and re-encoded as JPEG if needed.
+
+    JPEG and PNG files that need no changes are passed through untouched, as
+    the path or bytes they came as, so img2pdf embeds them without re-encoding
+    and without another copy being read into memory first.
+    """
+    with open_source(source) as image_file, Image.open(image_file) as image:
+        too_large = max_side is not None and max(image.size) > max_side
+        embeddable = image.format in ("JPEG", "PNG") and image.mode in ("RGB", "L", "1")
+        if embeddable and not too_large and quality is None:
+            return source
+
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if too_large:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality or 90, optimize=True)
+        return buffer.getvalue()
+
+def images_to_pdf(
+    sources: List[FileSource], output_path: str, max_side: Optional[int] = None, quality: Optional[int] = None
+) -> str:
+    """Combine images into one PDF with a page per image."""
+    images = [prepare_pdf_image(source, max_side, quality) for source in sources]
+    with open(output_path, "wb") as pdf_file:
+        img2pdf.convert(images, outputstream=pdf_file)
+    return output_path
+
+def text_to_pdf(text: str, output_path: str) -> str:
+    """Render plain text to a PDF, wrapping long lines and starting new pages as needed."""
+    textlayout.render_text(text.splitlines(), output_path)
+    return output_path
+
+def text_file_to_pdf(source: FileSource, output_path: str) -> str:
+    """Render a UTF-8 text file to a PDF, reading it line by line."""
+    with open_source(source) as binary_file:
+        text_file = io.TextIOWrapper(binary_file, encoding="utf-8", errors="replace", newline=None)
+        textlayout.render_text(text_file, output_path)
+    return output_path
@@ -0,0 +1,60 @@
+import io
+import os
+import logging
+from typing import Optional
+
+from telegram import Bot
+
+import metrics
+from conversions import FileSource
+
+logger = logging.getLogger(__name__)
+
+# Files up to this size are downloaded into memory instead of UPLOAD_DIR
+MEMORY_DOWNLOAD_LIMIT = int(float(os.getenv("MEMORY_DOWNLOAD_LIMIT_MB", 5)) * 1024 * 1024)
+# Largest file accepted; the Bot API does not serve files above 20 MB
+MAX_FILE_SIZE = int(float(os.getenv("MAX_FILE_SIZE_MB", 20)) * 1024 * 1024)
+
+class FileTooLargeError(Exception):
+    """A file is larger than MAX_FILE_SIZE."""
+
+def check_file_size(size: Optional[int], limit: int = MAX_FILE_SIZE) -> None:
+    if size is not None and size > limit:
+        raise FileTooLargeError(
+            f"This file is {size / 1024 / 1024:.1f} MB; files up to {limit / 1024 / 1024:.0f} MB are supported."
+        )
+
+async def download_source(
+    bot: Bot,
+    file_id: str,
+    spill_path: str,
+    file_size: Optional[int] = None,
+    memory_limit: int = MEMORY_DOWNLOAD_LIMIT,
+) -> FileSource:
+    """Download a Telegram file into memory, or to spill_path if it is too large.
+
+    Returns the file contents as bytes, or spill_path when the file went to disk.
+    """
+    check_file_size(file_size)
+    try:
+        with metrics.DOWNLOAD_SECONDS.time():
+            file = await bot.get_file(file_id)
+            size = file_size or file.file_size
+            check_file_size(size)
+            if size is not None and size <= memory_limit:
+                buffer = io.BytesIO()
+                await file.download_to_memory(buffer)
+                metrics.BYTES_IN.inc(buffer.tell())
+                return buffer.getvalue()
+
+            os.makedirs(os.path.dirname(spill_path) or ".", exist_ok=True)
+            await file.download_to_drive(spill_path)
+            metrics.BYTES_IN.inc(os.path.getsize(spill_path))
+            return spill_path
+    except Exception:
+        metrics.ERRORS.labels(metrics.current_operation.get(), "download").inc()
+        raise
+
+async def download_file(bot: Bot, file_id: str, path: str) -> str:
+    """Download a Telegram file to path, whatever its size."""
+    return await download_source(bot, file_id, path, memory_limit=-1)
@@ -0,0 +1,257 @@
+import os
+import time
+import pickle
+import signal
+import asyncio
+import logging
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 2))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 300))
+MAX_JOBS_PER_USER = int(os.getenv("MAX_JOBS_PER_USER", 2))
+# Single-process workers for jobs that must land where earlier ones with the same key ran
+PINNED_WORKERS = int(os.getenv("PINNED_WORKERS", max(1, WORKER_PROCESSES // 2)))
+WORKER_START_METHOD = os.getenv("WORKER_START_METHOD", "spawn")
+
+# Extra time the event loop waits past the in-worker alarm before giving up
+TIMEOUT_GRACE = 5.0
+
+# When the job running in this worker process has to stop
+_deadline: Optional[float] = None
+
+class JobError(Exception):
+    """Base class for conversion job failures."""
+
+class JobTimeoutError(JobError):
+    """A conversion job ran longer than its timeout."""
+
+class TooManyJobsError(JobError):
+    """A user already has the maximum number of jobs running."""
+
+def _raise_timeout(signum, frame):
+    raise JobTimeoutError("Conversion took too long and was stopped.")
+
+def _reset_peak_memory() -> bool:
+    """Restart the process's peak RSS count (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_memory() -> Optional[int]:
+    """Peak RSS in bytes since the last reset."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def time_left() -> Optional[float]:
+    """Seconds the running job has left, for the timeouts of subprocesses it starts; None without a limit.
+
+    The alarm cannot interrupt a wait on a subprocess such as pdftoppm or
+    tesseract, so they are given the remaining time themselves.
+    """
+    if _deadline is None:
+        return None
+    return max(0.1, _deadline - time.monotonic())
+
+def _call_job(func: Callable, timeout: Optional[float], args: tuple, kwargs: dict) -> Tuple[Any, Optional[int]]:
+    """Run a job inside a worker process, interrupting it after `timeout` seconds.
+
+    Returns the job's result and the worker's peak memory while running it.
+    """
+    global _deadline
+    _deadline = time.monotonic() + timeout if timeout else None
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    measured = _reset_peak_memory()
+    try:
+        result = func(*args, **kwargs)
+        return result, _peak_memory() if measured else None
+    except JobError:
+        raise
+    except Exception as e:
+        # An exception that cannot be unpickled in the parent breaks the whole pool
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise JobError(f"{type(e).__name__}: {e}") from None
+        raise
+    finally:
+        _deadline = None
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _init_worker() -> None:
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class ConversionExecutor:
+    """Runs blocking conversion functions in a bounded process pool.
+
+    Jobs given an `affinity` key run instead on one of `pinned_workers`
+    single-process pools, chosen by the key, so state a job leaves in its
+    worker (such as a parsed PDF, see readers.py) is there for the next job
+    with the same key.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = WORKER_PROCESSES,
+        job_timeout: float = JOB_TIMEOUT,
+        max_jobs_per_user: int = MAX_JOBS_PER_USER,
+        pinned_workers: int = PINNED_WORKERS,
+    ) -> None:
+        self.max_workers = max(1, max_workers)
+        self.job_timeout = job_timeout
+        self.max_jobs_per_user = max_jobs_per_user
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pinned: List[Optional[ProcessPoolExecutor]] = [None] * max(1, pinned_workers)
+        self._user_jobs: Dict[int, int] = defaultdict(int)
+
+    def _new_pool(self, max_workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+            initializer=_init_worker,
+        )
+
+    def _pinned_index(self, affinity: str) -> int:
+        return hash(affinity) % len(self._pinned)
+
+    def _get_pool(self, affinity: Optional[str] = None) -> ProcessPoolExecutor:
+        if affinity is not None:
+            index = self._pinned_index(affinity)
+            if self._pinned[index] is None:
+                self._pinned[index] = self._new_pool(1)
+            return self._pinned[index]
+        if self._pool is None:
+            self._pool = self._new_pool(self.max_workers)
+        return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor, kill: bool = False) -> None:
+        """Drop a broken pool so the next job starts a fresh one.
+
+        With kill=True its workers are terminated too, for a pool with a worker
+        stuck in a job. Pools replaced in the meantime are left alone.
+        """
+        if self._pool is pool:
+            self._pool = None
+        self._pinned = [None if pinned is pool else pinned for pinned in self._pinned]
+        # Private, but the only handle on the processes a stuck job is holding
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        if kill:
+            for process in processes:
+                process.terminate()
+
+    @asynccontextmanager
+    async def user_slot(self, user_id: int):
+        """Reserve one of the user's concurrent job slots for the duration of a request."""
+        if self._user_jobs[user_id] >= self.max_jobs_per_user:
+            raise TooManyJobsError(
+                f"You already have {self._user_jobs[user_id]} conversions running. "
+                "Please wait for them to finish."
+            )
+        self._user_jobs[user_id] += 1
+        try:
+            yield
+        finally:
+            self._user_jobs[user_id] -= 1
+            if self._user_jobs[user_id] <= 0:
+                del self._user_jobs[user_id]
+
+    async def run(
+        self, func: Callable, *args, timeout: Optional[float] = None, affinity: Optional[str] = None, **kwargs
+    ) -> Any:
+        """Run `func(*args, **kwargs)` in the pool and await its result.
+
+        Cancelling the awaiting task cancels the job if it has not started yet;
+        a running job is stopped by its in-worker timeout.
+        """
+        timeout = self.job_timeout if timeout is None else timeout
+        operation = metrics.current_operation.get()
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool(affinity)
+        future = loop.run_in_executor(pool, _call_job, func, timeout, args, kwargs)
+        try:
+            with metrics.CONVERSION_SECONDS.labels(operation).time():
+                result, peak_memory = await asyncio.wait_for(future, timeout + TIMEOUT_GRACE if timeout else None)
+            if peak_memory is not None:
+                metrics.JOB_PEAK_MEMORY.labels(operation).observe(peak_memory)
+            return result
+        except asyncio.TimeoutError:
+            metrics.ERRORS.labels(operation, "timeout").inc()
+            # The alarm did not stop the job, so it is stuck in native code and would
+            # keep its worker forever. Other jobs running in the pool fail with it.
+            logger.error("Conversion job did not stop at its timeout, restarting the pool")
+            self._reset_pool(pool, kill=True)
+            raise JobTimeoutError("Conversion took too long and was stopped.")
+        except JobTimeoutError:
+            # Stopped by the alarm inside the worker
+            metrics.ERRORS.labels(operation, "timeout").inc()
+            raise
+        except BrokenProcessPool:
+            metrics.ERRORS.labels(operation, "crash").inc()
+            logger.error("Conversion worker died, restarting the pool")
+            self._reset_pool(pool)
+            raise JobError("The conversion worker crashed. Please try again.")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.ERRORS.labels(operation, "conversion").inc()
+            raise
+
+    async def map_ordered(
+        self, func: Callable, arg_list: Iterable[tuple], window: Optional[int] = None, timeout: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        """Run `func(*args)` for each args tuple in parallel and yield the results in input order.
+
+        At most `window` jobs (default: one per worker) are queued at a time so
+        large inputs do not pile up in the pool.
+        """
+        window = window or self.max_workers
+        in_flight = deque()
+        try:
+            for args in arg_list:
+                in_flight.append(asyncio.ensure_future(self.run(func, *args, timeout=timeout)))
+                if len(in_flight) >= window:
+                    yield await in_flight.popleft()
+            while in_flight:
+                yield await in_flight.popleft()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def post(self, func: Callable, *args, affinity: Optional[str] = None) -> None:
+        """Queue `func(*args)` in the pool without waiting for it, for housekeeping whose result nobody needs."""
+        pool = self._get_pool(affinity)
+        try:
+            pool.submit(_call_job, func, self.job_timeout, args, {})
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning(f"Could not queue {getattr(func, '__name__', func)}: {e}")
+
+    async def shutdown(self) -> None:
+        pools = [pool for pool in [self._pool, *self._pinned] if pool is not None]
+        self._pool = None
+        self._pinned = [None] * len(self._pinned)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, pool.shutdown) for pool in pools))
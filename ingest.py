@@ -0,0 +1,110 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 64))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 500))
+DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))
+
+class UpdateQueue:
+    """Bounded queue that decouples webhook acknowledgement from update processing.
+
+    Each chat with updates waiting gets a task of its own that processes them
+    one at a time and in arrival order, so a chat with a long backlog never
+    holds up the others. At most `workers` updates are processed at once.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[None]],
+        workers: int = UPDATE_WORKERS,
+        maxsize: int = UPDATE_QUEUE_SIZE,
+        dedup_window: int = DEDUP_WINDOW,
+    ) -> None:
+        self._process = process
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self.maxsize = maxsize
+        self._dedup_window = dedup_window
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._chat_backlog: Dict[object, Deque[Update]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopped = False
+        self.pending = 0
+
+    @staticmethod
+    def _ordering_key(update: Update) -> object:
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        return ("update", update.update_id)
+
+    def _remember(self, update_id: int) -> None:
+        self._seen[update_id] = None
+        if len(self._seen) > self._dedup_window:
+            self._seen.popitem(last=False)
+
+    def submit(self, update: Update) -> bool:
+        """Enqueue an update without waiting.
+
+        Returns False when the queue is full or stopped so the caller can ask
+        Telegram to retry later. Duplicate deliveries are accepted and silently
+        dropped.
+        """
+        if update.update_id in self._seen:
+            return True
+        if self._stopped or self.pending >= self.maxsize:
+            return False
+        self._remember(update.update_id)
+        self.pending += 1
+        key = self._ordering_key(update)
+        backlog = self._chat_backlog.get(key)
+        if backlog is None:
+            backlog = self._chat_backlog[key] = deque()
+            task = asyncio.create_task(self._run_chat(key, backlog), name=f"update-chat-{key}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        backlog.append(update)
+        return True
+
+    async def _handle(self, update: Update) -> None:
+        try:
+            await self._process(update)
+        except Exception as e:
+            logger.error(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self.pending -= 1
+
+    async def _run_chat(self, key: object, backlog: Deque[Update]) -> None:
+        """Work through one chat's updates until its backlog is empty."""
+        try:
+            while backlog:
+                async with self._slots:
+                    await self._handle(backlog.popleft())
+        finally:
+            # Updates arriving from now on start a new task for the chat
+            del self._chat_backlog[key]
+            self.pending -= len(backlog)
+
+    async def stop(self, drain_timeout: Optional[float] = 30) -> None:
+        """Stop accepting updates, wait for queued ones to finish, then cancel the rest."""
+        self._stopped = True
+        try:
+            await asyncio.wait_for(self._drained(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self.pending} updates still pending")
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drained(self) -> None:
+        while self.pending:
+            await asyncio.sleep(0.1)
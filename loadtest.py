@@ -0,0 +1,395 @@
+"""Load test the deployed webhook pipeline against a local fake Bot API.
+
+The fake API implements the Bot API methods the bot uses, serves fixture
+files for getFile and records everything the bot sends. The load generator
+posts synthetic updates to the bot's /webhook at a fixed rate and measures
+the time until each request's result arrives back at the fake API.
+
+    # start the fake API and the bot, then run 60s of load at 5 updates/s
+    python loadtest.py run --spawn-bot --rate 5 --duration 60
+
+    # against a bot started separately with TELEGRAM_API_URL=http://127.0.0.1:8081
+    python loadtest.py run --webhook http://127.0.0.1:8080/webhook
+
+    # only the fake API, for poking at the bot by hand
+    python loadtest.py serve
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import shutil
+import tempfile
+import itertools
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from benchmark import make_photo, make_scanned_pdf, make_text_pdf, percentile
+
+# Replies that end a request without a file
+FINAL_TEXT_PREFIXES = ("⚠️", "❗", "❌", "⏳", "📄 File Information")
+ERROR_TEXT_PREFIXES = ("⚠️", "❗", "❌", "⏳")
+
+@dataclass
+class Scenario:
+    fixture: str
+    caption: Optional[str] = None
+    kind: str = "document"  # or "photo"
+
+SCENARIOS = {
+    "pdf2text": Scenario("text_10p.pdf"),
+    "info": Scenario("text_10p.pdf", "/info"),
+    "pdf2img": Scenario("text_10p.pdf", "/pdf2img 1-3"),
+    "compress": Scenario("scan_2p.pdf", "/compress"),
+    "ocrpdf": Scenario("scan_2p.pdf", "/ocrpdf"),
+    "ocr": Scenario("photo.jpg", kind="photo"),
+    "img2pdf": Scenario("photo.jpg", "/img2pdf", kind="photo"),
+}
+
+FIXTURES = {
+    "text_10p.pdf": lambda path: make_text_pdf(path, 10),
+    "scan_2p.pdf": lambda path: make_scanned_pdf(path, 2),
+    "photo.jpg": make_photo,
+}
+
+@dataclass
+class Request:
+    scenario: str
+    sent_at: float
+    webhook_status: Optional[int] = None
+    ack_seconds: Optional[float] = None
+    done_at: Optional[float] = None
+    error: Optional[str] = None
+
+@dataclass
+class FakeTelegram:
+    """In-memory state of the fake Bot API."""
+    fixtures_dir: str
+    webhook_set: asyncio.Event = field(default_factory=asyncio.Event)
+    requests: Dict[int, Request] = field(default_factory=dict)
+    calls: Dict[str, int] = field(default_factory=dict)
+    bytes_served: int = 0
+    bytes_received: int = 0
+    _message_ids: itertools.count = field(default_factory=lambda: itertools.count(1_000_000))
+
+    def message(self, chat_id: int, **extra) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **extra,
+        }
+
+    def finish(self, chat_id: int, error: Optional[str] = None) -> None:
+        request = self.requests.get(chat_id)
+        if request and request.done_at is None:
+            request.done_at = time.perf_counter()
+            request.error = error
+
+def _sent_file(form, name: str, fake: FakeTelegram) -> dict:
+    field_value = form.get(name)
+    if hasattr(field_value, "file"):
+        fake.bytes_received += len(field_value.file.read())
+    unique = f"sent-{next(fake._message_ids)}"
+    return {"file_id": unique, "file_unique_id": unique}
+
+async def api_method(request: web.Request) -> web.Response:
+    fake: FakeTelegram = request.app["fake"]
+    method = request.match_info["method"]
+    fake.calls[method] = fake.calls.get(method, 0) + 1
+    form = await request.post()
+    chat_id = int(form["chat_id"]) if "chat_id" in form else 0
+
+    if method == "getMe":
+        result = {"id": 1, "is_bot": True, "first_name": "Any2Any", "username": "any2any_load_bot"}
+    elif method in ("setWebhook", "deleteWebhook"):
+        fake.webhook_set.set()
+        result = True
+    elif method == "getFile":
+        file_id = form["file_id"]
+        fixture = file_id.split(":", 1)[0]
+        path = os.path.join(fake.fixtures_dir, fixture)
+        if not os.path.exists(path):
+            return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"})
+        result = {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": os.path.getsize(path),
+            "file_path": fixture,
+        }
+    elif method in ("sendMessage", "editMessageText"):
+        text = form.get("text", "")
+        result = fake.message(chat_id, text=text)
+        if text.startswith(FINAL_TEXT_PREFIXES):
+            fake.finish(chat_id, text if text.startswith(ERROR_TEXT_PREFIXES) else None)
+    elif method == "sendDocument":
+        result = fake.message(chat_id, document=_sent_file(form, "document", fake))
+        fake.finish(chat_id)
+    elif method == "sendPhoto":
+        photo = _sent_file(form, "photo", fake)
+        result = fake.message(chat_id, photo=[dict(photo, width=1, height=1)])
+        fake.finish(chat_id)
+    elif method == "sendMediaGroup":
+        media = json.loads(form["media"])
+        result = []
+        for item in media:
+            attached = item["media"].replace("attach://", "")
+            photo = _sent_file(form, attached, fake)
+            result.append(fake.message(chat_id, photo=[dict(photo, width=1, height=1)]))
+        fake.finish(chat_id)
+    elif method in ("deleteMessage", "answerCallbackQuery", "editMessageReplyMarkup"):
+        result = True
+    else:
+        return web.json_response(
+            {"ok": False, "error_code": 404, "description": f"Not Found: method {method} is not faked"}
+        )
+    return web.json_response({"ok": True, "result": result})
+
+async def serve_file(request: web.Request) -> web.StreamResponse:
+    fake: FakeTelegram = request.app["fake"]
+    path = os.path.join(fake.fixtures_dir, os.path.basename(request.match_info["path"]))
+    if not os.path.exists(path):
+        raise web.HTTPNotFound()
+    fake.bytes_served += os.path.getsize(path)
+    return web.FileResponse(path)
+
+def create_fake_api(fake: FakeTelegram) -> web.Application:
+    app = web.Application(client_max_size=100 * 1024 * 1024)
+    app["fake"] = fake
+    app.router.add_post("/bot{token}/{method}", api_method)
+    app.router.add_get("/file/bot{token}/{path:.+}", serve_file)
+    return app
+
+def prepare_fixtures(fixtures_dir: str) -> None:
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for name, make in FIXTURES.items():
+        path = os.path.join(fixtures_dir, name)
+        if not os.path.exists(path):
+            make(path)
+
+def make_update(update_id: int, chat_id: int, scenario: Scenario, fixtures_dir: str, reuse_files: bool) -> dict:
+    size = os.path.getsize(os.path.join(fixtures_dir, scenario.fixture))
+    # A unique file_unique_id per update keeps the result cache from answering
+    unique_id = scenario.fixture if reuse_files else f"{scenario.fixture}:{update_id}"
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+    }
+    if scenario.kind == "photo":
+        message["photo"] = [{
+            "file_id": f"{scenario.fixture}:{update_id}", "file_unique_id": unique_id,
+            "width": 4000, "height": 3000, "file_size": size,
+        }]
+    else:
+        mime_type = "application/pdf" if scenario.fixture.endswith(".pdf") else "image/jpeg"
+        message["document"] = {
+            "file_id": f"{scenario.fixture}:{update_id}", "file_unique_id": unique_id,
+            "file_name": scenario.fixture, "mime_type": mime_type, "file_size": size,
+        }
+    if scenario.caption:
+        message["caption"] = scenario.caption
+    return {"update_id": update_id, "message": message}
+
+async def generate_load(args, fake: FakeTelegram) -> None:
+    mix = []
+    for part in args.mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix.extend([name] * int(weight or 1))
+
+    rng = random.Random(args.seed)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    timeout = ClientTimeout(total=args.timeout)
+    async with ClientSession(timeout=timeout) as session:
+
+        async def post(update: dict, request: Request) -> None:
+            start = time.perf_counter()
+            try:
+                async with session.post(args.webhook, json=update, headers=headers) as response:
+                    request.webhook_status = response.status
+            except Exception as e:
+                request.webhook_status = 0
+                request.error = f"webhook: {e}"
+            request.ack_seconds = time.perf_counter() - start
+            if request.webhook_status != 200:
+                request.done_at = request.done_at or time.perf_counter()
+
+        tasks = []
+        total = int(args.rate * args.duration)
+        start = time.perf_counter()
+        for n in range(total):
+            # Open-loop arrivals: keep the schedule whatever the bot's response time
+            delay = start + n / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = rng.choice(mix)
+            update_id = chat_id = 10_000 + n
+            request = fake.requests[chat_id] = Request(name, time.perf_counter())
+            update = make_update(update_id, chat_id, SCENARIOS[name], fake.fixtures_dir, args.reuse_files)
+            tasks.append(asyncio.create_task(post(update, request)))
+        await asyncio.gather(*tasks)
+
+        # Let in-flight requests finish
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline and any(r.done_at is None for r in fake.requests.values()):
+            await asyncio.sleep(0.2)
+
+def summarize(fake: FakeTelegram, duration: float) -> dict:
+    requests = list(fake.requests.values())
+    done = [r for r in requests if r.done_at is not None and not r.error]
+    latencies = [r.done_at - r.sent_at for r in done]
+    acks = [r.ack_seconds for r in requests if r.ack_seconds is not None]
+    statuses: Dict[str, int] = {}
+    for r in requests:
+        statuses[str(r.webhook_status)] = statuses.get(str(r.webhook_status), 0) + 1
+
+    per_scenario = {}
+    for name in sorted({r.scenario for r in requests}):
+        own = [r.done_at - r.sent_at for r in done if r.scenario == name]
+        per_scenario[name] = {
+            "sent": sum(1 for r in requests if r.scenario == name),
+            "completed": len(own),
+            "p50_s": percentile(own, 0.5) if own else None,
+            "p99_s": percentile(own, 0.99) if own else None,
+        }
+
+    errors: Dict[str, int] = {}
+    for r in requests:
+        if r.error:
+            errors[r.error[:80]] = errors.get(r.error[:80], 0) + 1
+
+    return {
+        "sent": len(requests),
+        "completed": len(done),
+        "failed": sum(1 for r in requests if r.error),
+        "timed_out": sum(1 for r in requests if r.done_at is None),
+        "throughput_per_s": len(done) / duration if duration else 0.0,
+        "latency_p50_s": percentile(latencies, 0.5) if latencies else None,
+        "latency_p90_s": percentile(latencies, 0.9) if latencies else None,
+        "latency_p99_s": percentile(latencies, 0.99) if latencies else None,
+        "latency_max_s": max(latencies) if latencies else None,
+        "webhook_ack_p99_s": percentile(acks, 0.99) if acks else None,
+        "webhook_status": statuses,
+        "scenarios": per_scenario,
+        "errors": errors,
+        "api_calls": dict(sorted(fake.calls.items())),
+        "bytes_served": fake.bytes_served,
+        "bytes_received": fake.bytes_received,
+    }
+
+def print_summary(summary: dict) -> None:
+    def seconds(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    print(f"sent {summary['sent']}, completed {summary['completed']}, failed {summary['failed']}, "
+          f"timed out {summary['timed_out']}")
+    print(f"throughput {summary['throughput_per_s']:.2f} requests/s")
+    print(f"latency p50 {seconds(summary['latency_p50_s'])}  p90 {seconds(summary['latency_p90_s'])}  "
+          f"p99 {seconds(summary['latency_p99_s'])}  max {seconds(summary['latency_max_s'])}")
+    print(f"webhook ack p99 {seconds(summary['webhook_ack_p99_s'])}, status codes {summary['webhook_status']}")
+    for name, stats in summary["scenarios"].items():
+        print(f"  {name:<10} {stats['completed']}/{stats['sent']}  p50 {seconds(stats['p50_s'])}  "
+              f"p99 {seconds(stats['p99_s'])}")
+    for error, count in summary["errors"].items():
+        print(f"  error x{count}: {error}")
+    print(f"API calls: {summary['api_calls']}")
+
+async def start_fake_api(fake: FakeTelegram, port: int) -> web.AppRunner:
+    runner = web.AppRunner(create_fake_api(fake))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+async def spawn_bot(args, workdir: str) -> asyncio.subprocess.Process:
+    """Start bot.py with its working files, cache and sessions in workdir."""
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:LOADTEST",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        WEBHOOK_URL=args.webhook,
+        PORT=str(args.bot_port),
+        CACHE_DIR=os.path.join(workdir, "cache"),
+        SESSION_DB=os.path.join(workdir, "sessions.sqlite3"),
+    )
+    if args.secret:
+        env["WEBHOOK_SECRET"] = args.secret
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+    return await asyncio.create_subprocess_exec(sys.executable, bot_path, cwd=workdir, env=env)
+
+async def wait_for_webhook(url: str, timeout: float = 60) -> None:
+    """Wait until the bot's web server accepts connections."""
+    deadline = time.perf_counter() + timeout
+    async with ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url):
+                    return
+            except OSError:
+                if time.perf_counter() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+async def main(args) -> None:
+    prepare_fixtures(args.fixtures)
+    fake = FakeTelegram(args.fixtures)
+    runner = await start_fake_api(fake, args.api_port)
+    print(f"Fake Bot API listening on http://127.0.0.1:{args.api_port}", file=sys.stderr)
+
+    bot_process = None
+    workdir = None
+    try:
+        if args.command == "serve":
+            await asyncio.Event().wait()
+
+        if args.spawn_bot:
+            workdir = tempfile.mkdtemp(prefix="any2any-load-")
+            bot_process = await spawn_bot(args, workdir)
+            await asyncio.wait_for(fake.webhook_set.wait(), 60)
+        await wait_for_webhook(args.webhook)
+
+        started = time.perf_counter()
+        await generate_load(args, fake)
+        summary = summarize(fake, time.perf_counter() - started)
+        if args.json:
+            print(json.dumps(summary, indent=2, ensure_ascii=False))
+        else:
+            print_summary(summary)
+    finally:
+        if bot_process is not None and bot_process.returncode is None:
+            bot_process.terminate()
+            await bot_process.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the bot against a local fake Bot API.")
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--bot-port", type=int, default=8080)
+    parser.add_argument("--webhook", help="bot webhook URL (default: http://127.0.0.1:<bot-port>/webhook)")
+    parser.add_argument("--secret", help="webhook secret token, if the bot uses one")
+    parser.add_argument("--spawn-bot", action="store_true", help="start bot.py against the fake API")
+    parser.add_argument("--rate", type=float, default=2.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--mix", default="pdf2text=4,info=2,compress=1,pdf2img=1",
+                        help=f"weighted scenarios, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--reuse-files", action="store_true", help="send the same file_unique_id to exercise the cache")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for each result")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "any2any-load-fixtures"))
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    args.webhook = args.webhook or f"http://127.0.0.1:{args.bot_port}/webhook"
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,231 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# A small implementation of the Prometheus text exposition format, enough for
+# the handful of metrics the bot exports without adding a dependency.
+
+# Operation of the request being handled, used to label conversion metrics
+current_operation: ContextVar[str] = ContextVar("current_operation", default="other")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (32, 64, 128, 256, 512, 1024, 2048))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class _CounterChild:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"
+
+class _GaugeChild:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from `function` at scrape time."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {child.get()}"
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self) -> Iterator[str]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], child.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {child.sum}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+REGISTRY: List[_Metric] = []
+
+def render() -> str:
+    """All metrics in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+def directory_size(path: str) -> int:
+    """Total size in bytes of the files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class StageTimer:
+    """Adds the time since the previous lap to stage_seconds[stage], for per-stage timings of a job."""
+
+    def __init__(self, stage_seconds: Dict[str, float]) -> None:
+        self._stage_seconds = stage_seconds
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+DOWNLOAD_SECONDS = Histogram("bot_download_seconds", "Time to download a file from Telegram")
+CONVERSION_SECONDS = Histogram(
+    "bot_conversion_seconds", "Time spent in conversion jobs", ["operation"]
+)
+JOB_PEAK_MEMORY = Histogram(
+    "bot_job_peak_memory_bytes", "Peak resident memory of a worker process during a conversion job",
+    ["operation"], buckets=MEMORY_BUCKETS
+)
+OCR_STAGE_SECONDS = Histogram(
+    "bot_ocr_stage_seconds", "Time spent in each image preprocessing stage and in tesseract", ["stage"]
+)
+UPLOAD_SECONDS = Histogram("bot_upload_seconds", "Time to send a result to Telegram", ["operation"])
+REQUEST_SECONDS = Histogram("bot_request_seconds", "End-to-end time of a request", ["operation"])
+BYTES_IN = Counter("bot_bytes_in_total", "Bytes downloaded from Telegram")
+BYTES_OUT = Counter("bot_bytes_out_total", "Bytes uploaded to Telegram", ["operation"])
+CACHE_REQUESTS = Counter("bot_cache_requests_total", "Result cache lookups", ["result"])
+ERRORS = Counter("bot_errors_total", "Failed steps of a request", ["operation", "stage"])
+ADMISSIONS = Counter(
+    "bot_admissions_total", "Admission decision per job: accepted, low_priority, downgraded or rejected",
+    ["operation", "decision"]
+)
+JOBS_IN_FLIGHT = Gauge("bot_jobs_in_flight", "Requests currently being handled", ["operation"])
+JOBS_QUEUED = Gauge("bot_jobs_queued", "Requests waiting for a share of the worker pool")
+UPDATES_PENDING = Gauge("bot_updates_pending", "Updates accepted by the webhook but not yet handled")
+DISK_USAGE = Gauge("bot_disk_usage_bytes", "Size of the bot's working directories", ["directory"])
+WORKSPACE_RESERVED_BYTES = Gauge("bot_workspace_reserved_bytes", "Disk space set aside for running jobs")
+
+@contextmanager
+def track_upload(*paths: str):
+    """Time an upload to Telegram and count the bytes of the files sent."""
+    operation = current_operation.get()
+    try:
+        with UPLOAD_SECONDS.labels(operation).time():
+            yield
+    except Exception:
+        ERRORS.labels(operation, "upload").inc()
+        raise
+    BYTES_OUT.labels(operation).inc(sum(os.path.getsize(path) for path in paths if os.path.exists(path)))
@@ -0,0 +1,119 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import pytesseract
+from PIL import Image
+
+import executor
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# OCR engine configuration
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto").lower()
+# Languages users may ask for; the first is the default
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv("OCR_LANGUAGES", "eng").split(",") if lang.strip()] or ["eng"]
+OCR_PSM = int(os.getenv("OCR_PSM", 3))
+TESSDATA_PREFIX = os.getenv("TESSDATA_PREFIX")
+
+# Page segmentation modes that produce text: 0 only detects orientation and
+# 2 is not implemented by tesseract
+PAGE_SEGMENTATION_MODES = (1, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13)
+
+# Engines live in the conversion worker processes (see executor.py), one per
+# process, and are created on first use. They take PIL images directly.
+
+@dataclass(frozen=True)
+class OcrOptions:
+    # Tesseract language string, e.g. "eng" or "eng+deu"
+    lang: str = OCR_LANGUAGES[0]
+    psm: int = OCR_PSM
+
+def check_options(options: OcrOptions) -> None:
+    """Raise ValueError if the options ask for a language or mode this bot does not offer."""
+    for lang in options.lang.split("+"):
+        if lang not in OCR_LANGUAGES:
+            raise ValueError(f"Language {lang!r} is not available. Choose from {', '.join(OCR_LANGUAGES)}.")
+    if options.psm not in PAGE_SEGMENTATION_MODES:
+        raise ValueError(f"Page segmentation mode must be one of {', '.join(map(str, PAGE_SEGMENTATION_MODES))}.")
+
+class TesserocrEngine:
+    """Calls libtesseract in-process, keeping one initialized API per language set.
+
+    Loading the language data is the slow part of a tesseract run, so it is
+    done once per worker and language set rather than once per image.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self) -> None:
+        self._apis: Dict[str, "tesserocr.PyTessBaseAPI"] = {}
+
+    def _api(self, lang: str) -> "tesserocr.PyTessBaseAPI":
+        api = self._apis.get(lang)
+        if api is None:
+            kwargs = {"path": TESSDATA_PREFIX} if TESSDATA_PREFIX else {}
+            api = self._apis[lang] = tesserocr.PyTessBaseAPI(lang=lang, **kwargs)
+            logger.info(f"Loaded tesseract language data for {lang}")
+        return api
+
+    def recognize(self, image: Image.Image, options: OcrOptions) -> str:
+        api = self._api(options.lang)
+        api.SetPageSegMode(options.psm)
+        api.SetImage(image)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+class PytesseractEngine:
+    """Runs the tesseract binary once per image; used when tesserocr is not installed."""
+
+    name = "pytesseract"
+
+    def recognize(self, image: Image.Image, options: OcrOptions) -> str:
+        # 0 means no limit
+        timeout = executor.time_left() or 0
+        return pytesseract.image_to_string(image, lang=options.lang, config=f"--psm {options.psm}", timeout=timeout)
+
+_engine = None
+
+def engine_name() -> str:
+    """Name of the engine OCR_ENGINE selects in this environment."""
+    if OCR_ENGINE not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"Unknown OCR_ENGINE {OCR_ENGINE!r}")
+    if OCR_ENGINE == "tesserocr" and tesserocr is None:
+        raise RuntimeError("OCR_ENGINE is tesserocr but the tesserocr package is not installed")
+    if OCR_ENGINE == "pytesseract" or tesserocr is None:
+        return PytesseractEngine.name
+    return TesserocrEngine.name
+
+def check_engine() -> None:
+    """Validate OCR_ENGINE at startup and warn when OCR will start a tesseract process per image."""
+    name = engine_name()
+    if name == PytesseractEngine.name and OCR_ENGINE == "auto":
+        logger.warning(
+            "tesserocr is not installed; OCR falls back to pytesseract and starts a tesseract process "
+            "per image. Install tesserocr (see README) for in-process OCR."
+        )
+
+def get_engine():
+    """The OCR engine of this process, picked by OCR_ENGINE."""
+    global _engine
+    if _engine is None:
+        if engine_name() == TesserocrEngine.name:
+            _engine = TesserocrEngine()
+        else:
+            _engine = PytesseractEngine()
+        logger.info(f"Using the {_engine.name} OCR engine")
+    return _engine
+
+def recognize(image: Image.Image, options: Optional[OcrOptions] = None) -> str:
+    """OCR an image with this process's engine."""
+    return get_engine().recognize(image, options or OcrOptions())
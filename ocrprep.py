@@ -0,0 +1,178 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+import metrics
+
+# Cleans up images before they are handed to tesseract. Phone photos are far
+# larger than tesseract needs and often skewed, unevenly lit and framed by
+# the table they were taken on; a smaller, binarized, straightened and
+# cropped image is both quicker and more accurate to OCR.
+
+# Preprocessing configuration
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") != "0"
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", 300))
+# Longest side images without a DPI are scaled down to (a letter page at 300 DPI)
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 3300))
+
+# Adaptive threshold: a pixel is ink when darker than its neighbourhood mean by this fraction
+THRESHOLD_RADIUS = 20
+THRESHOLD_OFFSET = 0.15
+
+# Deskew search range and the size the angle is estimated at
+MAX_SKEW = 10.0
+# Smaller angles are left alone; they are within the estimate's noise
+MIN_SKEW = 0.2
+SKEW_ESTIMATE_SIDE = 1000
+SKEW_SAMPLE_PIXELS = 200_000
+
+# Rows/columns with more ink than this in the outer quarter of the image are
+# scanner or background borders
+BORDER_INK = 0.8
+BORDER_SEARCH = 0.25
+BORDER_GAP = 5
+# Rows/columns with less ink than this count as empty margin
+MARGIN_INK = 0.002
+CROP_PADDING = 10
+
+@dataclass
+class OcrReport:
+    text: str = ""
+    original_size: Tuple[int, int] = (0, 0)
+    processed_size: Tuple[int, int] = (0, 0)
+    skew_angle: float = 0.0
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+
+def image_dpi(image: Image.Image) -> Optional[float]:
+    """Horizontal resolution recorded in the image, if it looks trustworthy."""
+    dpi = image.info.get("dpi")
+    if not dpi:
+        return None
+    try:
+        dpi = float(dpi[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+    # 72/96 DPI are defaults written by software, not a scan resolution
+    return dpi if dpi >= 100 else None
+
+def downscale(image: Image.Image, dpi: Optional[float] = None) -> Image.Image:
+    """Shrink the image to OCR_TARGET_DPI, or to OCR_MAX_SIDE when its resolution is unknown."""
+    dpi = dpi or image_dpi(image)
+    if dpi:
+        scale = OCR_TARGET_DPI / dpi
+    else:
+        scale = OCR_MAX_SIDE / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if image.format == "JPEG":
+        # Let the decoder skip detail and colour we would throw away anyway
+        image.draft("L", (size[0] * 2, size[1] * 2))
+    # reducing_gap does most of a large shrink with cheap pixel binning first
+    return image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+def grayscale(image: Image.Image) -> Image.Image:
+    """Upright, single-channel version of the image."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        # Transparent areas become white rather than black
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    return image.convert("L")
+
+def adaptive_threshold(gray: Image.Image) -> np.ndarray:
+    """Boolean ink mask: pixels darker than their local mean, so uneven lighting is ignored."""
+    local_mean = np.asarray(gray.filter(ImageFilter.BoxBlur(THRESHOLD_RADIUS)), dtype=np.float32)
+    pixels = np.asarray(gray, dtype=np.float32)
+    return pixels < local_mean * (1 - THRESHOLD_OFFSET)
+
+def _projection_score(ys: np.ndarray, xs: np.ndarray, angle: float) -> float:
+    radians = np.deg2rad(angle)
+    rows = np.round(ys * np.cos(radians) + xs * np.sin(radians)).astype(np.int64)
+    counts = np.bincount(rows - rows.min())
+    return float(np.dot(counts, counts))
+
+def estimate_skew(ink: np.ndarray) -> float:
+    """Angle in degrees the text is rotated by, from the sharpest horizontal projection of the ink.
+
+    Text lines that are level give a row histogram of tall peaks and empty
+    gaps, so the angle whose projection has the largest sum of squares wins.
+    """
+    step = max(1, -(-max(ink.shape) // SKEW_ESTIMATE_SIDE))
+    sample = ink[::step, ::step]
+    ys, xs = np.nonzero(sample)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > SKEW_SAMPLE_PIXELS:
+        keep = np.random.default_rng(0).choice(len(ys), SKEW_SAMPLE_PIXELS, replace=False)
+        ys, xs = ys[keep], xs[keep]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+
+    def best(angles: np.ndarray) -> float:
+        scores = [_projection_score(ys, xs, angle) for angle in angles]
+        return round(float(angles[int(np.argmax(scores))]), 2)
+
+    coarse = best(np.arange(-MAX_SKEW, MAX_SKEW + 0.5, 0.5))
+    return best(np.arange(coarse - 0.5, coarse + 0.55, 0.1))
+
+def deskew(ink: np.ndarray, angle: float) -> np.ndarray:
+    """Rotate the ink mask back by angle degrees, filling the exposed corners with paper."""
+    if abs(angle) < MIN_SKEW:
+        return ink
+    image = Image.fromarray(ink.astype(np.uint8) * 255)
+    rotated = image.rotate(-angle, resample=Image.BILINEAR, expand=True, fillcolor=0)
+    return np.asarray(rotated) >= 128
+
+def _content_span(profile: np.ndarray) -> Tuple[int, int]:
+    """Start and end index of the text in an ink profile, inside any borders and without empty margins."""
+    length = len(profile)
+    edge = max(1, int(length * BORDER_SEARCH))
+    border = np.nonzero(profile > BORDER_INK)[0]
+    leading, trailing = border[border < edge], border[border >= length - edge]
+    # The soft edge of a border is not solid enough to be caught by BORDER_INK
+    low = int(leading[-1]) + 1 + BORDER_GAP if len(leading) else 0
+    high = int(trailing[0]) - BORDER_GAP if len(trailing) else length
+
+    content = np.nonzero(profile[low:high] > MARGIN_INK)[0]
+    if not len(content):
+        return 0, length
+    return max(low, low + int(content[0]) - CROP_PADDING), min(high, low + int(content[-1]) + 1 + CROP_PADDING)
+
+def crop_borders(ink: np.ndarray) -> np.ndarray:
+    """Cut off dark borders and empty margins around the text."""
+    # Borders are measured against the whole width or height, so one only
+    # stands out once the borders of the other axis are gone: crop twice
+    for _ in range(2):
+        top, bottom = _content_span(ink.mean(axis=1))
+        ink = ink[top:bottom]
+        left, right = _content_span(ink.mean(axis=0))
+        ink = ink[:, left:right]
+    return ink
+
+def preprocess(image: Image.Image, report: OcrReport, dpi: Optional[float] = None) -> Image.Image:
+    """Turn a photo or scan into a clean black-on-white image for OCR, timing each stage into report."""
+    report.original_size = image.size
+    timer = metrics.StageTimer(report.stage_seconds)
+
+    # Shrinking first makes every later stage cheaper
+    image = downscale(image, dpi)
+    timer.lap("downscale")
+    gray = grayscale(image)
+    timer.lap("grayscale")
+    ink = adaptive_threshold(gray)
+    timer.lap("threshold")
+    report.skew_angle = estimate_skew(ink)
+    ink = deskew(ink, report.skew_angle)
+    timer.lap("deskew")
+    ink = crop_borders(ink)
+    timer.lap("crop")
+
+    # Tesseract reads an "L" image with ink as 0 and paper as 255
+    cleaned = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+    report.processed_size = cleaned.size
+    return cleaned
@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Coroutine, Dict, Iterator, List, Optional, Union
+
+from telegram import InputFile, Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented limits: ~30 messages/s overall, ~1/s per private chat, 20/min per group
+GLOBAL_MESSAGES_PER_SECOND = float(os.getenv("GLOBAL_MESSAGES_PER_SECOND", 30))
+CHAT_MESSAGES_PER_SECOND = float(os.getenv("CHAT_MESSAGES_PER_SECOND", 1))
+GROUP_MESSAGES_PER_MINUTE = float(os.getenv("GROUP_MESSAGES_PER_MINUTE", 20))
+MAX_SEND_RETRIES = int(os.getenv("MAX_SEND_RETRIES", 3))
+
+# Endpoints that post or change messages count towards the flood limits
+_THROTTLED_PREFIXES = ("send", "edit", "copy", "forward")
+
+class _Pacer:
+    """Spaces out requests by a fixed interval, letting `burst` through back to back."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.interval = 1 / rate
+        self.burst = burst
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+        self.last_used = 0.0
+
+    async def wait(self) -> None:
+        # asyncio.Lock wakes waiters in FIFO order, so requests keep their order
+        async with self._lock:
+            now = time.monotonic()
+            # Allow up to `burst` requests of credit after an idle period
+            start = max(self._next, now - self.interval * (self.burst - 1))
+            if start > now:
+                await asyncio.sleep(start - now)
+            self._next = start + self.interval
+            self.last_used = time.monotonic()
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, time.monotonic() + seconds)
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """Throttles outgoing Bot API requests globally and per chat, retrying on RetryAfter.
+
+    Requests to the same chat are sent in the order they were made. A RetryAfter
+    from Telegram pauses only the chat it was raised for, or every chat when the
+    request had no chat.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_MESSAGES_PER_SECOND,
+        chat_rate: float = CHAT_MESSAGES_PER_SECOND,
+        group_rate: float = GROUP_MESSAGES_PER_MINUTE / 60,
+        max_retries: int = MAX_SEND_RETRIES,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global: Optional[_Pacer] = None
+        self._chats: Dict[Union[int, str], _Pacer] = {}
+
+    async def initialize(self) -> None:
+        self._global = _Pacer(self.global_rate, burst=int(self.global_rate))
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def _chat_pacer(self, chat_id: Union[int, str]) -> _Pacer:
+        pacer = self._chats.get(chat_id)
+        if pacer is None:
+            # Forget chats that have been quiet for a minute
+            cutoff = time.monotonic() - 60
+            for idle in [key for key, p in self._chats.items() if p.last_used < cutoff and not p._lock.locked()]:
+                del self._chats[idle]
+            # Negative ids and @usernames are groups and channels
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            pacer = self._chats[chat_id] = _Pacer(rate, burst=3)
+        return pacer
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        throttled = endpoint.startswith(_THROTTLED_PREFIXES)
+        chat_id = data.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        chat_pacer = self._chat_pacer(chat_id) if throttled and chat_id is not None else None
+
+        for attempt in range(max_retries + 1):
+            if chat_pacer is not None:
+                await chat_pacer.wait()
+            if throttled:
+                await self._global.wait()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                delay = float(e.retry_after) + 0.1
+                logger.info(f"Flood limit on {endpoint} for chat {chat_id}, retrying in {delay:.1f}s")
+                if chat_pacer is not None:
+                    chat_pacer.pause(delay)
+                elif throttled:
+                    self._global.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+class StatusMessage:
+    """A single progress message per request, edited in place instead of sending new ones.
+
+    Intermediate updates are deleted by close(); final ones (results, errors)
+    are left in the chat.
+    """
+
+    def __init__(self, reply_to: Message) -> None:
+        self._reply_to = reply_to
+        self.message: Optional[Message] = None
+        self.text: Optional[str] = None
+        self.final = False
+
+    async def update(self, text: str, final: bool = False) -> None:
+        self.final = final
+        if text == self.text:
+            return
+        if self.message is None:
+            self.message = await self._reply_to.reply_text(text)
+        else:
+            try:
+                await self.message.edit_text(text)
+            except BadRequest as e:
+                # Deleted by the user, or the same text: fall back to a new message
+                if "not modified" in str(e).lower():
+                    return
+                self.message = await self._reply_to.reply_text(text)
+        self.text = text
+
+    async def close(self) -> None:
+        """Remove the message if it only showed progress."""
+        if self.message is None or self.final:
+            return
+        try:
+            await self.message.delete()
+        except TelegramError as e:
+            logger.debug(f"Could not delete status message: {e}")
+        self.message = None
+
+class StreamedInputFile(InputFile):
+    """An upload sent from an open file in chunks instead of being read into memory first.
+
+    python-telegram-bot reads file objects into bytes; httpx streams file
+    objects as they are, rewinding them before each attempt, so a retried
+    request sends the whole file again.
+    """
+
+    def __init__(self, file: BinaryIO, filename: Optional[str] = None, attach: bool = False) -> None:
+        super().__init__(b"", filename=filename or os.path.basename(file.name), attach=attach)
+        self.input_file_content = file
+
+@contextmanager
+def open_upload(path: str, filename: Optional[str] = None, attach: bool = False) -> Iterator[StreamedInputFile]:
+    """Open a file on disk for sending to Telegram without loading it into memory."""
+    with open(path, "rb") as f:
+        yield StreamedInputFile(f, filename, attach)
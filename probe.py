@@ -0,0 +1,509 @@
+import io
+import re
+import zlib
+import codecs
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from conversions import FileSource, map_source
+
+# Reads just enough of a file to describe it: for PDFs the trailer, the
+# cross-reference data and the few objects it points to, for images the
+# header. Files are memory-mapped, so only the pages touched are read from
+# disk. Anything this parser does not understand raises ProbeError and the
+# caller falls back to a full parse.
+
+class ProbeError(Exception):
+    """The file could not be probed without a full parse."""
+
+@dataclass
+class PdfProbe:
+    version: str
+    page_count: int
+    encrypted: bool
+    image_count: int
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class ImageProbe:
+    format: str
+    width: int
+    height: int
+    mode: str
+
+# Bytes to search from the end of the file for startxref
+TAIL_SIZE = 4096
+# Bytes all the streams of one file may decompress to; uploads are untrusted,
+# and a few KB of deflated zeros can expand to gigabytes
+MAX_DECODED_SIZE = 4 * 1024 * 1024
+# Values one parser may read; the probe itself needs a few hundred
+MAX_PARSED_VALUES = 1_000_000
+
+_WHITESPACE = b"\x00\t\n\x0c\r "
+_DELIMITERS = b"()<>[]{}/%"
+_NUMBER = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)")
+_REFERENCE = re.compile(rb"(\d+)\s+(\d+)\s+R")
+_OBJECT_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+_NAME = re.compile(rb"/([^\s()<>\[\]{}/%]*)")
+_KEYWORD = re.compile(rb"[A-Za-z]+")
+_VERSION = re.compile(rb"%PDF-(\d\.\d)")
+_IMAGE_XOBJECT = re.compile(rb"/Subtype\s*/Image\b")
+_XREF_SUBSECTION = re.compile(rb"\s*(\d+)\s+(\d+)\s*[\r\n]+")
+_STRING_ESCAPES = {
+    ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f",
+    ord("("): b"(", ord(")"): b")", ord("\\"): b"\\",
+}
+
+class Name(str):
+    pass
+
+@dataclass(frozen=True)
+class Reference:
+    number: int
+    generation: int
+
+@dataclass
+class Stream:
+    dictionary: Dict[str, Any]
+    start: int
+
+@dataclass
+class _XrefStream:
+    """Decoded cross-reference stream rows, read on lookup."""
+    data: bytes
+    widths: List[int]
+    # (first object number, count, offset of the first row)
+    subsections: List[Tuple[int, int, int]]
+
+    def entry(self, number: int) -> Optional[Tuple[int, int, int]]:
+        row_size = sum(self.widths)
+        for first, count, start in self.subsections:
+            if first <= number < first + count:
+                pos = start + (number - first) * row_size
+                fields = []
+                for width in self.widths:
+                    fields.append(int.from_bytes(self.data[pos:pos + width], "big") if width else None)
+                    pos += width
+                kind = 1 if fields[0] is None else fields[0]
+                return (kind, fields[1] or 0, fields[2] or 0)
+        return None
+
+class _Parser:
+    """Parses PDF objects at given offsets of a buffer."""
+
+    def __init__(self, buffer) -> None:
+        self.buffer = buffer
+        self.parsed = 0
+
+    def skip_whitespace(self, pos: int) -> int:
+        buffer = self.buffer
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif char == ord("%"):
+                while pos < len(buffer) and buffer[pos] not in b"\r\n":
+                    pos += 1
+            else:
+                break
+        return pos
+
+    def parse(self, pos: int) -> Tuple[Any, int]:
+        """Parse the object at pos and return it with the position after it."""
+        self.parsed += 1
+        if self.parsed > MAX_PARSED_VALUES:
+            raise ProbeError("Too many objects to probe")
+        buffer = self.buffer
+        pos = self.skip_whitespace(pos)
+        if pos >= len(buffer):
+            raise ProbeError("Unexpected end of file")
+        char = buffer[pos]
+
+        if char == ord("/"):
+            match = _NAME.match(buffer, pos)
+            name = re.sub(rb"#([0-9A-Fa-f]{2})", lambda m: bytes([int(m.group(1), 16)]), match.group(1))
+            return Name(name.decode("latin-1")), match.end()
+        if buffer[pos:pos + 2] == b"<<":
+            return self._parse_dictionary(pos + 2)
+        if char == ord("<"):
+            end = buffer.find(b">", pos)
+            if end < 0:
+                raise ProbeError("Unterminated hex string")
+            digits = re.sub(rb"\s", b"", buffer[pos + 1:end])
+            if len(digits) % 2:
+                digits += b"0"
+            return bytes.fromhex(digits.decode("ascii")), end + 1
+        if char == ord("("):
+            return self._parse_string(pos + 1)
+        if char == ord("["):
+            items = []
+            pos += 1
+            while True:
+                pos = self.skip_whitespace(pos)
+                if pos >= len(buffer):
+                    raise ProbeError("Unterminated array")
+                if buffer[pos] == ord("]"):
+                    return items, pos + 1
+                item, pos = self.parse(pos)
+                items.append(item)
+
+        reference = _REFERENCE.match(buffer, pos)
+        if reference:
+            return Reference(int(reference.group(1)), int(reference.group(2))), reference.end()
+        number = _NUMBER.match(buffer, pos)
+        if number:
+            text = number.group()
+            return (float(text) if b"." in text else int(text)), number.end()
+        keyword = _KEYWORD.match(buffer, pos)
+        if keyword:
+            value = {b"true": True, b"false": False, b"null": None}.get(keyword.group(), ProbeError)
+            if value is not ProbeError:
+                return value, keyword.end()
+        raise ProbeError(f"Unexpected data at offset {pos}")
+
+    def _parse_dictionary(self, pos: int) -> Tuple[Dict[str, Any], int]:
+        buffer = self.buffer
+        dictionary = {}
+        while True:
+            pos = self.skip_whitespace(pos)
+            if buffer[pos:pos + 2] == b">>":
+                return dictionary, pos + 2
+            key, pos = self.parse(pos)
+            if not isinstance(key, Name):
+                raise ProbeError("Dictionary key is not a name")
+            value, pos = self.parse(pos)
+            dictionary[key] = value
+
+    def _parse_string(self, pos: int) -> Tuple[bytes, int]:
+        buffer = self.buffer
+        out = bytearray()
+        depth = 1
+        while pos < len(buffer):
+            char = buffer[pos]
+            pos += 1
+            if char == ord("\\"):
+                char = buffer[pos]
+                pos += 1
+                if char in _STRING_ESCAPES:
+                    out += _STRING_ESCAPES[char]
+                elif ord("0") <= char <= ord("7"):
+                    digits = bytes([char])
+                    while len(digits) < 3 and ord("0") <= buffer[pos] <= ord("7"):
+                        digits += bytes([buffer[pos]])
+                        pos += 1
+                    out.append(int(digits, 8) & 0xFF)
+                elif char == ord("\r"):
+                    if buffer[pos] == ord("\n"):
+                        pos += 1
+                elif char != ord("\n"):
+                    out.append(char)
+            elif char == ord("("):
+                depth += 1
+                out.append(char)
+            elif char == ord(")"):
+                depth -= 1
+                if depth == 0:
+                    return bytes(out), pos
+                out.append(char)
+            else:
+                out.append(char)
+        raise ProbeError("Unterminated string")
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    """Undo the PNG row filters used by cross-reference streams."""
+    row_size = columns + 1
+    previous = bytearray(columns)
+    out = bytearray()
+    for start in range(0, len(data) - row_size + 1, row_size):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + row_size])
+        if kind == 1:
+            for i in range(1, columns):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif kind == 3:
+            for i in range(columns):
+                left = row[i - 1] if i else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(columns):
+                left = row[i - 1] if i else 0
+                up_left = previous[i - 1] if i else 0
+                estimate = left + previous[i] - up_left
+                distances = (abs(estimate - left), abs(estimate - previous[i]), abs(estimate - up_left))
+                predictor = (left, previous[i], up_left)[distances.index(min(distances))]
+                row[i] = (row[i] + predictor) & 0xFF
+        elif kind != 0:
+            raise ProbeError(f"Unknown PNG predictor {kind}")
+        out += row
+        previous = row
+    return bytes(out)
+
+class _Document:
+    """Cross-reference data of a PDF and lazy access to its objects."""
+
+    def __init__(self, buffer) -> None:
+        self.buffer = buffer
+        self.parser = _Parser(buffer)
+        # Newest revision first: classic (first, count, offset) subsections or decoded streams
+        self._sections: List[Any] = []
+        self._decoded = 0
+        # Object stream number: (parser over its data, offset of the first object, object offsets)
+        self._object_streams: Dict[int, Tuple[_Parser, int, List[bytes]]] = {}
+        self.trailer: Dict[str, Any] = {}
+        self._read_xref_chain()
+
+    def _read_xref_chain(self) -> None:
+        tail_start = max(0, len(self.buffer) - TAIL_SIZE)
+        marker = self.buffer.rfind(b"startxref", tail_start)
+        if marker < 0:
+            raise ProbeError("startxref not found")
+        offset, _ = self.parser.parse(marker + len(b"startxref"))
+
+        seen = set()
+        while isinstance(offset, int) and offset not in seen:
+            seen.add(offset)
+            trailer = self._read_xref(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            if "XRefStm" in trailer:
+                # Hybrid files keep the entries of compressed objects in a stream
+                self._read_xref(trailer["XRefStm"])
+            offset = trailer.get("Prev")
+
+    def _read_xref(self, offset: int) -> Dict[str, Any]:
+        buffer = self.buffer
+        pos = self.parser.skip_whitespace(offset)
+        if buffer[pos:pos + 4] != b"xref":
+            stream = self._object_at(offset)
+            if not isinstance(stream, Stream) or stream.dictionary.get("Type") != "XRef":
+                raise ProbeError("Cross-reference data not found")
+            self._sections.append(self._decode_xref_stream(stream))
+            return stream.dictionary
+
+        pos += 4
+        subsections = []
+        while True:
+            match = _XREF_SUBSECTION.match(buffer, pos)
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            subsections.append((first, count, match.end()))
+            # Entries are 20 bytes each
+            pos = match.end() + count * 20
+        self._sections.append(subsections)
+        pos = self.parser.skip_whitespace(pos)
+        if buffer[pos:pos + 7] != b"trailer":
+            raise ProbeError("Trailer not found")
+        trailer, _ = self.parser.parse(pos + 7)
+        return trailer
+
+    def _decode_xref_stream(self, stream: Stream) -> _XrefStream:
+        dictionary = stream.dictionary
+        widths = dictionary.get("W")
+        if (
+            not isinstance(widths, list) or len(widths) != 3
+            or not all(isinstance(width, int) and 0 <= width <= 8 for width in widths)
+            or sum(widths) == 0
+        ):
+            raise ProbeError("Malformed cross-reference stream widths")
+        data = self._stream_data(stream)
+        row_size = sum(widths)
+        index = dictionary.get("Index", [0, dictionary.get("Size")])
+        if not isinstance(index, list) or len(index) % 2 or not all(isinstance(value, int) and value >= 0 for value in index):
+            raise ProbeError("Malformed cross-reference stream index")
+        # The counts come from the file, so check them against the data before trusting them
+        subsections = []
+        pos = 0
+        for first, count in zip(index[::2], index[1::2]):
+            if pos + count * row_size > len(data):
+                raise ProbeError("Truncated cross-reference stream")
+            subsections.append((first, count, pos))
+            pos += count * row_size
+        return _XrefStream(data, widths, subsections)
+
+    def _lookup(self, number: int) -> Optional[Tuple[int, int, int]]:
+        # Free entries are skipped: hybrid files list their compressed objects
+        # as free in the table and locate them in the XRefStm stream instead
+        for section in self._sections:
+            if isinstance(section, _XrefStream):
+                entry = section.entry(number)
+                if entry and entry[0] != 0:
+                    return entry
+                continue
+            for first, count, start in section:
+                if first <= number < first + count:
+                    start += (number - first) * 20
+                    entry = self.buffer[start:start + 18].split()
+                    if len(entry) != 3:
+                        raise ProbeError("Malformed cross-reference entry")
+                    if entry[2] == b"n":
+                        return (1, int(entry[0]), int(entry[1]))
+        return None
+
+    def _object_at(self, offset: int) -> Any:
+        header = _OBJECT_HEADER.match(self.buffer, offset)
+        if not header:
+            raise ProbeError(f"No object at offset {offset}")
+        value, pos = self.parser.parse(header.end())
+        if isinstance(value, dict):
+            pos = self.parser.skip_whitespace(pos)
+            if self.buffer[pos:pos + 6] == b"stream":
+                pos += 6
+                if self.buffer[pos:pos + 2] == b"\r\n":
+                    pos += 2
+                elif self.buffer[pos:pos + 1] in (b"\n", b"\r"):
+                    pos += 1
+                return Stream(value, pos)
+        return value
+
+    def _stream_data(self, stream: Stream) -> bytes:
+        dictionary = stream.dictionary
+        length = self.resolve(dictionary.get("Length"))
+        if not isinstance(length, int) or length < 0:
+            raise ProbeError("Stream without length")
+        data = bytes(self.buffer[stream.start:stream.start + length])
+        filters = dictionary.get("Filter")
+        filters = filters if isinstance(filters, list) else [filters] if filters else []
+        if filters not in ([], ["FlateDecode"]):
+            raise ProbeError(f"Unsupported stream filter {filters}")
+        budget = MAX_DECODED_SIZE - self._decoded
+        if filters:
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(data, budget + 1)
+        if len(data) > budget:
+            raise ProbeError("Streams too large to probe")
+        self._decoded += len(data)
+        parameters = dictionary.get("DecodeParms") or {}
+        if isinstance(parameters, list):
+            parameters = parameters[0] or {}
+        if not isinstance(parameters, dict):
+            raise ProbeError("Malformed stream parameters")
+        predictor = parameters.get("Predictor", 1)
+        columns = parameters.get("Columns", 1)
+        if predictor not in (1, 10, 11, 12, 13, 14, 15) or not isinstance(columns, int) or columns < 1:
+            raise ProbeError(f"Unsupported predictor {predictor}")
+        if predictor >= 10:
+            data = _png_unpredict(data, columns)
+        return data
+
+    def _from_object_stream(self, stream_number: int, index: int) -> Any:
+        objects = self._object_streams.get(stream_number)
+        if objects is None:
+            stream = self.get(stream_number)
+            if not isinstance(stream, Stream):
+                raise ProbeError("Object stream not found")
+            data = self._stream_data(stream)
+            count, first = stream.dictionary.get("N"), stream.dictionary.get("First")
+            if not isinstance(count, int) or not isinstance(first, int) or not 0 <= first <= len(data):
+                raise ProbeError("Malformed object stream")
+            numbers = data[:first].split()
+            # Objects are parsed when asked for; the probe needs one or two of them
+            objects = self._object_streams[stream_number] = (_Parser(data), first, numbers[1:2 * count:2])
+        parser, first, offsets = objects
+        if not 0 <= index < len(offsets):
+            return None
+        return parser.parse(first + int(offsets[index]))[0]
+
+    def get(self, number: int) -> Any:
+        entry = self._lookup(number)
+        if entry is None:
+            return None
+        kind, first, second = entry
+        if kind == 2:
+            return self._from_object_stream(first, second)
+        return self._object_at(first)
+
+    def resolve(self, value: Any) -> Any:
+        # Bounded so reference cycles cannot loop forever
+        for _ in range(32):
+            if not isinstance(value, Reference):
+                return value
+            value = self.get(value.number)
+        raise ProbeError("Reference chain too long")
+
+def decode_text(value: Any) -> str:
+    """Decode a PDF text string (UTF-16 with a byte order mark, UTF-8 with one, or PDFDocEncoding)."""
+    if not isinstance(value, bytes):
+        return str(value)
+    if value.startswith((codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE)):
+        return value.decode("utf-16", errors="replace")
+    if value.startswith(codecs.BOM_UTF8):
+        return value[3:].decode("utf-8", errors="replace")
+    # PDFDocEncoding matches Latin-1 for the characters metadata normally uses
+    return value.decode("latin-1")
+
+def _catalog(document: _Document) -> Dict[str, Any]:
+    catalog = document.resolve(document.trailer.get("Root"))
+    if not isinstance(catalog, dict):
+        raise ProbeError("Document catalog not found")
+    return catalog
+
+def _page_count(document: _Document, catalog: Dict[str, Any]) -> int:
+    pages = document.resolve(catalog.get("Pages"))
+    page_count = document.resolve(pages.get("Count")) if isinstance(pages, dict) else None
+    if not isinstance(page_count, int):
+        raise ProbeError("Page count not found")
+    return page_count
+
+def probe_page_count(source: FileSource) -> int:
+    """Number of pages of a PDF, read from its page tree root without scanning the rest of the file."""
+    with map_source(source) as buffer:
+        if not _VERSION.match(buffer):
+            raise ProbeError("Not a PDF file")
+        try:
+            document = _Document(buffer)
+            return _page_count(document, _catalog(document))
+        except ProbeError:
+            raise
+        except Exception as e:
+            raise ProbeError(f"{type(e).__name__}: {e}") from None
+
+def probe_pdf(source: FileSource) -> PdfProbe:
+    """Describe a PDF from its cross-reference data and catalog only."""
+    with map_source(source) as buffer:
+        version = _VERSION.match(buffer)
+        if not version:
+            raise ProbeError("Not a PDF file")
+        try:
+            document = _Document(buffer)
+            catalog = _catalog(document)
+            page_count = _page_count(document, catalog)
+
+            encrypted = "Encrypt" in document.trailer
+            metadata = {}
+            info = document.resolve(document.trailer.get("Info"))
+            if isinstance(info, dict) and not encrypted:
+                # Strings of encrypted files are encrypted too
+                for key, value in info.items():
+                    value = document.resolve(value)
+                    if value not in (None, b"", ""):
+                        metadata[key] = decode_text(value)
+
+            version_text = version.group(1).decode()
+            catalog_version = document.resolve(catalog.get("Version"))
+            if isinstance(catalog_version, Name) and re.fullmatch(r"\d\.\d", catalog_version):
+                # Incremental updates can raise the version in the catalog
+                version_text = max(version_text, str(catalog_version))
+        except ProbeError:
+            raise
+        except Exception as e:
+            raise ProbeError(f"{type(e).__name__}: {e}") from None
+
+        # Image XObjects are always streams, which never sit inside compressed
+        # object streams, so their dictionaries can be found in the raw bytes
+        image_count = sum(1 for _ in _IMAGE_XOBJECT.finditer(buffer))
+
+    return PdfProbe(version_text, page_count, encrypted, image_count, metadata)
+
+def probe_image(source: FileSource) -> ImageProbe:
+    """Describe an image from its header without decoding the pixels."""
+    data = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    try:
+        with Image.open(data) as image:
+            return ImageProbe(image.format, image.width, image.height, image.mode)
+    except Exception as e:
+        raise ProbeError(f"{type(e).__name__}: {e}") from None
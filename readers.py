@@ -0,0 +1,135 @@
+import io
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Optional
+
+import PyPDF2
+
+from conversions import FileSource, open_source, source_size
+
+logger = logging.getLogger(__name__)
+
+# Parsed PDF cache configuration, per conversion worker
+READER_CACHE_MB = float(os.getenv("PDF_READER_CACHE_MB", 64))
+READER_CACHE_TTL = float(os.getenv("PDF_READER_CACHE_TTL", 600))
+MIN_AVAILABLE_MEMORY_MB = float(os.getenv("MIN_AVAILABLE_MEMORY_MB", 256))
+
+# Readers live in the conversion worker processes (see executor.py), one
+# cache per process, like the OCR engines: parsing untrusted PDFs there keeps
+# it under JOB_TIMEOUT and out of the bot process. Jobs for a key are run with
+# that key as their affinity, so follow-up jobs land on the worker holding the
+# parsed reader.
+
+def available_memory() -> Optional[int]:
+    """Bytes of memory the system can still hand out, or None where unknown."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class _Entry:
+    def __init__(self, reader: PyPDF2.PdfReader, pdf_file: BinaryIO, size: int) -> None:
+        self.reader = reader
+        self.file = pdf_file
+        # File size stands in for the memory held by the file and the parsed objects
+        self.size = size
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        self.file.close()
+
+class ReaderCache:
+    """Keeps parsed PdfReaders of recent uploads so follow-up steps skip the parse.
+
+    Entries are dropped after `ttl` seconds unused, least recently used first
+    once `max_bytes` is exceeded, and all at once when the system runs low on
+    memory.
+    """
+
+    def __init__(self, max_bytes: float = READER_CACHE_MB * 1024 * 1024, ttl: float = READER_CACHE_TTL) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def run(self, key: Optional[str], source: FileSource, func: Callable, *args) -> Any:
+        """Call `func(reader, *args)` with the cached or newly parsed reader of `source`."""
+        self.trim()
+        entry = self._get(key, source)
+        if entry is None:
+            # Not worth caching; parse for this call only
+            with open_source(source) as pdf_file:
+                return func(PyPDF2.PdfReader(pdf_file), *args)
+        entry.last_used = time.monotonic()
+        return func(entry.reader, *args)
+
+    def _get(self, key: Optional[str], source: FileSource) -> Optional[_Entry]:
+        if key is not None:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        size = source_size(source)
+        if key is None or size > self.max_bytes:
+            return None
+
+        # Readers load objects lazily, so the entry keeps the file. A copy in
+        # memory leaves the upload free to be deleted with its session.
+        with open_source(source) as upload:
+            pdf_file = io.BytesIO(upload.read())
+        entry = _Entry(PyPDF2.PdfReader(pdf_file), pdf_file, size)
+        self._entries[key] = entry
+        self.trim()
+        return entry
+
+    def evict(self, key: Optional[str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.close()
+
+    def trim(self) -> None:
+        """Drop expired entries, then the least recently used ones while over budget or low on memory."""
+        now = time.monotonic()
+        available = available_memory()
+        low_memory = available is not None and available < MIN_AVAILABLE_MEMORY_MB * 1024 * 1024
+        if low_memory and self._entries:
+            logger.warning("Low on memory, dropping cached PDF readers")
+
+        total = self.size
+        for key, entry in list(self._entries.items()):
+            if low_memory or total > self.max_bytes or now - entry.last_used > self.ttl:
+                del self._entries[key]
+                total -= entry.size
+                entry.close()
+
+    def clear(self) -> None:
+        for entry in self._entries.values():
+            entry.close()
+        self._entries.clear()
+
+_cache: Optional[ReaderCache] = None
+
+def _get_cache() -> ReaderCache:
+    global _cache
+    if _cache is None:
+        _cache = ReaderCache()
+    return _cache
+
+def with_reader(key: Optional[str], source: FileSource, func: Callable, *args) -> Any:
+    """Call `func(reader, *args)` with this worker's parsed reader of `source`, cached under key."""
+    return _get_cache().run(key, source, func, *args)
+
+def evict(key: Optional[str]) -> None:
+    """Drop this worker's reader for key, once the session that used it has ended."""
+    if _cache is not None:
+        _cache.evict(key)
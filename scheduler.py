@@ -0,0 +1,282 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from executor import WORKER_PROCESSES
+
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration
+USER_RATE = float(os.getenv("USER_JOBS_PER_MINUTE", 10)) / 60
+USER_BURST = int(os.getenv("USER_JOB_BURST", 5))
+CHAT_RATE = float(os.getenv("CHAT_JOBS_PER_MINUTE", 30)) / 60
+CHAT_BURST = int(os.getenv("CHAT_JOB_BURST", 10))
+JOB_BUDGET = int(os.getenv("JOB_BUDGET", WORKER_PROCESSES * 4))
+# Share of JOB_BUDGET low-priority (heavy) jobs may hold between them
+LOW_PRIORITY_BUDGET = int(os.getenv("LOW_PRIORITY_BUDGET", max(1, JOB_BUDGET // 2)))
+
+# Relative cost of each operation against JOB_BUDGET
+OPERATION_COSTS = {
+    "info": 1,
+    "extract": 1,
+    "text2pdf": 1,
+    "upload": 1,
+    "pdf2text": 2,
+    "merge": 2,
+    "img2pdf": 2,
+    "docx2pdf": 3,
+    "compress": 4,
+    "ocr": 4,
+    "pdf2img": 5,
+    "ocrpdf": 6,
+}
+DEFAULT_COST = 2
+
+class RateLimitedError(Exception):
+    """A user or chat has submitted jobs faster than its rate limit."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Allows `capacity` jobs at once, refilled at `rate` jobs per second."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the next token is available."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+class _Waiter:
+    def __init__(self, user_id: int, cost: int, low_priority: bool = False) -> None:
+        self.user_id = user_id
+        self.cost = cost
+        self.low_priority = low_priority
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class JobScheduler:
+    """Admits conversion jobs under per-user/per-chat rate limits and a shared cost budget.
+
+    Jobs that do not fit in the remaining budget wait in per-user queues which
+    are served round-robin, so one user with many queued files cannot starve
+    the others. Low-priority jobs have queues of their own, served only when
+    no other job is waiting, and may use at most `low_priority_budget` of the
+    budget together, so heavy jobs cannot crowd out quick ones.
+    """
+
+    def __init__(
+        self,
+        budget: int = JOB_BUDGET,
+        user_rate: float = USER_RATE,
+        user_burst: int = USER_BURST,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        low_priority_budget: int = LOW_PRIORITY_BUDGET,
+    ) -> None:
+        self.budget = max(1, budget)
+        self.low_priority_budget = max(1, min(low_priority_budget, self.budget))
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.in_use = 0
+        self.low_priority_in_use = 0
+        self._user_buckets: Dict[int, TokenBucket] = {}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # Users with waiting jobs, in round-robin order
+        self._waiting: "OrderedDict[int, Deque[_Waiter]]" = OrderedDict()
+        self._low_priority_waiting: "OrderedDict[int, Deque[_Waiter]]" = OrderedDict()
+
+    def _queues(self, low_priority: bool) -> "OrderedDict[int, Deque[_Waiter]]":
+        return self._low_priority_waiting if low_priority else self._waiting
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values()) + self.queued_low_priority
+
+    @property
+    def queued_low_priority(self) -> int:
+        return sum(len(queue) for queue in self._low_priority_waiting.values())
+
+    @staticmethod
+    def cost(operation: str) -> int:
+        return OPERATION_COSTS.get(operation, DEFAULT_COST)
+
+    def _bucket(self, buckets: Dict[int, TokenBucket], key: int, rate: float, capacity: int) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            # Drop buckets that have refilled completely; they carry no state
+            for stale in [k for k, b in buckets.items() if b.full]:
+                del buckets[stale]
+            bucket = buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    def check_rate(self, user_id: int, chat_id: Optional[int] = None) -> None:
+        """Take a token from the user's and chat's buckets or raise RateLimitedError."""
+        user_bucket = self._bucket(self._user_buckets, user_id, self.user_rate, self.user_burst)
+        chat_bucket = None
+        if chat_id is not None and chat_id != user_id:
+            chat_bucket = self._bucket(self._chat_buckets, chat_id, self.chat_rate, self.chat_burst)
+
+        if user_bucket.retry_after() > 0:
+            wait = user_bucket.retry_after()
+            raise RateLimitedError(f"You are sending files too quickly. Try again in {wait:.0f}s.", wait)
+        if chat_bucket is not None and chat_bucket.retry_after() > 0:
+            wait = chat_bucket.retry_after()
+            raise RateLimitedError(f"This chat is sending files too quickly. Try again in {wait:.0f}s.", wait)
+        user_bucket.try_take()
+        if chat_bucket is not None:
+            chat_bucket.try_take()
+
+    def queue_position(self, waiter: _Waiter) -> int:
+        """1-based position of a waiting job under round-robin service."""
+        waiting = self._queues(waiter.low_priority)
+        own = waiting.get(waiter.user_id)
+        if not own or waiter not in own:
+            return 0
+        index = own.index(waiter)
+        ahead = index
+        if waiter.low_priority:
+            # Every job in the normal queues goes first
+            ahead += self.queued - self.queued_low_priority
+        for user_id, queue in waiting.items():
+            if user_id != waiter.user_id:
+                ahead += min(len(queue), index + 1)
+        return ahead + 1
+
+    def _fits(self, cost: int, low_priority: bool) -> bool:
+        if self.in_use + cost > self.budget:
+            return False
+        return not low_priority or self.low_priority_in_use + cost <= self.low_priority_budget
+
+    def _take(self, cost: int, low_priority: bool) -> None:
+        self.in_use += cost
+        if low_priority:
+            self.low_priority_in_use += cost
+
+    def _dispatch(self) -> None:
+        """Start waiting jobs round-robin while the budget allows, low-priority ones last."""
+        self._dispatch_queues(self._waiting)
+        if not self._waiting:
+            self._dispatch_queues(self._low_priority_waiting)
+
+    def _dispatch_queues(self, waiting: "OrderedDict[int, Deque[_Waiter]]") -> None:
+        while waiting:
+            user_id, queue = next(iter(waiting.items()))
+            waiter = queue[0]
+            if not self._fits(waiter.cost, waiter.low_priority):
+                return
+            queue.popleft()
+            # Move the user to the back of the rotation
+            del waiting[user_id]
+            if queue:
+                waiting[user_id] = queue
+            if waiter.future.done():
+                continue
+            self._take(waiter.cost, waiter.low_priority)
+            waiter.future.set_result(None)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        waiting = self._queues(waiter.low_priority)
+        queue = waiting.get(waiter.user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del waiting[waiter.user_id]
+
+    async def acquire(
+        self,
+        user_id: int,
+        cost: int,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+        low_priority: bool = False,
+    ) -> int:
+        """Wait until `cost` units of the budget are granted and return the amount taken."""
+        granted = self.try_acquire(cost, low_priority)
+        if granted is not None:
+            return granted
+
+        cost = min(cost, self.low_priority_budget if low_priority else self.budget)
+        waiter = _Waiter(user_id, cost, low_priority)
+        self._queues(low_priority).setdefault(user_id, deque()).append(waiter)
+        try:
+            if on_queued is not None:
+                try:
+                    await on_queued(self.queue_position(waiter))
+                except Exception as e:
+                    logger.warning(f"Could not report queue position: {e}")
+            await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we were cancelled; give the budget back
+                self.release(cost, low_priority)
+            else:
+                self._remove(waiter)
+                self._dispatch()
+            raise
+        return cost
+
+    def try_acquire(self, cost: int, low_priority: bool = False) -> Optional[int]:
+        """Take `cost` units of the budget if they are free and nobody is waiting, without queueing.
+
+        For jobs that already hold a share and want more: waiting for it while
+        holding the first could deadlock. Returns the amount taken, or None.
+        """
+        cost = min(cost, self.low_priority_budget if low_priority else self.budget)
+        nobody_ahead = not self._waiting and not (low_priority and self._low_priority_waiting)
+        if nobody_ahead and self._fits(cost, low_priority):
+            self._take(cost, low_priority)
+            return cost
+        return None
+
+    def release(self, cost: int, low_priority: bool = False) -> None:
+        self.in_use -= cost
+        if low_priority:
+            self.low_priority_in_use -= cost
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        chat_id: Optional[int],
+        operation: str,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+        low_priority: bool = False,
+        rate_limited: bool = True,
+    ):
+        """Rate-limit, then hold a share of the budget for the duration of a job."""
+        if rate_limited:
+            self.check_rate(user_id, chat_id)
+        cost = await self.acquire(user_id, self.cost(operation), on_queued, low_priority)
+        try:
+            yield
+        finally:
+            self.release(cost, low_priority)
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Session configuration
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # "sqlite" or "memory"
+SESSION_DB = os.getenv("SESSION_DB", "sessions.sqlite3")
+SESSION_TTL = int(os.getenv("SESSION_TTL", 1800))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", 300))
+MAX_MEMORY_SESSIONS = int(os.getenv("MAX_MEMORY_SESSIONS", 10000))
+CONVERSATION_SAVE_INTERVAL = float(os.getenv("CONVERSATION_SAVE_INTERVAL", 5))
+
+@dataclass
+class Session:
+    """State of a multi-step conversation (/merge or /extract) for one user."""
+    user_id: int
+    kind: str
+    files: List[str] = field(default_factory=list)
+    page_count: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # JSON-serializable details specific to the kind of session
+    data: Dict[str, Any] = field(default_factory=dict)
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+class SessionStore:
+    """Interface shared by the session store backends.
+
+    Methods block, so the bot calls them through asyncio.to_thread; backends
+    must be safe to use from several threads.
+    """
+
+    def get(self, user_id: int) -> Optional[Session]:
+        raise NotImplementedError
+
+    def save(self, session: Session) -> None:
+        raise NotImplementedError
+
+    def delete(self, user_id: int) -> Optional[Session]:
+        """Remove and return a user's session."""
+        raise NotImplementedError
+
+    def pop_expired(self, ttl: float) -> List[Session]:
+        """Remove and return sessions not updated for `ttl` seconds."""
+        raise NotImplementedError
+
+    def referenced_files(self) -> Set[str]:
+        """Absolute paths of all files owned by live sessions."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; the oldest sessions are dropped beyond max_sessions."""
+
+    def __init__(self, max_sessions: int = MAX_MEMORY_SESSIONS) -> None:
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._evicted: List[Session] = []
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(user_id)
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.time()
+        with self._lock:
+            self._sessions[session.user_id] = session
+            self._sessions.move_to_end(session.user_id)
+            while len(self._sessions) > self.max_sessions:
+                # Hand evicted sessions to the sweeper so their files get removed
+                self._evicted.append(self._sessions.popitem(last=False)[1])
+
+    def delete(self, user_id: int) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def pop_expired(self, ttl: float) -> List[Session]:
+        cutoff = time.time() - ttl
+        with self._lock:
+            expired, self._evicted = self._evicted, []
+            for user_id, session in list(self._sessions.items()):
+                if session.updated_at < cutoff:
+                    expired.append(self._sessions.pop(user_id))
+        return expired
+
+    def referenced_files(self) -> Set[str]:
+        with self._lock:
+            return {os.path.abspath(path) for session in self._sessions.values() for path in session.files}
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in an SQLite database, surviving restarts."""
+
+    def __init__(self, path: str = SESSION_DB) -> None:
+        # One connection used from the to_thread workers, one statement at a time
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, files TEXT NOT NULL,"
+            " page_count INTEGER, created_at REAL NOT NULL, updated_at REAL NOT NULL, data TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "data" not in columns:
+            # Databases created before sessions carried extra data
+            self._db.execute("ALTER TABLE sessions ADD COLUMN data TEXT")
+
+    @staticmethod
+    def _from_row(row: tuple) -> Session:
+        user_id, kind, files, page_count, created_at, updated_at, data = row
+        return Session(user_id, kind, json.loads(files), page_count, created_at, updated_at, json.loads(data or "{}"))
+
+    def get(self, user_id: int) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT user_id, kind, files, page_count, created_at, updated_at, data FROM sessions WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        return self._from_row(row) if row else None
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, kind, files, page_count, created_at, updated_at, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session.user_id, session.kind, json.dumps(session.files), session.page_count,
+                 session.created_at, session.updated_at, json.dumps(session.data)),
+            )
+
+    def delete(self, user_id: int) -> Optional[Session]:
+        with self._transaction():
+            session = self.get(user_id)
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return session
+
+    def pop_expired(self, ttl: float) -> List[Session]:
+        cutoff = time.time() - ttl
+        with self._transaction():
+            rows = self._db.execute(
+                "SELECT user_id, kind, files, page_count, created_at, updated_at, data FROM sessions"
+                " WHERE updated_at < ?",
+                (cutoff,),
+            ).fetchall()
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        return [self._from_row(row) for row in rows]
+
+    def referenced_files(self) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT files FROM sessions").fetchall()
+        return {os.path.abspath(path) for (files,) in rows for path in json.loads(files)}
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front so other processes cannot interleave
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class SQLiteConversationPersistence(BasePersistence):
+    """Conversation states of the persistent ConversationHandlers, kept next to the sessions.
+
+    Only conversations are stored. The application writes changed states
+    every update_interval seconds and on shutdown, and loads them on startup.
+    """
+
+    def __init__(self, path: str = SESSION_DB, update_interval: float = CONVERSATION_SAVE_INTERVAL) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key))"
+        )
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[Union[int, str], ...], object]:
+        rows = await asyncio.to_thread(self._execute, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(
+        self, name: str, key: Tuple[Union[int, str], ...], new_state: Optional[object]
+    ) -> None:
+        if new_state is None:
+            await asyncio.to_thread(
+                self._execute, "DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(key))
+            )
+        else:
+            await asyncio.to_thread(
+                self._execute, "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                (name, json.dumps(key), json.dumps(new_state)),
+            )
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self._db.close)
+
+    # Nothing but conversations is stored
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+def create_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+def create_conversation_persistence(backend: str = SESSION_BACKEND) -> Optional[BasePersistence]:
+    """Persistence for the conversation states; the memory backend keeps them in memory only."""
+    if backend == "sqlite":
+        return SQLiteConversationPersistence()
+    return None
+
+def sweep(store: SessionStore, ttl: float = SESSION_TTL) -> int:
+    """Expire idle sessions and delete their files.
+
+    Orphaned files are left to the workspace sweeper. Returns the number of
+    files removed.
+    """
+    removed = 0
+    for session in store.pop_expired(ttl):
+        logger.info(f"Expiring abandoned {session.kind} session of user {session.user_id}")
+        removed += sum(1 for path in session.files if os.path.exists(path))
+        remove_files(session.files)
+    return removed
+
+async def run_sweeper(store: SessionStore, interval: float = SESSION_SWEEP_INTERVAL) -> None:
+    """Periodically call sweep() until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await asyncio.to_thread(sweep, store)
+            if removed:
+                logger.info(f"Session sweeper removed {removed} files")
+        except Exception as e:
+            logger.error(f"Session sweeper error: {e}")
@@ -0,0 +1,50 @@
+import pytest
+
+import admission
+from admission import AdmissionError, admit, admit_pages, estimate_cost
+from scheduler import OPERATION_COSTS
+
+MB = 1024 * 1024
+
+def test_cost_grows_with_the_input_size():
+    base = OPERATION_COSTS["compress"]
+    assert estimate_cost("compress", None) == base
+    assert estimate_cost("compress", 10 * MB) == pytest.approx(base + 10 * admission.COST_PER_MB["compress"])
+
+def test_small_jobs_are_accepted():
+    result = admit("pdf2text", [(MB, "application/pdf")])
+    assert (result.operation, result.low_priority, result.decision) == ("pdf2text", False, "accepted")
+
+def test_heavy_jobs_go_to_the_low_priority_queue():
+    size = int((admission.HEAVY_JOB_COST / admission.COST_PER_MB["ocrpdf"] + 1) * MB)
+    result = admit("ocrpdf", [(size, "application/pdf")])
+    assert (result.low_priority, result.decision) == (True, "low_priority")
+    assert result.cost > admission.HEAVY_JOB_COST
+
+def test_wrong_file_types_are_rejected():
+    with pytest.raises(AdmissionError, match="Expected a PDF"):
+        admit("pdf2text", [(MB, "application/zip")])
+    with pytest.raises(AdmissionError, match="Expected an image"):
+        admit("ocr", [(MB, "application/pdf")])
+    with pytest.raises(AdmissionError, match="Unsupported file format"):
+        admit("unsupported", [(MB, "application/msword")])
+
+def test_missing_and_generic_types_are_let_through():
+    admit("pdf2text", [(MB, None)])
+    admit("pdf2text", [(MB, "application/octet-stream")])
+    admit("docx2pdf", [(MB, "application/zip")])
+
+def test_files_over_the_size_limit_are_rejected():
+    with pytest.raises(AdmissionError, match="up to"):
+        admit("ocr", [(admission.MAX_IMAGE_SIZE + 1, "image/jpeg")])
+    with pytest.raises(AdmissionError, match="up to"):
+        admit("compress", [(admission.MAX_FILE_SIZE + 1, "application/pdf")])
+    # Sizes Telegram does not report cannot be checked up front
+    admit("compress", [(None, "application/pdf")])
+
+def test_page_limits():
+    assert admit_pages("ocrpdf", admission.OCRPDF_MAX_PAGES) is None
+    assert admit_pages("ocrpdf", admission.OCRPDF_MAX_PAGES + 1) == admission.OCRPDF_MAX_PAGES
+    assert admit_pages("compress", admission.MAX_PDF_PAGES) is None
+    with pytest.raises(AdmissionError):
+        admit_pages("compress", admission.MAX_PDF_PAGES + 1)
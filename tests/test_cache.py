@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import cache
+from cache import ResultCache, file_digest
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+@pytest.fixture
+def make_file(tmp_path):
+    def make_file(name, size):
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        return str(path)
+    return make_file
+
+def test_keys_depend_on_source_operation_and_params():
+    key = ResultCache.make_key("file", "pdf2text", {"pages": [1, 2]})
+    assert key == ResultCache.make_key("file", "pdf2text", {"pages": [1, 2]})
+    assert key != ResultCache.make_key("file", "pdf2text", {"pages": [1]})
+    assert key != ResultCache.make_key("file", "compress", {"pages": [1, 2]})
+    assert key != ResultCache.make_key("other", "pdf2text", {"pages": [1, 2]})
+
+def test_put_and_get_keep_a_copy(tmp_path, clock, make_file):
+    results = ResultCache(str(tmp_path / "cache"), max_bytes=1000, ttl=60)
+    source = make_file("result.pdf", 100)
+    results.put("key", source, file_id="telegram-id")
+    os.remove(source)
+
+    entry = results.get("key")
+    assert (entry.filename, entry.size, entry.file_id) == ("result.pdf", 100, "telegram-id")
+    assert os.path.getsize(entry.path) == 100
+    results.set_file_id("key", "new-id")
+    assert results.get("key").file_id == "new-id"
+    assert results.get("missing") is None
+    results.close()
+
+def test_entries_expire_after_the_ttl(tmp_path, clock, make_file):
+    results = ResultCache(str(tmp_path / "cache"), max_bytes=1000, ttl=60)
+    results.put("key", make_file("result.pdf", 100))
+    clock.now += 59
+    assert results.get("key") is not None
+    clock.now += 2
+    assert results.get("key") is None
+    assert not os.path.exists(os.path.join(results.directory, "key"))
+    results.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock, make_file):
+    results = ResultCache(str(tmp_path / "cache"), max_bytes=250, ttl=3600)
+    for key in ("a", "b"):
+        results.put(key, make_file(f"{key}.pdf", 100))
+        clock.now += 1
+    # Reading a makes b the least recently used
+    assert results.get("a") is not None
+    clock.now += 1
+    results.put("c", make_file("c.pdf", 100))
+
+    assert results.get("b") is None
+    assert results.get("a") is not None
+    assert results.get("c") is not None
+    results.close()
+
+def test_files_larger_than_the_cache_are_not_stored(tmp_path, clock, make_file):
+    results = ResultCache(str(tmp_path / "cache"), max_bytes=50, ttl=60)
+    results.put("key", make_file("result.pdf", 100))
+    assert results.get("key") is None
+    results.close()
+
+def test_file_digest_matches_for_paths_and_bytes(make_file):
+    path = make_file("input.pdf", 10)
+    assert file_digest(path) == file_digest(b"x" * 10)
+    assert file_digest(make_file("empty.pdf", 0)) == file_digest(b"")
@@ -0,0 +1,92 @@
+import os
+import time
+import signal
+import asyncio
+
+import pytest
+
+import executor
+from executor import ConversionExecutor, JobError, JobTimeoutError, TooManyJobsError
+
+# Jobs run in spawned workers, so they must be importable module-level functions
+
+def stuck(seconds: float) -> None:
+    """Sleep where the in-worker alarm cannot interrupt, like a job stuck in native code."""
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    try:
+        time.sleep(seconds)
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+
+class Unpicklable(Exception):
+    def __init__(self, first, second):
+        super().__init__(first)
+
+def raise_unpicklable() -> None:
+    raise Unpicklable("first", "second")
+
+def run_jobs(coroutine_function):
+    """Run a test coroutine with a fresh one-worker executor, shutting it down afterwards."""
+    async def main():
+        pool = ConversionExecutor(max_workers=1, job_timeout=30, pinned_workers=1)
+        try:
+            return await coroutine_function(pool)
+        finally:
+            await pool.shutdown()
+    return asyncio.run(main())
+
+def test_alarm_stops_a_slow_job_and_keeps_the_worker():
+    async def check(pool):
+        pid = await pool.run(os.getpid)
+        start = time.monotonic()
+        with pytest.raises(JobTimeoutError):
+            await pool.run(time.sleep, 10, timeout=0.5)
+        assert time.monotonic() - start < 5
+        return pid, await pool.run(os.getpid)
+
+    before, after = run_jobs(check)
+    assert before == after
+
+def test_stuck_job_restarts_the_pool(monkeypatch):
+    monkeypatch.setattr(executor, "TIMEOUT_GRACE", 0.5)
+
+    async def check(pool):
+        pid = await pool.run(os.getpid)
+        start = time.monotonic()
+        with pytest.raises(JobTimeoutError):
+            await pool.run(stuck, 30, timeout=0.5)
+        assert time.monotonic() - start < 5
+        return pid, await pool.run(os.getpid)
+
+    before, after = run_jobs(check)
+    assert before != after
+
+def test_time_left_follows_the_job_timeout():
+    async def check(pool):
+        return await pool.run(executor.time_left, timeout=10), await pool.run(executor.time_left, timeout=0)
+
+    left, unlimited = run_jobs(check)
+    assert 0 < left <= 10
+    assert unlimited is None
+
+def test_unpicklable_errors_keep_the_pool_usable():
+    async def check(pool):
+        with pytest.raises(JobError, match="Unpicklable"):
+            await pool.run(raise_unpicklable)
+        return await pool.run(sum, [1, 2, 3])
+
+    assert run_jobs(check) == 6
+
+def test_user_slots_are_limited():
+    async def check():
+        pool = ConversionExecutor(max_workers=1, max_jobs_per_user=2)
+        async with pool.user_slot(1), pool.user_slot(1):
+            with pytest.raises(TooManyJobsError):
+                async with pool.user_slot(1):
+                    pass
+            async with pool.user_slot(2):
+                pass
+        async with pool.user_slot(1):
+            pass
+
+    asyncio.run(check())
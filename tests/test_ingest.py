@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+from ingest import UpdateQueue
+
+def make_update(update_id, chat_id=None, user_id=None):
+    return SimpleNamespace(
+        update_id=update_id,
+        effective_chat=SimpleNamespace(id=chat_id) if chat_id is not None else None,
+        effective_user=SimpleNamespace(id=user_id) if user_id is not None else None,
+    )
+
+async def settle(queue):
+    while queue.pending:
+        await asyncio.sleep(0.01)
+
+def test_duplicates_are_accepted_and_dropped():
+    async def check():
+        processed = []
+
+        async def process(update):
+            processed.append(update.update_id)
+
+        queue = UpdateQueue(process, dedup_window=2)
+        for update_id in (1, 1, 2, 1, 3, 1):
+            assert queue.submit(make_update(update_id, chat_id=10))
+        await settle(queue)
+        await queue.stop()
+        return processed
+
+    # Only the last two ids are remembered, so 1 is processed again after 3
+    assert asyncio.run(check()) == [1, 2, 3, 1]
+
+def test_updates_of_a_chat_run_in_order_without_holding_up_others():
+    async def check():
+        events = []
+        release = asyncio.Event()
+
+        async def process(update):
+            events.append(("start", update.update_id))
+            if update.update_id == 1:
+                await release.wait()
+            events.append(("end", update.update_id))
+
+        queue = UpdateQueue(process)
+        queue.submit(make_update(1, chat_id=10))
+        queue.submit(make_update(2, chat_id=10))
+        queue.submit(make_update(3, chat_id=20))
+        queue.submit(make_update(4, user_id=5))
+        await asyncio.sleep(0.05)
+        # Chat 10 waits on update 1; the other chat and the chatless update are done
+        assert ("end", 3) in events and ("end", 4) in events
+        assert ("start", 2) not in events
+        release.set()
+        await settle(queue)
+        await queue.stop()
+        return events
+
+    events = asyncio.run(check())
+    assert events.index(("end", 1)) < events.index(("start", 2))
+
+def test_full_or_stopped_queue_rejects_updates():
+    async def check():
+        release = asyncio.Event()
+
+        async def process(update):
+            await release.wait()
+
+        queue = UpdateQueue(process, maxsize=2)
+        assert queue.submit(make_update(1, chat_id=10))
+        assert queue.submit(make_update(2, chat_id=20))
+        assert not queue.submit(make_update(3, chat_id=30))
+        # A redelivery of an accepted update is still acknowledged
+        assert queue.submit(make_update(1, chat_id=10))
+        release.set()
+        await queue.stop()
+        return queue.submit(make_update(4, chat_id=10)), queue.pending
+
+    assert asyncio.run(check()) == (False, 0)
+
+def test_failing_update_does_not_stop_the_chat():
+    async def check():
+        processed = []
+
+        async def process(update):
+            processed.append(update.update_id)
+            if update.update_id == 1:
+                raise RuntimeError("broken handler")
+
+        queue = UpdateQueue(process)
+        queue.submit(make_update(1, chat_id=10))
+        queue.submit(make_update(2, chat_id=10))
+        await settle(queue)
+        await queue.stop()
+        return processed
+
+    assert asyncio.run(check()) == [1, 2]
+
+def test_concurrency_is_bounded_by_workers():
+    async def check():
+        running = 0
+        peak = 0
+
+        async def process(update):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        queue = UpdateQueue(process, workers=3)
+        for update_id in range(20):
+            queue.submit(make_update(update_id, chat_id=update_id))
+        await settle(queue)
+        await queue.stop()
+        return peak
+
+    assert asyncio.run(check()) == 3
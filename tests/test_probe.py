@@ -0,0 +1,187 @@
+import io
+import time
+import zlib
+
+import PyPDF2
+import pytest
+
+from probe import ProbeError, probe_page_count, probe_pdf
+
+PAGE = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"
+
+def pages_tree(*kids: int) -> bytes:
+    refs = b" ".join(b"%d 0 R" % kid for kid in kids)
+    return b"<< /Type /Pages /Kids [%s] /Count %d >>" % (refs, len(kids))
+
+def xref_rows(offsets, predictor: bool) -> bytes:
+    """Type 1 xref stream entries with /W [1 4 2], PNG Up-predicted if asked."""
+    rows = [b"\x01" + offset.to_bytes(4, "big") + b"\x00\x00" for _, offset in sorted(offsets.items())]
+    if not predictor:
+        return b"".join(rows)
+    data, previous = b"", bytes(7)
+    for row in rows:
+        data += b"\x02" + bytes((a - b) % 256 for a, b in zip(row, previous))
+        previous = row
+    return data
+
+def build_pdf(objects, size, base=b"", prev=None, xref_stream=False, predictor=False, info=None) -> bytes:
+    """Write objects as a PDF, or as an incremental update appended to base."""
+    out = bytearray(base or b"%PDF-1.5\n")
+    offsets = {}
+    for number, body in sorted(objects.items()):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    trailer = b"/Size %d /Root 1 0 R" % (size + 1 if xref_stream else size)
+    if prev is not None:
+        trailer += b" /Prev %d" % prev
+    if info is not None:
+        trailer += b" /Info %d 0 R" % info
+
+    xref_offset = len(out)
+    if xref_stream:
+        offsets[size] = xref_offset
+        index = b" ".join(b"%d 1" % number for number in sorted(offsets))
+        data = xref_rows(offsets, predictor)
+        parameters = b""
+        if predictor:
+            data = zlib.compress(data)
+            parameters = b" /Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns 7 >>"
+        out += b"%d 0 obj\n<< /Type /XRef %s /W [1 4 2] /Index [%s] /Length %d%s >>\nstream\n" % (
+            size, trailer, index, len(data), parameters
+        )
+        out += data + b"\nendstream\nendobj\n"
+    else:
+        out += b"xref\n"
+        if not base:
+            out += b"0 1\n0000000000 65535 f \n"
+        for number, offset in sorted(offsets.items()):
+            out += b"%d 1\n%010d 00000 n \n" % (number, offset)
+        out += b"trailer\n<< %s >>\n" % trailer
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    return bytes(out)
+
+def startxref(data: bytes) -> int:
+    return int(data[data.rindex(b"startxref") + 9:].split()[0])
+
+def two_pages(**kwargs) -> bytes:
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 2: pages_tree(3, 4), 3: PAGE, 4: PAGE}
+    return build_pdf(objects, 5, **kwargs)
+
+def add_page(base: bytes, **kwargs) -> bytes:
+    """Incremental update that appends a third page."""
+    return build_pdf({2: pages_tree(3, 4, 6), 6: PAGE}, 7, base=base, prev=startxref(base), **kwargs)
+
+def pypdf2_page_count(data: bytes) -> int:
+    return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+def written_by_pypdf2(pages: int) -> bytes:
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+    writer.add_metadata({"/Title": "Quarterly report", "/Author": "Finance"})
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+@pytest.mark.parametrize("data", [
+    pytest.param(two_pages(), id="xref-table"),
+    pytest.param(two_pages(xref_stream=True), id="xref-stream"),
+    pytest.param(two_pages(xref_stream=True, predictor=True), id="xref-stream-flate-predictor"),
+    pytest.param(add_page(two_pages()), id="incremental"),
+    pytest.param(add_page(two_pages(xref_stream=True), xref_stream=True), id="incremental-xref-stream"),
+    pytest.param(add_page(two_pages(), xref_stream=True, predictor=True), id="table-then-stream"),
+    pytest.param(written_by_pypdf2(1), id="pypdf2-1"),
+    pytest.param(written_by_pypdf2(250), id="pypdf2-250"),
+])
+def test_page_count_matches_pypdf2(data, tmp_path):
+    expected = pypdf2_page_count(data)
+    assert probe_page_count(data) == expected
+    assert probe_pdf(data).page_count == expected
+
+    # Paths are memory-mapped rather than read
+    path = tmp_path / "input.pdf"
+    path.write_bytes(data)
+    assert probe_page_count(str(path)) == expected
+
+def test_incremental_update_is_followed():
+    base = two_pages()
+    assert probe_page_count(base) == 2
+    assert probe_page_count(add_page(base)) == 3
+
+def test_metadata_matches_pypdf2():
+    data = written_by_pypdf2(3)
+    metadata = PyPDF2.PdfReader(io.BytesIO(data)).metadata
+    probed = probe_pdf(data)
+    assert probed.metadata["Title"] == metadata.title
+    assert probed.metadata["Author"] == metadata.author
+    assert not probed.encrypted
+
+def object_stream_pdf() -> bytes:
+    """Catalog and page tree inside an object stream, located by an xref stream."""
+    catalog, pages = b"<< /Type /Catalog /Pages 2 0 R >>", pages_tree(3)
+    header = b"1 0 2 %d " % (len(catalog) + 1)
+    contents = header + catalog + b" " + pages
+    out = bytearray(b"%PDF-1.5\n")
+    offsets = {3: len(out)}
+    out += b"3 0 obj\n%s\nendobj\n" % PAGE
+    offsets[4] = len(out)
+    out += b"4 0 obj\n<< /Type /ObjStm /N 2 /First %d /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (
+        len(header), len(contents), contents
+    )
+    offsets[5] = len(out)
+    rows = b"\x02" + (4).to_bytes(4, "big") + b"\x00\x00" + b"\x02" + (4).to_bytes(4, "big") + b"\x00\x01"
+    rows += b"".join(b"\x01" + offsets[number].to_bytes(4, "big") + b"\x00\x00" for number in (3, 4, 5))
+    out += b"5 0 obj\n<< /Type /XRef /Size 6 /Root 1 0 R /W [1 4 2] /Index [1 5] /Length %d >>\nstream\n" % len(rows)
+    out += rows + b"\nendstream\nendobj\n"
+    out += b"startxref\n%d\n%%%%EOF\n" % offsets[5]
+    return bytes(out)
+
+def test_object_streams():
+    data = object_stream_pdf()
+    assert probe_page_count(data) == pypdf2_page_count(data) == 1
+
+# Malformed uploads
+
+def xref_stream_only(dictionary: bytes, data: bytes = b"") -> bytes:
+    out = b"%PDF-1.5\n"
+    offset = len(out)
+    out += b"1 0 obj\n<< /Type /XRef %s /Length %d >>\nstream\n" % (dictionary, len(data))
+    out += data + b"\nendstream\nendobj\n"
+    return out + b"startxref\n%d\n%%%%EOF\n" % offset
+
+def self_referencing_catalog() -> bytes:
+    return build_pdf({1: b"1 0 R"}, 2)
+
+def deeply_nested() -> bytes:
+    return build_pdf({1: b"[" * 100000 + b"]" * 100000}, 2)
+
+@pytest.mark.parametrize("data", [
+    pytest.param(xref_stream_only(b"/Size 50000000 /W [1 4 2]"), id="huge-size"),
+    pytest.param(xref_stream_only(b"/Size 1 /Index [0 4000000000] /W [1 4 2]"), id="huge-index"),
+    pytest.param(xref_stream_only(b"/Size 10 /W [1 99999999 2]", bytes(70)), id="huge-width"),
+    pytest.param(xref_stream_only(b"/Size 10 /W 7", bytes(70)), id="widths-not-array"),
+    pytest.param(
+        xref_stream_only(b"/Size 10 /W [1 4 2] /Filter /FlateDecode", zlib.compress(bytes(256 * 1024 * 1024))),
+        id="deflate-bomb",
+    ),
+    pytest.param(
+        xref_stream_only(b"/Size 10 /W [1 4 2] /DecodeParms << /Predictor 12 /Columns 0 >>", bytes(80)),
+        id="zero-columns",
+    ),
+    pytest.param(self_referencing_catalog(), id="reference-cycle"),
+    pytest.param(deeply_nested(), id="deep-nesting"),
+    pytest.param(two_pages()[:-40], id="truncated"),
+    pytest.param(b"%PDF-1.7\n" + bytes(5000), id="no-xref"),
+])
+def test_malformed_input_fails_fast(data):
+    start = time.monotonic()
+    with pytest.raises(ProbeError):
+        probe_page_count(data)
+    with pytest.raises(ProbeError):
+        probe_pdf(data)
+    assert time.monotonic() - start < 5
+
+def test_prev_loop_is_followed_once():
+    offset = startxref(two_pages())
+    assert probe_page_count(two_pages(prev=offset)) == 2
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import scheduler
+from scheduler import JobScheduler, RateLimitedError, TokenBucket
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    return clock
+
+def test_token_bucket_burst_then_refill(clock):
+    bucket = TokenBucket(rate=0.5, capacity=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(2.0)
+
+    clock.now += 1
+    assert not bucket.try_take()
+    clock.now += 1
+    assert bucket.try_take()
+
+    # Refills stop at capacity
+    clock.now += 100
+    assert bucket.full
+    assert sum(bucket.try_take() for _ in range(5)) == 3
+
+def test_check_rate_limits_users_and_chats(clock):
+    jobs = JobScheduler(user_rate=1, user_burst=2, chat_rate=1, chat_burst=3)
+    jobs.check_rate(1, 100)
+    jobs.check_rate(1, 100)
+    with pytest.raises(RateLimitedError) as limited:
+        jobs.check_rate(1, 100)
+    assert limited.value.retry_after == pytest.approx(1.0)
+
+    # Another user in the same group uses up what is left of the chat's burst
+    jobs.check_rate(2, 100)
+    with pytest.raises(RateLimitedError, match="This chat"):
+        jobs.check_rate(2, 100)
+
+    clock.now += 1
+    jobs.check_rate(1, 100)
+
+async def queue_jobs(jobs, requests):
+    """Queue (user, operation, low_priority) requests behind a job holding the whole budget."""
+    started = []
+    holder = await jobs.acquire(0, jobs.budget)
+
+    async def run(user_id, operation, low_priority):
+        cost = await jobs.acquire(user_id, jobs.cost(operation), low_priority=low_priority)
+        started.append((user_id, operation))
+        # Let every job run alone, so the order is decided by the queues
+        await asyncio.sleep(0)
+        jobs.release(cost, low_priority)
+
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(run(*request)))
+        await asyncio.sleep(0)
+    assert jobs.queued == len(requests)
+    jobs.release(holder)
+    await asyncio.gather(*tasks)
+    assert jobs.in_use == 0 and jobs.queued == 0
+    return started
+
+def test_waiting_users_are_served_round_robin():
+    jobs = JobScheduler(budget=2, low_priority_budget=2)
+    requests = [(1, "pdf2text", False)] * 3 + [(2, "pdf2text", False), (3, "pdf2text", False)]
+    started = asyncio.run(queue_jobs(jobs, requests))
+    assert [user_id for user_id, _ in started] == [1, 2, 3, 1, 1]
+
+def test_low_priority_jobs_wait_for_quick_ones():
+    jobs = JobScheduler(budget=6, low_priority_budget=6)
+    requests = [(1, "ocrpdf", True), (2, "info", False), (3, "ocrpdf", True), (1, "info", False)]
+    started = asyncio.run(queue_jobs(jobs, requests))
+    assert started == [(2, "info"), (1, "info"), (1, "ocrpdf"), (3, "ocrpdf")]
+
+def test_queue_position_counts_other_users_round_robin():
+    async def positions():
+        jobs = JobScheduler(budget=1)
+        holder = await jobs.acquire(0, 1)
+        seen = []
+
+        async def on_queued(position):
+            seen.append(position)
+
+        tasks = [
+            asyncio.create_task(jobs.acquire(user_id, 1, on_queued))
+            for user_id in (1, 1, 1, 2)
+        ]
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        jobs.release(holder)
+        return seen
+
+    # User 2's first job is served before user 1's second and third
+    assert asyncio.run(positions()) == [1, 2, 3, 2]
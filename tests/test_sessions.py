@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import sessions
+from sessions import (
+    MemorySessionStore, Session, SQLiteConversationPersistence, SQLiteSessionStore, sweep,
+)
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemorySessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    yield store
+    store.close()
+
+def test_sessions_round_trip(store, tmp_path, clock):
+    session = Session(1, "merge", files=[str(tmp_path / "a.pdf")], page_count=3, data={"inputs": [{"pages": 3}]})
+    store.save(session)
+    loaded = store.get(1)
+    assert (loaded.kind, loaded.files, loaded.page_count, loaded.data) == (
+        "merge", session.files, 3, {"inputs": [{"pages": 3}]}
+    )
+    assert store.referenced_files() == {str(tmp_path / "a.pdf")}
+    assert store.delete(1).kind == "merge"
+    assert store.get(1) is None
+    assert store.delete(1) is None
+
+def test_sweep_expires_idle_sessions_and_their_files(store, tmp_path, clock):
+    idle = tmp_path / "idle.pdf"
+    active = tmp_path / "active.pdf"
+    orphan = tmp_path / "orphan.pdf"
+    for path in (idle, active, orphan):
+        path.write_bytes(b"%PDF")
+
+    store.save(Session(1, "merge", files=[str(idle)]))
+    clock.now += 100
+    store.save(Session(2, "extract", files=[str(active)]))
+    clock.now += 50
+
+    assert sweep(store, ttl=120) == 1
+    assert store.get(1) is None and not idle.exists()
+    assert store.get(2) is not None and active.exists()
+    # Files no session owns are left to the workspace sweeper
+    assert orphan.exists()
+
+def test_memory_store_hands_evicted_sessions_to_the_sweeper(tmp_path, clock):
+    store = MemorySessionStore(max_sessions=2)
+    first = tmp_path / "first.pdf"
+    first.write_bytes(b"%PDF")
+    store.save(Session(1, "merge", files=[str(first)]))
+    store.save(Session(2, "merge"))
+    store.save(Session(3, "merge"))
+
+    assert store.get(1) is None
+    assert sweep(store, ttl=3600) == 1
+    assert not first.exists()
+
+def test_conversation_states_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def save():
+        persistence = SQLiteConversationPersistence(path)
+        await persistence.update_conversation("merge", (10, 1), 0)
+        await persistence.update_conversation("merge", (20, 2), 0)
+        await persistence.update_conversation("merge", (20, 2), None)
+        await persistence.update_conversation("extract", (10, 1), 2)
+        await persistence.flush()
+
+    async def load():
+        persistence = SQLiteConversationPersistence(path)
+        try:
+            return await persistence.get_conversations("merge"), await persistence.get_conversations("extract")
+        finally:
+            await persistence.flush()
+
+    asyncio.run(save())
+    assert asyncio.run(load()) == ({(10, 1): 0}, {(10, 1): 2})
@@ -0,0 +1,44 @@
+import pytest
+
+from textlayout import GlyphWidths, layout_lines, wrap_line
+
+WIDTH = 200
+
+@pytest.fixture
+def widths():
+    return GlyphWidths()
+
+def test_short_line_is_kept(widths):
+    assert wrap_line("Hello world", WIDTH, widths) == ["Hello world"]
+    assert wrap_line("", WIDTH, widths) == [""]
+
+def test_long_line_breaks_at_spaces(widths):
+    line = " ".join(f"word{i}" for i in range(40))
+    pieces = wrap_line(line, WIDTH, widths)
+    assert len(pieces) > 1
+    assert all(widths.measure(piece) <= WIDTH for piece in pieces)
+    # Breaks drop the space they happen at and nothing else
+    assert " ".join(pieces).split() == line.split()
+    assert all(not piece.startswith(" ") for piece in pieces)
+
+def test_word_wider_than_line_is_split(widths):
+    word = "x" * 200
+    pieces = wrap_line(word, WIDTH, widths)
+    assert "".join(pieces) == word
+    assert all(widths.measure(piece) <= WIDTH for piece in pieces)
+    # Every piece but the last is filled as far as it goes
+    assert all(widths.measure(piece + "x") > WIDTH for piece in pieces[:-1])
+
+def test_measure_matches_reportlab(widths):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    text = "The quick brown fox, 1234 — ümlaut"
+    assert widths.measure(text) == pytest.approx(stringWidth(text, widths.font_name, widths.font_size))
+
+def test_layout_lines_strips_newlines_and_expands_tabs(widths):
+    lines = ["a\tb\n", "\r\n", "c" * 100 + "\n"]
+    laid_out = list(layout_lines(lines, WIDTH, widths))
+    assert laid_out[0] == "a   b"
+    assert laid_out[1] == ""
+    assert "".join(laid_out[2:]) == "c" * 100
+    assert all(widths.measure(line) <= WIDTH for line in laid_out)
@@ -0,0 +1,91 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from workspace import DiskBudgetExceededError, Workspace
+
+@pytest.fixture
+def roots(tmp_path):
+    roots = [str(tmp_path / name) for name in ("uploads", "converted", "temp")]
+    for root in roots:
+        os.makedirs(root)
+    return roots
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_estimate_has_a_floor_and_a_ceiling(roots):
+    workspace = Workspace(roots, max_bytes=100 * 1024 * 1024)
+    assert workspace.estimate(None) == 5 * 1024 * 1024
+    assert workspace.estimate(10 * 1024 * 1024) == 30 * 1024 * 1024
+    # A job bigger than the whole budget may still run on its own
+    assert workspace.estimate(1024 * 1024 * 1024) == 100 * 1024 * 1024
+
+def test_job_directories_are_removed_and_reservations_released(roots):
+    async def check():
+        workspace = Workspace(roots, max_bytes=1000)
+        async with workspace.job(400) as job:
+            path = job.path(roots[0], "input.pdf")
+            with open(path, "wb") as f:
+                f.write(b"x" * 100)
+            assert workspace.reserved == 400
+        return workspace, path
+
+    workspace, path = asyncio.run(check())
+    assert workspace.reserved == 0
+    assert not os.path.exists(os.path.dirname(path))
+
+def test_jobs_wait_for_room_in_the_budget(roots):
+    async def check():
+        workspace = Workspace(roots, max_bytes=1000, wait_timeout=5)
+        events = []
+
+        async def on_wait():
+            events.append("waiting")
+
+        async def second():
+            async with workspace.job(600, on_wait):
+                events.append("second")
+
+        async with workspace.job(600):
+            task = asyncio.create_task(second())
+            await asyncio.sleep(0.05)
+            events.append("first done")
+        await task
+        return events
+
+    assert asyncio.run(check()) == ["waiting", "first done", "second"]
+
+def test_files_on_disk_count_against_the_budget(roots):
+    with open(os.path.join(roots[2], "session.pdf"), "wb") as f:
+        f.write(b"x" * 800)
+
+    async def check():
+        workspace = Workspace(roots, max_bytes=1000, wait_timeout=0.1)
+        await workspace.acquire(200)
+        with pytest.raises(DiskBudgetExceededError):
+            await workspace.acquire(1)
+        await workspace.release(200)
+        return workspace.reserved
+
+    assert asyncio.run(check()) == 0
+
+def test_sweep_removes_only_stale_unused_files(roots):
+    workspace = Workspace(roots, file_ttl=60)
+    stale = os.path.join(roots[0], "stale.pdf")
+    kept = os.path.join(roots[2], "session.pdf")
+    fresh = os.path.join(roots[1], "fresh.pdf")
+    stale_job = os.path.join(roots[1], "oldjob")
+    for path in (stale, kept, fresh):
+        with open(path, "wb") as f:
+            f.write(b"x")
+    os.makedirs(stale_job)
+    for path in (stale, kept, stale_job):
+        age(path, 120)
+
+    assert workspace.sweep(keep={os.path.abspath(kept)}) == 2
+    assert not os.path.exists(stale) and not os.path.exists(stale_job)
+    assert os.path.exists(kept) and os.path.exists(fresh)
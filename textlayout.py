@@ -0,0 +1,132 @@
+import re
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Tuple
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# Page layout for text rendered to PDF
+PAGE_SIZE = letter
+MARGIN = 50
+FONT_NAME = "Helvetica"
+FONT_SIZE = 12
+LEADING = 15
+TAB_SIZE = 4
+
+_TOKENS = re.compile(r"\S+|\s+")
+
+class GlyphWidths(dict):
+    """Measures text in one font, caching the width of every character seen."""
+
+    def __init__(self, font_name: str = FONT_NAME, font_size: float = FONT_SIZE) -> None:
+        super().__init__()
+        self.font_name = font_name
+        self.font_size = font_size
+
+    def __missing__(self, char: str) -> float:
+        width = self[char] = stringWidth(char, self.font_name, self.font_size)
+        return width
+
+    def char(self, char: str) -> float:
+        return self[char]
+
+    def measure(self, text: str) -> float:
+        # map() keeps the per-character lookups out of the interpreter loop
+        return sum(map(self.__getitem__, text))
+
+def wrap_line(line: str, max_width: float, widths: GlyphWidths) -> List[str]:
+    """Break a line into pieces no wider than max_width, at spaces where possible."""
+    if widths.measure(line) <= max_width:
+        return [line]
+
+    pieces = []
+    current, current_width = "", 0.0
+    for token in _TOKENS.findall(line):
+        token_width = widths.measure(token)
+        if current_width + token_width <= max_width:
+            current += token
+            current_width += token_width
+        elif token.isspace():
+            # Spaces at a break are dropped
+            pieces.append(current)
+            current, current_width = "", 0.0
+        elif token_width <= max_width:
+            if current:
+                pieces.append(current)
+            current, current_width = token, token_width
+        else:
+            # A word wider than the line is split wherever it runs out of room
+            for char in token:
+                char_width = widths.char(char)
+                if current_width + char_width > max_width and current:
+                    pieces.append(current)
+                    current, current_width = "", 0.0
+                current += char
+                current_width += char_width
+    if current or not pieces:
+        pieces.append(current)
+    return pieces
+
+def layout_lines(
+    lines: Iterable[str], max_width: float, widths: GlyphWidths
+) -> Iterator[str]:
+    """Yield the wrapped display lines of the input lines, one at a time."""
+    for line in lines:
+        line = line.rstrip("\r\n").expandtabs(TAB_SIZE)
+        yield from wrap_line(line, max_width, widths)
+
+def page_geometry(page_size: Tuple[float, float] = PAGE_SIZE) -> Tuple[float, float, int]:
+    """Text width, top baseline and lines per page for a page size."""
+    width, height = page_size
+    top = height - MARGIN
+    lines_per_page = max(1, int((top - MARGIN) // LEADING) + 1)
+    return width - 2 * MARGIN, top, lines_per_page
+
+@contextmanager
+def _binary_streams():
+    """Write compressed streams without ReportLab's default ASCII85 armour,
+    which is slow in pure Python and adds a quarter to the stream size."""
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        yield
+    finally:
+        rl_config.useA85 = use_a85
+
+def render_text(lines: Iterable[str], output_path: str) -> int:
+    """Lay out lines of text on as many pages as needed and return the page count.
+
+    Lines are consumed lazily, so an iterator over a large file is rendered
+    without reading it all into memory. Each page is drawn as a single text
+    object.
+    """
+    text_width, top, lines_per_page = page_geometry()
+    widths = GlyphWidths()
+    with _binary_streams():
+        pdf = canvas.Canvas(output_path, pagesize=PAGE_SIZE)
+        pages = 0
+
+        text = None
+        on_page = 0
+        for display_line in layout_lines(lines, text_width, widths):
+            if text is None:
+                text = pdf.beginText(MARGIN, top)
+                text.setFont(FONT_NAME, FONT_SIZE, LEADING)
+            text.textLine(display_line)
+            on_page += 1
+            if on_page == lines_per_page:
+                pdf.drawText(text)
+                pdf.showPage()
+                pages += 1
+                text, on_page = None, 0
+
+        if text is not None or pages == 0:
+            # The last partial page, or a blank page for empty input
+            if text is not None:
+                pdf.drawText(text)
+            pdf.showPage()
+            pages += 1
+        pdf.save()
+    return pages
@@ -0,0 +1,187 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Workspace configuration
+WORKSPACE_MAX_MB = float(os.getenv("WORKSPACE_MAX_MB", 2048))
+WORKSPACE_JOB_FACTOR = float(os.getenv("WORKSPACE_JOB_FACTOR", 3))
+WORKSPACE_MIN_JOB_MB = float(os.getenv("WORKSPACE_MIN_JOB_MB", 5))
+WORKSPACE_WAIT_TIMEOUT = float(os.getenv("WORKSPACE_WAIT_TIMEOUT", 60))
+WORKSPACE_FILE_TTL = float(os.getenv("WORKSPACE_FILE_TTL", 3600))
+WORKSPACE_SWEEP_INTERVAL = float(os.getenv("WORKSPACE_SWEEP_INTERVAL", 300))
+
+# Disk usage is re-measured at admission when the last measurement is older than this
+USAGE_MAX_AGE = 5.0
+
+class DiskBudgetExceededError(Exception):
+    """There is not enough room left in the disk budget for a job."""
+
+class JobWorkspace:
+    """Scratch directories of one job, one per working directory, all removed when the job ends."""
+
+    def __init__(self, roots: Iterable[str]) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.roots = list(roots)
+
+    def dir(self, root: str) -> str:
+        """This job's directory under root, created on first use."""
+        path = os.path.join(root, self.job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def path(self, root: str, name: str) -> str:
+        return os.path.join(self.dir(root), name)
+
+    def cleanup(self) -> None:
+        for root in self.roots:
+            shutil.rmtree(os.path.join(root, self.job_id), ignore_errors=True)
+
+class Workspace:
+    """Hands out per-job scratch directories within a disk budget and sweeps up leftovers.
+
+    A job reserves an estimate of the space it needs before it starts; jobs
+    that do not fit wait for running jobs to finish, and are rejected with
+    DiskBudgetExceededError after `wait_timeout` seconds. Files outside job
+    directories (such as /merge session files) count against the budget as
+    measured on disk; while they are still downloading, acquire() and
+    release() hold room for them.
+    """
+
+    def __init__(
+        self,
+        roots: Iterable[str],
+        max_bytes: float = WORKSPACE_MAX_MB * 1024 * 1024,
+        wait_timeout: float = WORKSPACE_WAIT_TIMEOUT,
+        file_ttl: float = WORKSPACE_FILE_TTL,
+    ) -> None:
+        self.roots = list(roots)
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self.file_ttl = file_ttl
+        self.reserved = 0
+        self.usage = 0
+        self._measured_at = 0.0
+        self._active: Set[str] = set()
+        self._releases: Set[asyncio.Task] = set()
+        self._condition = asyncio.Condition()
+
+    def estimate(self, input_size: Optional[int]) -> int:
+        """Space to reserve for a job on an input of input_size bytes."""
+        estimate = max(WORKSPACE_MIN_JOB_MB * 1024 * 1024, (input_size or 0) * WORKSPACE_JOB_FACTOR)
+        # A job bigger than the whole budget may still run on its own
+        return int(min(estimate, self.max_bytes))
+
+    def _measure(self) -> int:
+        """Bytes on disk under the roots, leaving out the directories of running jobs."""
+        total = 0
+        active = set(self._active)
+        for root in self.roots:
+            for directory, subdirs, files in os.walk(root):
+                if directory == root:
+                    subdirs[:] = [name for name in subdirs if name not in active]
+                for name in files:
+                    try:
+                        total += os.path.getsize(os.path.join(directory, name))
+                    except OSError:
+                        pass
+        return total
+
+    async def refresh_usage(self) -> None:
+        self.usage = await asyncio.to_thread(self._measure)
+        self._measured_at = time.monotonic()
+
+    def _fits(self, size: int) -> bool:
+        return self.usage + self.reserved + size <= self.max_bytes
+
+    async def acquire(self, size: int, on_wait: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        """Reserve size bytes of the budget, waiting for room; pair with release()."""
+        if time.monotonic() - self._measured_at > USAGE_MAX_AGE:
+            await self.refresh_usage()
+
+        async with self._condition:
+            if not self._fits(size):
+                if on_wait:
+                    await on_wait()
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._fits(size)), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    raise DiskBudgetExceededError(
+                        "The bot is running low on disk space. Please try again in a few minutes."
+                    ) from None
+            self.reserved += size
+
+    async def release(self, size: int) -> None:
+        """Give back a reservation; whatever it left on disk is measured from now on."""
+        async with self._condition:
+            self.reserved -= size
+            await self.refresh_usage()
+            self._condition.notify_all()
+
+    def release_soon(self, size: int) -> None:
+        """release() from outside a coroutine, such as a task's done callback."""
+        task = asyncio.get_running_loop().create_task(self.release(size))
+        self._releases.add(task)
+        task.add_done_callback(self._releases.discard)
+
+    @asynccontextmanager
+    async def job(
+        self, size: int, on_wait: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> AsyncIterator[JobWorkspace]:
+        """Reserve size bytes for a job and yield its scratch directories, removing them afterwards."""
+        await self.acquire(size, on_wait)
+        job = JobWorkspace(self.roots)
+        self._active.add(job.job_id)
+        try:
+            yield job
+        finally:
+            await asyncio.to_thread(job.cleanup)
+            self._active.discard(job.job_id)
+            await self.release(size)
+
+    def sweep(self, keep: Set[str] = frozenset()) -> int:
+        """Remove files and job directories older than file_ttl, except running jobs and paths in keep.
+
+        Returns the number of entries removed.
+        """
+        removed = 0
+        cutoff = time.time() - self.file_ttl
+        for root in self.roots:
+            if not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.name in self._active or os.path.abspath(entry.path) in keep:
+                    continue
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                    if entry.is_dir():
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    async def run_sweeper(
+        self, keep: Callable[[], Set[str]] = set, interval: float = WORKSPACE_SWEEP_INTERVAL
+    ) -> None:
+        """Periodically call sweep() until cancelled; keep returns the paths still in use."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await asyncio.to_thread(lambda: self.sweep(keep()))
+                if removed:
+                    logger.info(f"Workspace sweeper removed {removed} stale files")
+                async with self._condition:
+                    await self.refresh_usage()
+                    self._condition.notify_all()
+            except Exception as e:
+                logger.error(f"Workspace sweeper error: {e}")